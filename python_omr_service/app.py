@@ -9,13 +9,16 @@ Porta: 5002
 Autor: GabaritAI / X-TRI
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import (Flask, request, jsonify, send_file, Response, stream_with_context,
+                   g, has_request_context)
 from flask_cors import CORS
 import cv2
 import numpy as np
-from PIL import Image
 from pyzbar import pyzbar
 import io
+import json
+import hashlib
+import unicodedata
 import os
 import re
 import time
@@ -24,8 +27,26 @@ import csv
 import random
 import string
 import tempfile
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+import atexit
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Dict, Any, List, Tuple, Iterator, Iterable
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from marker_locator import find_square_markers
+from sheet_context import SheetContext
+from pdf_rasterizer import PDF_RENDER_DPI, PdfError, count_pdf_pages, iter_pdf_pages
+from result_writer import (OMR_WRITE_BEHIND, SAVE_FAILED, SAVE_SAVED,
+                           enqueue_result, get_save_status, start_writer)
+from student_cache import get_student, invalidate as invalidate_students, preferred_source, put_students
+from batch_jobs import (create_job, get_job, save_job, touch_job, expire_stale_job, request_cancel,
+                        is_cancel_requested)
+from omr_metrics import (HAS_PROMETHEUS, observe_stages, record_failure, record_omr, record_qr,
+                         render_metrics, request_finished, request_started)
 
 # Importar módulo QR (usa funções do qr_reader_module.py se disponível)
 try:
@@ -69,6 +90,48 @@ def get_supabase():
     return supabase_client
 
 
+# Colunas das duas tabelas de alunos (sheet_code incluso para o lookup em lote)
+STUDENTS_SELECT = 'id, sheet_code, name, matricula, turma, school_id, schools(name)'
+SHEET_STUDENTS_SELECT = ('id, sheet_code, student_name, enrollment_code, class_name, batch_id, '
+                         'answer_sheet_batches(exam_id, school_id, name)')
+
+# Tabelas de alunos, na ordem de busca
+STUDENT_TABLES = ('students', 'answer_sheet_students')
+
+# Máximo de sheet_codes por consulta in_() (limite prático do tamanho da URL)
+STUDENT_LOOKUP_CHUNK = 200
+
+
+def _student_from_students_row(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte uma linha de 'students' no formato de lookup_student_by_sheet_code."""
+    school = data.get('schools', {}) or {}
+    return {
+        'id': data['id'],
+        'student_name': data['name'],
+        'enrollment': data.get('matricula'),
+        'class_name': data.get('turma'),
+        'school_id': data.get('school_id'),
+        'school_name': school.get('name'),
+        'source': 'students'
+    }
+
+
+def _student_from_sheet_row(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte uma linha de 'answer_sheet_students' no formato de lookup_student_by_sheet_code."""
+    batch = data.get('answer_sheet_batches', {}) or {}
+    return {
+        'id': data['id'],
+        'student_name': data['student_name'],
+        'enrollment': data.get('enrollment_code'),
+        'class_name': data.get('class_name'),
+        'batch_id': data.get('batch_id'),
+        'exam_id': batch.get('exam_id'),
+        'school_id': batch.get('school_id'),
+        'batch_name': batch.get('name'),
+        'source': 'answer_sheet_students'
+    }
+
+
 def lookup_student_by_sheet_code(sheet_code: str) -> Optional[Dict[str, Any]]:
     """
     Busca dados do aluno pelo sheet_code no Supabase.
@@ -76,67 +139,139 @@ def lookup_student_by_sheet_code(sheet_code: str) -> Optional[Dict[str, Any]]:
     Ordem de busca:
     1. Tabela 'students' (alunos importados via CSV com sheet_code)
     2. Tabela 'answer_sheet_students' (sistema de batches com QR pré-cadastrado)
+
+    O resultado (inclusive "não encontrado") fica no student_cache; quando
+    a entrada expira, a tabela onde o código foi achado é consultada primeiro.
     """
+    hit, student = get_student(sheet_code)
+    if hit:
+        return student
+
     client = get_supabase()
     if not client:
         logger.warning("Supabase not configured, skipping student lookup")
         return None
 
-    try:
-        # 1. Buscar na tabela 'students' (novo fluxo - alunos com sheet_code)
-        response = client.table('students') \
-            .select('id, name, matricula, turma, school_id, schools(name)') \
-            .eq('sheet_code', sheet_code) \
-            .single() \
-            .execute()
+    student = _lookup_students(client, [sheet_code]).get(sheet_code)
+    if student:
+        logger.info(f"Student found in '{student['source']}' table: {student['student_name']}")
+    else:
+        logger.warning(f"No student found for sheet_code: {sheet_code}")
+    return student
 
-        if response.data:
-            data = response.data
-            school = data.get('schools', {}) or {}
-            logger.info(f"Student found in 'students' table: {data.get('name')}")
-            return {
-                'id': data['id'],
-                'student_name': data['name'],
-                'enrollment': data.get('matricula'),
-                'class_name': data.get('turma'),
-                'school_id': data.get('school_id'),
-                'school_name': school.get('name'),
-                'source': 'students'
-            }
-    except Exception as e:
-        # Não encontrou na tabela students, tentar answer_sheet_students
-        logger.debug(f"Not found in students table: {e}")
 
-    try:
-        # 2. Buscar na tabela 'answer_sheet_students' (fluxo legado de batches)
-        response = client.table('answer_sheet_students') \
-            .select('id, student_name, enrollment_code, class_name, batch_id, answer_sheet_batches(exam_id, school_id, name)') \
-            .eq('sheet_code', sheet_code) \
-            .single() \
-            .execute()
+def lookup_students_by_sheet_codes(sheet_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Busca em lote os alunos de vários sheet_codes.
 
-        if response.data:
-            data = response.data
-            batch = data.get('answer_sheet_batches', {}) or {}
-            logger.info(f"Student found in 'answer_sheet_students' table: {data.get('student_name')}")
-            return {
-                'id': data['id'],
-                'student_name': data['student_name'],
-                'enrollment': data.get('enrollment_code'),
-                'class_name': data.get('class_name'),
-                'batch_id': data.get('batch_id'),
-                'exam_id': batch.get('exam_id'),
-                'school_id': batch.get('school_id'),
-                'batch_name': batch.get('name'),
-                'source': 'answer_sheet_students'
-            }
-        else:
-            logger.warning(f"No student found for sheet_code: {sheet_code}")
-            return None
+    Mesma ordem de busca de lookup_student_by_sheet_code, mas com uma
+    consulta in_() por tabela (a segunda só para os códigos que faltaram),
+    em vez de até duas consultas por folha. Códigos em cache não são consultados.
 
-    except Exception as e:
-        logger.error(f"Supabase lookup error: {e}")
-        return None
+    Returns:
+        {sheet_code: aluno}; códigos não encontrados ficam de fora
+    """
+    codes = list(dict.fromkeys(code for code in sheet_codes if code))
+    found: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for code in codes:
+        hit, student = get_student(code)
+        if not hit:
+            missing.append(code)
+        elif student:
+            found[code] = student
+
+    client = get_supabase()
+    if missing and not client:
+        logger.warning("Supabase not configured, skipping student lookup")
+        return found
+
+    for start in range(0, len(missing), STUDENT_LOOKUP_CHUNK):
+        found.update(_lookup_students(client, missing[start:start + STUDENT_LOOKUP_CHUNK]))
+
+    logger.info(f"Bulk student lookup: {len(found)}/{len(codes)} sheet codes found "
+                f"({len(codes) - len(missing)} cached)")
+    return found
+
+
+def _query_students(client, table: str, sheet_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Consulta uma das tabelas de alunos. Erros do Supabase são propagados."""
+    if table == 'students':
+        select, convert = STUDENTS_SELECT, _student_from_students_row
+    else:
+        select, convert = SHEET_STUDENTS_SELECT, _student_from_sheet_row
+
+    query = client.table(table).select(select)
+    if len(sheet_codes) == 1:
+        query = query.eq('sheet_code', sheet_codes[0]).limit(1)
+    else:
+        query = query.in_('sheet_code', sheet_codes)
+
+    found = {}
+    for row in query.execute().data or []:
+        found.setdefault(row['sheet_code'], convert(row))
+    return found
+
+
+def _lookup_students(client, sheet_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Resolve os sheet_codes nas duas tabelas e grava o resultado no cache.
+
+    Códigos com origem conhecida vão direto para a tabela certa; os demais
+    seguem a ordem padrão. "Não encontrado" só entra no cache se nenhuma
+    consulta falhou.
+    """
+    found: Dict[str, Dict[str, Any]] = {}
+    tried = {table: set() for table in STUDENT_TABLES}
+    complete = True
+
+    def query(table, codes):
+        nonlocal complete
+        codes = [code for code in codes if code not in found and code not in tried[table]]
+        if not codes:
+            return
+        tried[table].update(codes)
+        try:
+            found.update(_query_students(client, table, codes))
+        except Exception as e:
+            complete = False
+            logger.error(f"Supabase lookup error ({table}): {e}")
+
+    # 1. Origem conhecida (memo do cache)
+    for table in STUDENT_TABLES:
+        query(table, [code for code in sheet_codes if preferred_source(code) == table])
+
+    # 2. Ordem padrão: 'students', depois 'answer_sheet_students'
+    for table in STUDENT_TABLES:
+        query(table, sheet_codes)
+
+    put_students({code: found.get(code) for code in sheet_codes if code in found or complete})
+    return found
+
+
+def prewarm_student_cache(batch_id: str) -> int:
+    """
+    Carrega no cache todos os alunos de um lote de gabaritos numa única
+    consulta, para que a leitura do lote não precise de lookups.
+
+    Returns:
+        Número de alunos carregados
+
+    Raises:
+        Exception: erro do Supabase
+    """
+    client = get_supabase()
+    if not client:
+        return 0
+
+    rows = client.table('answer_sheet_students') \
+        .select(SHEET_STUDENTS_SELECT) \
+        .eq('batch_id', batch_id) \
+        .execute().data or []
+
+    put_students({row['sheet_code']: _student_from_sheet_row(row) for row in rows})
+    logger.info(f"Student cache prewarmed for batch {batch_id}: {len(rows)} students")
+    return len(rows)
 
 
 def save_omr_result(sheet_code: str, answers: list, stats: dict) -> bool:
@@ -171,6 +306,96 @@ def save_omr_result(sheet_code: str, answers: list, stats: dict) -> bool:
         return False
 
 
+def save_omr_results_bulk(rows: Dict[str, Dict[str, Any]]) -> Dict[str, bool]:
+    """
+    Grava vários resultados do OMR em 'answer_sheet_students' (write-behind).
+
+    Duas consultas por lote, independente do tamanho: um select in_() para
+    saber quais sheet_codes existem (e preencher as colunas obrigatórias) e
+    um upsert em lote por sheet_code. Códigos inexistentes não são inseridos.
+
+    Args:
+        rows: {sheet_code: colunas do resultado (ver _omr_result_row)}
+
+    Returns:
+        {sheet_code: True se gravado, False se o sheet_code não existe}
+
+    Raises:
+        Exception: erro do Supabase (o result_writer tenta de novo)
+    """
+    client = get_supabase()
+    if not client:
+        raise RuntimeError("Supabase not configured")
+
+    existing = client.table('answer_sheet_students') \
+        .select('id, batch_id, student_name, sheet_code') \
+        .in_('sheet_code', list(rows)) \
+        .execute().data or []
+
+    payload = [{**row, **rows[row['sheet_code']]} for row in existing]
+    if payload:
+        client.table('answer_sheet_students') \
+            .upsert(payload, on_conflict='sheet_code') \
+            .execute()
+
+    found = {row['sheet_code'] for row in existing}
+    _invalidate_changed_students(existing, [code for code in rows if code not in found])
+    return {sheet_code: sheet_code in found for sheet_code in rows}
+
+
+def _invalidate_changed_students(existing: List[Dict[str, Any]], missing: List[str]):
+    """
+    Descarta do student_cache os códigos que a gravação mostrou desatualizados:
+    os que não existem mais em 'answer_sheet_students' e os que mudaram de
+    nome ou de lote.
+    """
+    stale = list(missing)
+    for row in existing:
+        hit, student = get_student(row['sheet_code'])
+        if hit and student and student.get('source') == 'answer_sheet_students' and (
+                student.get('student_name') != row['student_name']
+                or student.get('batch_id') != row['batch_id']):
+            stale.append(row['sheet_code'])
+    invalidate_students(stale)
+
+
+def _omr_result_row(answers: list, stats: dict) -> Dict[str, Any]:
+    """Colunas de resultado de 'answer_sheet_students' para uma folha lida."""
+    return {
+        'answers': answers,
+        'answered_count': stats['answered'],
+        'blank_count': stats['blank'],
+        'double_marked_count': stats['double_marked'],
+        # Momento da leitura (a gravação pode acontecer depois)
+        'processed_at': datetime.now(timezone.utc).isoformat()
+    }
+
+
+def store_omr_result(sheet_code: str, answers: list, stats: dict) -> Dict[str, Any]:
+    """
+    Grava o resultado do OMR sem bloquear a requisição.
+
+    Com OMR_WRITE_BEHIND (padrão) o resultado vai para o buffer do
+    result_writer e é gravado em lote; o status pode ser consultado em
+    /api/save-status. Sem write-behind, grava na hora (save_omr_result).
+
+    Returns:
+        {'saved': True | False | None (pendente), 'save_status': str}
+    """
+    if OMR_WRITE_BEHIND and get_supabase():
+        start_writer(save_omr_results_bulk)
+        return {
+            "saved": None,
+            "save_status": enqueue_result(sheet_code, _omr_result_row(answers, stats))
+        }
+
+    saved = save_omr_result(sheet_code, answers, stats)
+    return {
+        "saved": saved,
+        "save_status": SAVE_SAVED if saved else SAVE_FAILED
+    }
+
+
 def generate_sheet_code() -> str:
     """
     Gera código único no formato XTRI-XXXXXX.
@@ -240,6 +465,9 @@ def create_students_batch(batch_id: str, students: List[Dict]) -> List[Dict]:
 
         if response.data:
             logger.info(f"Created {len(response.data)} students for batch {batch_id}")
+            # Um código lido antes do cadastro pode estar em cache como "não encontrado"
+            invalidate_students(row['sheet_code'] for row in response.data)
+            _invalidate_batch_pdf(batch_id)
             return response.data
         return []
 
@@ -248,9 +476,69 @@ def create_students_batch(batch_id: str, students: List[Dict]) -> List[Dict]:
         return []
 
 
-def get_batch_status(batch_id: str) -> Optional[Dict[str, Any]]:
+def _invalidate_batch_pdf(batch_id: str):
+    """Descarta o PDF do lote em cache (os alunos mudaram)."""
+    try:
+        from pdf_cache import invalidate_batch
+    except ImportError:
+        return
+    invalidate_batch(batch_id)
+
+
+def get_batch(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Retorna apenas a linha do lote (answer_sheet_batches), sem alunos."""
+    client = get_supabase()
+    if not client:
+        return None
+
+    try:
+        response = client.table('answer_sheet_batches') \
+            .select('*') \
+            .eq('id', batch_id) \
+            .limit(1) \
+            .execute()
+        return response.data[0] if response.data else None
+
+    except Exception as e:
+        logger.error(f"Supabase get batch error: {e}")
+        return None
+
+
+# Respostas de status já montadas: (batch_id, filtro, limit, offset) -> (versão, resposta)
+BATCH_STATUS_CACHE_MAX = 256
+_batch_status_cache: 'OrderedDict[tuple, Tuple[str, Dict[str, Any]]]' = OrderedDict()
+_batch_status_lock = threading.Lock()
+
+BATCH_STATUS_FILTERS = ('all', 'pending', 'processed')
+
+
+def _batch_students_query(client, batch_id: str, columns: str, status_filter: str = 'all', **kwargs):
+    """Query de answer_sheet_students do lote, com filtro pending/processed."""
+    query = client.table('answer_sheet_students') \
+        .select(columns, **kwargs) \
+        .eq('batch_id', batch_id)
+    if status_filter == 'pending':
+        query = query.is_('processed_at', 'null')
+    elif status_filter == 'processed':
+        query = query.not_.is_('processed_at', 'null')
+    return query
+
+
+def get_batch_status(batch_id: str, status_filter: str = 'all', limit: Optional[int] = None,
+                     offset: int = 0) -> Optional[Dict[str, Any]]:
     """
     Retorna status do lote com contagens.
+
+    As contagens vêm de consultas count (head, sem baixar linhas). A lista
+    de alunos é paginada/filtrada e só é buscada quando a versão do lote
+    (contagens + último updated_at) mudou desde a última resposta montada.
+
+    Args:
+        status_filter: 'all', 'pending' ou 'processed'
+        limit, offset: Paginação da lista de alunos (limit=None = todos)
+
+    Returns:
+        Dict com batch, contagens, students e version (usada como ETag)
     """
     client = get_supabase()
     if not client:
@@ -261,30 +549,66 @@ def get_batch_status(batch_id: str) -> Optional[Dict[str, Any]]:
         batch_resp = client.table('answer_sheet_batches') \
             .select('*') \
             .eq('id', batch_id) \
-            .single() \
+            .limit(1) \
             .execute()
 
         if not batch_resp.data:
             return None
-
-        # Buscar alunos do batch
-        students_resp = client.table('answer_sheet_students') \
-            .select('id, sheet_code, student_name, processed_at') \
-            .eq('batch_id', batch_id) \
+        batch = batch_resp.data[0]
+
+        # Contagens no banco
+        total = _batch_students_query(client, batch_id, 'id', count='exact', head=True) \
+            .execute().count or 0
+        processed = _batch_students_query(client, batch_id, 'id', 'processed', count='exact', head=True) \
+            .execute().count or 0
+
+        # Última alteração de qualquer aluno do lote (trigger de updated_at)
+        last_resp = _batch_students_query(client, batch_id, 'updated_at') \
+            .order('updated_at', desc=True) \
+            .limit(1) \
             .execute()
-
-        students = students_resp.data or []
-        total = len(students)
-        processed = sum(1 for s in students if s.get('processed_at'))
-
-        return {
-            'batch': batch_resp.data,
+        last_update = last_resp.data[0]['updated_at'] if last_resp.data else None
+
+        key = (batch_id, status_filter, limit, offset)
+        version = hashlib.sha1(json.dumps(
+            [batch.get('updated_at'), total, processed, last_update, *key[1:]], default=str
+        ).encode()).hexdigest()[:16]
+
+        with _batch_status_lock:
+            cached = _batch_status_cache.get(key)
+            if cached and cached[0] == version:
+                _batch_status_cache.move_to_end(key)
+                return cached[1]
+
+        # Buscar alunos do batch (página)
+        students_query = _batch_students_query(
+            client, batch_id, 'id, sheet_code, student_name, processed_at', status_filter
+        ).order('student_name').order('id')
+        if limit is not None:
+            students_query = students_query.range(offset, offset + limit - 1)
+        students = students_query.execute().data or []
+
+        result = {
+            'batch': batch,
             'total_students': total,
             'processed_count': processed,
             'pending_count': total - processed,
-            'students': students
+            'filter': status_filter,
+            'students_total': {'all': total, 'pending': total - processed, 'processed': processed}[status_filter],
+            'offset': offset,
+            'limit': limit,
+            'students': students,
+            'version': version
         }
 
+        with _batch_status_lock:
+            _batch_status_cache[key] = (version, result)
+            _batch_status_cache.move_to_end(key)
+            while len(_batch_status_cache) > BATCH_STATUS_CACHE_MAX:
+                _batch_status_cache.popitem(last=False)
+
+        return result
+
     except Exception as e:
         logger.error(f"Supabase batch status error: {e}")
         return None
@@ -356,14 +680,24 @@ RELATIVE_DIFF = 5.0          # Diferença minima entre 1a e 2a para ser marcaç
 DOUBLE_MARK_DIFF = 5.0       # Se diff < 5% entre 1a e 2a (ambas altas), dupla marcação
 DARK_PIXEL_THRESHOLD = 170   # Valor de pixel para considerar escuro (aumentado para cinzas)
 
+# Passo (px) da busca vertical de analyze_bubble_with_search.
+# Com a imagem integral cada janela é O(1), então a busca pode ser densa (era 5).
+SEARCH_STEP = 1
+
 
 # ============================================================
 # FUNCOES DE PROCESSAMENTO
 # ============================================================
 
 def find_corner_markers(gray):
-    """Encontra os 4 quadrados pretos de alinhamento do template X-TRI."""
-    h, w = gray.shape
+    """Encontra os 4 quadrados pretos de alinhamento do template X-TRI.
+    Aceita imagem grayscale ou SheetContext (resultado memorizado no contexto)."""
+    ctx = SheetContext.of(gray)
+    return ctx.memo('corner_markers', lambda: _find_corner_markers(ctx))
+
+
+def _find_corner_markers(ctx):
+    h, w = ctx.shape
 
     # Calcular fator de escala baseado na resolução da imagem
     # Referência: 1240x1753 (150 DPI), onde marcadores são ~31x31 = ~961 área
@@ -377,35 +711,9 @@ def find_corner_markers(gray):
 
     logger.debug(f"Marker detection: image {w}x{h}, scale_factor={scale_factor:.2f}, area range={min_area}-{max_area}")
 
-    # Binarizar para encontrar quadrados pretos
-    _, binary = cv2.threshold(gray, 120, 255, cv2.THRESH_BINARY_INV)
-
-    # Encontrar contornos
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    # Filtrar quadrados (marcadores escalados com a resolução)
-    squares = []
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if area < min_area or area > max_area:
-            continue
-
-        x, y, cw, ch = cv2.boundingRect(cnt)
-        aspect = cw / ch if ch > 0 else 0
-
-        # Quadrado tem aspect ratio ~1
-        if 0.7 < aspect < 1.4:
-            peri = cv2.arcLength(cnt, True)
-            approx = cv2.approxPolyDP(cnt, 0.04 * peri, True)
-
-            if len(approx) >= 4:
-                center_x = x + cw // 2
-                center_y = y + ch // 2
-                squares.append({
-                    'center': (center_x, center_y),
-                    'area': area,
-                    'bbox': (x, y, cw, ch)
-                })
+    # Encontrar quadrados pretos em pirâmide (candidatos na imagem reduzida,
+    # centro refinado em janela de resolução cheia)
+    squares = find_square_markers(ctx, 120, min_area, max_area, (0.7, 1.4), min_vertices=4)
 
     if len(squares) < 4:
         logger.warning(f"Apenas {len(squares)} marcadores encontrados (esperado 4)")
@@ -457,16 +765,13 @@ def find_corner_markers(gray):
 
 
 def align_to_markers(img):
-    """Corrige perspectiva usando os 4 marcadores de canto do template X-TRI."""
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
-
-    h, w = gray.shape
+    """Corrige perspectiva usando os 4 marcadores de canto do template X-TRI.
+    Aceita imagem (BGR ou grayscale) ou SheetContext."""
+    ctx = SheetContext.of(img)
+    img = ctx.image
 
     # Encontrar marcadores
-    markers = find_corner_markers(gray)
+    markers = find_corner_markers(ctx)
 
     if markers is None:
         logger.warning("Marcadores não encontrados, usando imagem original")
@@ -506,18 +811,19 @@ def align_to_markers(img):
 
 def deskew_image(img):
     """Tenta alinhar por marcadores, senão usa método de linhas.
+    Aceita imagem (BGR ou grayscale) ou SheetContext.
     Retorna (imagem, aligned) onde aligned=True se foi alinhada por marcadores."""
+    ctx = SheetContext.of(img)
+    img = ctx.image
+
     # Primeiro, tentar alinhar usando os 4 marcadores
-    result = align_to_markers(img)
+    result = align_to_markers(ctx)
 
     if isinstance(result, tuple):
         return result[0], True  # Imagem alinhada por marcadores
 
     # Fallback: usar detecção de linhas para rotação simples
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
+    gray = ctx.gray
 
     edges = cv2.Canny(gray, 50, 150, apertureSize=3)
     lines = cv2.HoughLinesP(edges, 1, np.pi/180, threshold=100,
@@ -594,42 +900,49 @@ def analyze_bubble(gray, x, y, scale_x, scale_y):
     return darkness
 
 
-def analyze_bubble_with_search(gray, x, y, scale_x, scale_y):
-    """Analisa uma bolha com busca local para compensar desalinhamentos."""
-    h, w = gray.shape
-    r = int(BUBBLE_RADIUS * scale_x * 1.3)
-    search_range = int(15 * scale_y)  # Buscar +/- 15 pixels na vertical
+def dark_pixel_integral(gray):
+    """
+    Imagem integral da máscara de pixels escuros (< DARK_PIXEL_THRESHOLD).
 
-    best_darkness = 0.0
+    Calculada uma vez por folha: a contagem de pixels escuros de qualquer
+    janela retangular passa a custar 4 acessos, independente do tamanho.
+    """
+    dark = (gray < DARK_PIXEL_THRESHOLD).astype(np.uint8)
+    return cv2.integral(dark)
 
-    # Buscar na posição original e posições próximas
-    for dy in range(-search_range, search_range + 1, 5):
-        test_y = y + dy
-        if test_y - r < 0 or test_y + r >= h:
-            continue
 
-        x1 = max(0, x - r)
-        x2 = min(w, x + r)
-        y1 = max(0, test_y - r)
-        y2 = min(h, test_y + r)
+def analyze_bubble_with_search(integral, x, y, scale_x, scale_y):
+    """Analisa uma bolha com busca local para compensar desalinhamentos."""
+    h, w = integral.shape[0] - 1, integral.shape[1] - 1
+    r = int(BUBBLE_RADIUS * scale_x * 1.3)
+    search_range = int(15 * scale_y)  # Buscar +/- 15 pixels na vertical
 
-        roi = gray[y1:y2, x1:x2]
-        if roi.size == 0:
-            continue
+    x1 = max(0, x - r)
+    x2 = min(w, x + r)
+    if x2 <= x1:
+        return 0.0
 
-        dark_pixels = np.sum(roi < DARK_PIXEL_THRESHOLD)
-        darkness = (dark_pixels / roi.size) * 100.0
+    # Todas as posições verticais da busca de uma vez
+    test_y = y + np.arange(-search_range, search_range + 1, SEARCH_STEP)
+    test_y = test_y[(test_y - r >= 0) & (test_y + r < h)]
+    if test_y.size == 0:
+        return 0.0
 
-        if darkness > best_darkness:
-            best_darkness = darkness
+    y1 = test_y - r
+    y2 = test_y + r
+    dark_pixels = (integral[y2, x2] - integral[y1, x2]
+                   - integral[y2, x1] + integral[y1, x1])
+    darkness = dark_pixels / ((y2 - y1) * (x2 - x1)) * 100.0
 
-    return best_darkness
+    return max(0.0, float(darkness.max()))
 
 
-def read_question(gray, q_num, col_x, row_y, scale_x, scale_y, aligned=False):
+def read_question(integral, q_num, col_x, row_y, scale_x, scale_y, aligned=False):
     """
     Lê uma questão e retorna a resposta.
 
+    `integral` é a imagem integral de pixels escuros da folha (dark_pixel_integral).
+
     Lógica simplificada em 4 passos hierárquicos:
     1. Blank: nenhuma bolha significativamente escura
     2. Clear mark: melhor bolha escura E significativamente mais escura que a segunda
@@ -649,7 +962,7 @@ def read_question(gray, q_num, col_x, row_y, scale_x, scale_y, aligned=False):
             x = int((MARKER_TL[0] + col_x + opt_idx * OPTION_SPACING) * scale_x)
             y = int((MARKER_TL[1] + row_y) * scale_y)
 
-        darkness = analyze_bubble_with_search(gray, x, y, scale_x, scale_y)
+        darkness = analyze_bubble_with_search(integral, x, y, scale_x, scale_y)
         options.append({
             'label': chr(65 + opt_idx),
             'darkness': darkness
@@ -701,13 +1014,20 @@ def process_omr(img):
 
     Suporta DIA 1 (questões 1-90) e DIA 2 (questões 91-180).
     O dia é detectado automaticamente pelo QR Code.
+
+    `img` pode ser um array (BGR ou grayscale) ou o SheetContext da
+    requisição; os dois leitores compartilham o mesmo contexto.
+
+    O resultado inclui 'stages': duração (ms) de cada estágio registrado no
+    contexto (decode, gray, qr, markers, bubbles, sampling, decision, fallback).
     """
     start_time = time.time()
+    ctx = SheetContext.of(img)
 
     # Tentar novo leitor Hough primeiro (mais preciso)
     if USE_HOUGH_OMR:
         try:
-            result = hough_process_omr(img)
+            result = hough_process_omr(ctx)
             elapsed = time.time() - start_time
 
             if result['success']:
@@ -722,7 +1042,8 @@ def process_omr(img):
                     answers_list.append(ans)
 
                 day = 1 if start_question == 1 else 2
-                logger.info(f"Hough OMR (DIA {day}): {result['stats']['answered']}/90 respondidas ({elapsed*1000:.1f}ms)")
+                logger.info(f"Hough OMR (DIA {day}, bolhas via {result.get('detection')}): "
+                            f"{result['stats']['answered']}/90 respondidas ({elapsed*1000:.1f}ms)")
 
                 return {
                     'answers': answers_list,
@@ -732,7 +1053,9 @@ def process_omr(img):
                     'blank': result['stats']['blank'],
                     'double_marked': result['stats']['double_marked'],
                     'elapsed_ms': round(elapsed * 1000, 2),
-                    'method': 'hough'
+                    'method': 'hough',
+                    'detection': result.get('detection'),  # 'template' ou 'hough'
+                    'stages': dict(ctx.timings)
                 }
             else:
                 logger.warning(f"Hough OMR falhou: {result.get('error')}, usando método legado")
@@ -741,22 +1064,19 @@ def process_omr(img):
 
     # Fallback: método legado (baseado em coordenadas)
     # Nota: método legado sempre retorna questões 1-90 (não suporta DIA 2)
-    return process_omr_legacy(img, start_time)
-
-
-def process_omr_legacy(img, start_time=None):
-    """Processa uma imagem usando o método legado (coordenadas fixas)."""
-    if start_time is None:
-        start_time = time.time()
+    with ctx.stage('fallback'):
+        result = process_omr_legacy(ctx, start_time)
+    result['stages'] = dict(ctx.timings)
+    return result
 
-    # 1. Corrigir rotação/inclinação (deskew)
-    img, aligned = deskew_image(img)
 
+def read_legacy_answers(img, aligned: bool) -> List[Optional[str]]:
+    """Lê as 90 questões da imagem já corrigida por deskew_image (coordenadas fixas)."""
     # 2. Converter para grayscale
     if len(img.shape) == 3:
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     else:
-        gray = img.copy()
+        gray = img
 
     h, w = gray.shape
 
@@ -772,8 +1092,9 @@ def process_omr_legacy(img, start_time=None):
         scale_y = h / REF_HEIGHT_FULL  # 1753
         logger.info(f"Imagem não alinhada: {w}x{h}, escala: {scale_x:.3f}x{scale_y:.3f}")
 
-    # 3. Pre-processar (CLAHE + gamma)
+    # 3. Pre-processar (CLAHE + gamma) e montar a integral de pixels escuros
     processed = preprocess_image(gray)
+    integral = dark_pixel_integral(processed)
 
     # Ler todas as questoes
     answers = []
@@ -791,9 +1112,23 @@ def process_omr_legacy(img, start_time=None):
     for col_idx, col_x in enumerate(COLUMNS_X):
         for row_idx, row_y in enumerate(Y_POSITIONS):
             q_num = col_idx * 15 + row_idx + 1
-            answer = read_question(processed, q_num, col_x, row_y, scale_x, scale_y, aligned)
+            answer = read_question(integral, q_num, col_x, row_y, scale_x, scale_y, aligned)
             answers.append(answer)
 
+    return answers
+
+
+def process_omr_legacy(img, start_time=None):
+    """Processa uma imagem (array ou SheetContext) usando o método legado (coordenadas fixas)."""
+    if start_time is None:
+        start_time = time.time()
+
+    # 1. Corrigir rotação/inclinação (deskew)
+    img, aligned = deskew_image(img)
+
+    # 2-3. Grayscale, pré-processamento e leitura das 90 questões
+    answers = read_legacy_answers(img, aligned)
+
     # Estatisticas
     answered = sum(1 for a in answers if a and a != 'X')
     blank = sum(1 for a in answers if a is None)
@@ -824,58 +1159,16 @@ def read_qr_code(img):
     Lê QR Code da imagem ANTES de qualquer transformação.
     Retorna tuple (sheet_code, start_question) ou (None, 1) se não encontrar.
 
+    Aceita imagem (BGR ou grayscale) ou SheetContext; no contexto o texto
+    decodificado é memorizado e compartilhado com o leitor Hough.
+
     O QR pode ter formato:
     - XTRI-XXXXXX (antigo, assume DIA 1)
     - XTRI-XXXXXX-D1 (DIA 1, questões 1-90)
     - XTRI-XXXXXX-D2 (DIA 2, questões 91-180)
     """
-    # Tentar na imagem original primeiro
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
-
-    qr_data = None
-
-    # Decodificar QR codes
-    decoded_objects = pyzbar.decode(gray)
-
-    for obj in decoded_objects:
-        if obj.type == 'QRCODE':
-            try:
-                qr_data = obj.data.decode('utf-8')
-                break
-            except:
-                continue
-
-    # Se não encontrou, tentar com diferentes pré-processamentos
-    if qr_data is None:
-        # 1. Aumentar contraste
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
-        decoded_objects = pyzbar.decode(enhanced)
-
-        for obj in decoded_objects:
-            if obj.type == 'QRCODE':
-                try:
-                    qr_data = obj.data.decode('utf-8')
-                    break
-                except:
-                    continue
-
-    if qr_data is None:
-        # 2. Binarização adaptativa
-        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                        cv2.THRESH_BINARY, 11, 2)
-        decoded_objects = pyzbar.decode(binary)
-
-        for obj in decoded_objects:
-            if obj.type == 'QRCODE':
-                try:
-                    qr_data = obj.data.decode('utf-8')
-                    break
-                except:
-                    continue
+    ctx = SheetContext.of(img)
+    qr_data = ctx.memo('qr_text', lambda: _decode_qr_text(ctx))
 
     if qr_data is None:
         return None, 1
@@ -892,6 +1185,26 @@ def read_qr_code(img):
         return qr_data, 1
 
 
+def _decode_qr_text(ctx):
+    """Decodifica o QR: imagem original, depois CLAHE, depois binarização adaptativa."""
+    # Tentar na imagem original primeiro; se não encontrar, tentar com
+    # diferentes pré-processamentos (1. contraste, 2. binarização adaptativa)
+    for image in (ctx.gray, ctx.clahe, ctx.adaptive_binary):
+        for obj in pyzbar.decode(image):
+            if obj.type == 'QRCODE':
+                try:
+                    return obj.data.decode('utf-8')
+                except:
+                    continue
+
+    return None
+
+
+def _is_truthy(value) -> bool:
+    """Interpreta flags de form/query ("1", "true", "yes", "on")."""
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 def validate_sheet_code(code):
     """
     Valida se o código está no formato esperado: XTRI-XXXXXX
@@ -903,60 +1216,563 @@ def validate_sheet_code(code):
 
 
 # ============================================================
-# ENDPOINTS DA API
+# PROCESSAMENTO EM LOTE (POOL DE PROCESSOS)
 # ============================================================
 
-@app.route('/health', methods=['GET'])
-def health():
-    """Health check."""
-    return jsonify({
-        "status": "ok",
-        "service": "omr-service",
-        "version": "1.0",
-        "questions": 90
-    })
+# Processos para as etapas de CPU do lote (decode, QR, OMR).
+# O pool é criado sob demanda e reaproveitado entre requisições.
+# 1 (ou 0) = processar no próprio thread da requisição.
+# Cada worker do gunicorn tem o seu pool: o padrão divide os núcleos entre
+# os WEB_CONCURRENCY workers, com no mínimo 2 processos em máquina com mais
+# de um núcleo, para que um lote sempre se espalhe pelos núcleos. O excesso
+# é limitado: cada processo usa um único thread OpenCV (_init_omr_worker).
+WEB_CONCURRENCY = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+_CPU_COUNT = os.cpu_count() or 1
+OMR_POOL_WORKERS = int(os.getenv(
+    'OMR_POOL_WORKERS',
+    max(2 if _CPU_COUNT > 1 else 1, _CPU_COUNT // WEB_CONCURRENCY)
+))
+
+_omr_pool = None
+_omr_pool_lock = threading.Lock()
+
+
+def get_omr_pool() -> Optional[ProcessPoolExecutor]:
+    """Retorna o pool de processos do OMR (lazy), ou None se desabilitado."""
+    global _omr_pool
+    if OMR_POOL_WORKERS <= 1:
+        return None
 
+    with _omr_pool_lock:
+        if _omr_pool is None:
+            # 'spawn': fork de um worker gunicorn com threads pode herdar locks travados
+            _omr_pool = ProcessPoolExecutor(
+                max_workers=OMR_POOL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_omr_worker
+            )
+            logger.info(f"OMR process pool started: {OMR_POOL_WORKERS} workers")
+        return _omr_pool
 
-@app.route('/api/process-image', methods=['POST'])
-def process_image():
-    """Processa uma imagem de gabarito."""
-    try:
-        # Verificar se tem arquivo
-        if 'image' not in request.files:
-            logger.error("Campo 'image' nao encontrado nos arquivos")
-            return jsonify({"status": "erro", "mensagem": "Arquivo 'image' nao fornecido"}), 400
 
-        img_file = request.files['image']
-        img_bytes = img_file.read()
+def _init_omr_worker():
+    """Um thread OpenCV por processo: o paralelismo vem do pool."""
+    cv2.setNumThreads(1)
 
-        if len(img_bytes) == 0:
-            logger.error("Arquivo vazio recebido")
-            return jsonify({"status": "erro", "mensagem": "Arquivo vazio"}), 400
 
-        # Abrir imagem
-        pil_img = Image.open(io.BytesIO(img_bytes))
+def _reset_omr_pool(pool):
+    """Descarta um pool quebrado (worker morto) para ser recriado na próxima chamada."""
+    global _omr_pool
+    with _omr_pool_lock:
+        if _omr_pool is pool:
+            _omr_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
 
-        if pil_img.mode != 'RGB':
-            pil_img = pil_img.convert('RGB')
 
-        # Converter para OpenCV (BGR)
-        img_array = np.array(pil_img)[:, :, ::-1].copy()
+@atexit.register
+def _shutdown_omr_pool():
+    if _omr_pool is not None:
+        _omr_pool.shutdown(wait=False, cancel_futures=True)
 
-        # Processar OMR
-        result = process_omr(img_array)
 
-        # Numero da pagina
-        page_num = int(request.form.get('page', 1))
+def process_sheet_bytes(img_bytes: bytes) -> Dict[str, Any]:
+    """
+    Etapas de CPU de uma folha do lote: decode, QR e OMR.
 
-        logger.info(f"Pagina {page_num}: {result['answered']}/90 respondidas | {result['blank']} branco | {result['double_marked']} dupla | {result['elapsed_ms']}ms")
+    Executada nos processos do pool, então recebe e retorna apenas dados
+    serializáveis. Lookup e gravação no Supabase ficam no processo da requisição.
 
-        # Formatar resposta
-        questoes = []
-        for i, ans in enumerate(result['answers'], 1):
-            if ans is None:
-                questoes.append({'numero': i, 'resposta': ''})
-            elif ans == 'X':
-                questoes.append({'numero': i, 'resposta': 'X', 'invalida': True, 'motivo': 'Dupla marcacao'})
+    Returns:
+        {'status': 'sucesso', 'sheet_code', 'omr'} ou {'status': 'erro', 'code'}
+    """
+    ctx = SheetContext.from_bytes(img_bytes)
+    if ctx is None:
+        return {"status": "erro", "code": "INVALID_IMAGE"}
+
+    return _process_sheet(ctx)
+
+
+def process_sheet_page(gray: np.ndarray) -> Dict[str, Any]:
+    """Como process_sheet_bytes, para uma página de PDF já rasterizada (grayscale)."""
+    return _process_sheet(SheetContext(gray))
+
+
+def _process_sheet(ctx: SheetContext) -> Dict[str, Any]:
+    # Ler QR Code
+    with ctx.stage('qr'):
+        if USE_QR_MODULE:
+            qr_result = read_qr_with_fallback(ctx)
+            sheet_code = qr_result['sheet_code'] if qr_result['success'] else None
+            qr_method = qr_result.get('method')
+        else:
+            sheet_code, _ = read_qr_code(ctx)
+            qr_method = 'internal' if sheet_code else None
+
+    if not sheet_code:
+        return {"status": "erro", "code": "QR_NOT_FOUND", "stages": dict(ctx.timings)}
+
+    # Processar OMR
+    return {
+        "status": "sucesso",
+        "sheet_code": sheet_code,
+        "qr_method": qr_method,
+        "omr": process_omr(ctx)
+    }
+
+
+def _iter_pool(fn, inputs: Iterable, window: Optional[int] = None,
+               idle: Any = None) -> Iterator[Dict[str, Any]]:
+    """
+    Executa fn(x) para cada entrada no pool de processos.
+
+    Gera os resultados na ordem de submissão, à medida que ficam prontos.
+    As entradas são consumidas sob demanda, com no máximo `window` em
+    andamento (None = todas de uma vez). Uma falha (exceção ou worker
+    morto) afeta apenas a própria entrada: vira {'status': 'erro', 'code':
+    'PROCESSING_ERROR'}. Se o consumidor parar antes do fim (cancelamento),
+    as entradas ainda na fila são canceladas.
+
+    Com `idle`, esse valor é gerado antes de esperar por um resultado que
+    ainda não está pronto, para o consumidor aproveitar a espera.
+    """
+    pool = get_omr_pool()
+    pending = deque()  # Future, ou o resultado já pronto (sem pool)
+
+    def run_inline(value):
+        try:
+            return fn(value)
+        except Exception as e:
+            return {"status": "erro", "code": "PROCESSING_ERROR", "message": str(e)}
+
+    def waiting():
+        entry = pending[0]
+        return idle is not None and isinstance(entry, Future) and not entry.done()
+
+    def collect(entry):
+        if not isinstance(entry, Future):
+            return entry
+        try:
+            return entry.result()
+        except BrokenProcessPool as e:
+            if pool is not None:
+                _reset_omr_pool(pool)
+            return {"status": "erro", "code": "PROCESSING_ERROR", "message": str(e)}
+        except Exception as e:
+            return {"status": "erro", "code": "PROCESSING_ERROR", "message": str(e)}
+
+    try:
+        for value in inputs:
+            if pool is not None:
+                try:
+                    pending.append(pool.submit(fn, value))
+                except BrokenProcessPool:
+                    _reset_omr_pool(pool)
+                    pool = None
+            if pool is None:
+                pending.append(run_inline(value))
+
+            while window and len(pending) >= window:
+                if waiting():
+                    yield idle
+                yield collect(pending.popleft())
+
+        while pending:
+            if waiting():
+                yield idle
+            yield collect(pending.popleft())
+    finally:
+        for entry in pending:
+            if isinstance(entry, Future):
+                entry.cancel()
+
+
+def iter_process_sheets(images: List[bytes], idle: Any = None) -> Iterator[Dict[str, Any]]:
+    """Executa process_sheet_bytes para cada imagem no pool (ver _iter_pool)."""
+    return _iter_pool(process_sheet_bytes, images, idle=idle)
+
+
+def process_sheets_parallel(images: List[bytes]) -> List[Dict[str, Any]]:
+    """Versão em lista de iter_process_sheets (ordem de submissão)."""
+    return list(iter_process_sheets(images))
+
+
+# Máximo de folhas por lookup em lote nos modos incrementais (streaming,
+# job, PDF). O grupo é resolvido antes disso sempre que o pool ainda não
+# tem a próxima folha pronta; o modo síncrono resolve o lote inteiro de uma vez.
+STUDENT_LOOKUP_GROUP = int(os.getenv('STUDENT_LOOKUP_GROUP', 20))
+
+# Gerado por _iter_pool quando a próxima folha ainda não está pronta
+_POOL_IDLE = object()
+
+
+def _finish_batch_item(idx: int, filename: str, item: Dict[str, Any],
+                       students: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Completa o resultado de uma folha do lote: aluno (do índice pré-carregado) e gravação."""
+    _record_sheet_metrics(item)
+
+    if item['status'] != 'sucesso':
+        return {
+            "index": idx,
+            "filename": filename,
+            **item
+        }
+
+    sheet_code = item['sheet_code']
+    omr_result = item['omr']
+
+    # Aluno já resolvido pelo lookup em lote
+    student = students.get(sheet_code)
+
+    # Salvar resultado
+    stats = {
+        "answered": omr_result['answered'],
+        "blank": omr_result['blank'],
+        "double_marked": omr_result['double_marked']
+    }
+    save = store_omr_result(sheet_code, omr_result['answers'], stats)
+
+    return {
+        "index": idx,
+        "filename": filename,
+        "status": "sucesso",
+        "sheet_code": sheet_code,
+        "student_name": student.get('student_name') if student else None,
+        "enrollment": student.get('enrollment') if student else None,
+        "class_name": student.get('class_name') if student else None,
+        "school_id": student.get('school_id') if student else None,
+        "answered": omr_result['answered'],
+        "blank": omr_result['blank'],
+        "double_marked": omr_result['double_marked'],
+        "stages": omr_result.get('stages'),
+        **save
+    }
+
+
+def _record_sheet_metrics(item: Dict[str, Any]):
+    """Métricas de uma folha processada no pool (registradas no processo da requisição)."""
+    endpoint = (request.endpoint if has_request_context() else None) or 'job'
+    if item['status'] != 'sucesso':
+        if item.get('code') == 'QR_NOT_FOUND':
+            record_qr(None)
+        record_failure(endpoint, item.get('code'))
+        observe_stages(item.get('stages'))
+        return
+
+    record_qr(item.get('qr_method'))
+    record_omr(item['omr'])
+
+
+def _finish_batch_group(group: List[Tuple[int, str, Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    """Resolve os alunos do grupo num único lookup em lote e completa cada folha."""
+    codes = [item['sheet_code'] for _, _, item in group if item['status'] == 'sucesso']
+    students = lookup_students_by_sheet_codes(codes) if codes else {}
+
+    for idx, filename, item in group:
+        try:
+            result = _finish_batch_item(idx, filename, item, students)
+        except Exception as e:
+            result = {
+                "index": idx,
+                "filename": filename,
+                "status": "erro",
+                "code": "PROCESSING_ERROR",
+                "message": str(e)
+            }
+        yield result
+
+
+def _needs_lookup(item: Dict[str, Any]) -> bool:
+    """Folha lida cujo aluno não está no student_cache (ex.: lote sem prewarm)."""
+    return item['status'] == 'sucesso' and not get_student(item['sheet_code'])[0]
+
+
+def _finish_batch_items(entries: Iterator[Any], group_size: int) -> Iterator[Dict[str, Any]]:
+    """
+    Completa (idx, filename, resultado do pool) com uma consulta por tabela
+    para os alunos de um grupo de folhas, em vez de até duas por folha.
+
+    O grupo é resolvido e gerado quando chega a `group_size` folhas, quando
+    nenhuma delas precisa de consulta (alunos em cache ou leitura com erro)
+    ou quando `entries` gera _POOL_IDLE (a próxima folha ainda não está
+    pronta). Assim uma folha pronta nunca espera as seguintes.
+    """
+    group = []
+    lookup = False  # alguma folha do grupo precisa de consulta
+    for entry in entries:
+        if entry is not _POOL_IDLE:
+            group.append(entry)
+            lookup = lookup or _needs_lookup(entry[2])
+            if lookup and len(group) < group_size:
+                continue
+        if group:
+            yield from _finish_batch_group(group)
+            group, lookup = [], False
+
+    yield from _finish_batch_group(group)
+
+
+def iter_batch_results(items: List[Tuple[str, bytes]],
+                       incremental: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Processa um lote de (filename, bytes) e gera o resultado de cada folha,
+    na ordem de envio, no formato de /api/batch-process.
+
+    incremental=True (streaming, jobs): cada folha é gerada assim que lida,
+    com os alunos buscados em grupos de até STUDENT_LOOKUP_GROUP folhas já
+    prontas. incremental=False: um único lookup em lote para todas as folhas.
+    """
+    nonempty = [img_bytes for _, img_bytes in items if len(img_bytes) > 0]
+    idle = _POOL_IDLE if incremental else None
+    processed = iter_process_sheets(nonempty, idle=idle)
+
+    def entries():
+        for idx, (filename, img_bytes) in enumerate(items):
+            if len(img_bytes) == 0:
+                yield idx, filename, {"status": "erro", "code": "EMPTY_FILE"}
+                continue
+            item = next(processed)
+            while item is _POOL_IDLE:
+                yield item
+                item = next(processed)
+            yield idx, filename, item
+
+    group_size = STUDENT_LOOKUP_GROUP if incremental else len(items)
+    try:
+        yield from _finish_batch_items(entries(), max(1, group_size))
+    finally:
+        processed.close()
+
+
+def iter_pdf_results(pdf_bytes: bytes, filename: str,
+                     dpi: int = PDF_RENDER_DPI) -> Iterator[Dict[str, Any]]:
+    """
+    Processa todas as páginas de um PDF de gabaritos, na ordem do arquivo.
+
+    O PDF é aberto uma única vez e rasterizado direto para grayscale; a
+    próxima página é renderizada enquanto o pool lê as anteriores, então o
+    tempo total é limitado pelo OMR e não pela rasterização.
+    Cada resultado tem o formato de /api/batch-process, mais 'page'.
+    """
+    pages = iter_pdf_pages(pdf_bytes, dpi=dpi)
+    # Uma página por processo do pool, mais a próxima já rasterizada
+    window = max(2, OMR_POOL_WORKERS + 1)
+    processed = _iter_pool(process_sheet_page, (gray for _, gray in pages),
+                           window=window, idle=_POOL_IDLE)
+
+    def entries():
+        idx = 0
+        for item in processed:
+            if item is _POOL_IDLE:
+                yield item
+                continue
+            yield idx, filename, item
+            idx += 1
+
+    try:
+        for result in _finish_batch_items(entries(), STUDENT_LOOKUP_GROUP):
+            result['page'] = result['index'] + 1
+            yield result
+    finally:
+        processed.close()
+        pages.close()
+
+
+# ============================================================
+# JOBS DE LOTE ASSÍNCRONOS
+# ============================================================
+
+# Intervalo (s) do heartbeat do job durante o processamento. A cada
+# intervalo o job é regravado se houve progresso; senão só o heartbeat é
+# tocado (mesmo numa folha demorada). Um job sem heartbeat há
+# OMR_JOB_STALE_AFTER (batch_jobs) é dado como perdido.
+JOB_SAVE_INTERVAL = 0.5
+
+
+def run_batch_job(job: Dict[str, Any], items: List[Tuple[str, bytes]]):
+    """
+    Executa um job de lote em background, gravando progresso e resultados
+    parciais em batch_jobs. Verifica o pedido de cancelamento entre folhas.
+
+    Um thread de heartbeat, a cada JOB_SAVE_INTERVAL, grava o job se houve
+    progresso desde a última gravação, ou apenas toca o heartbeat
+    (touch_job), sem regravar os resultados. Se o worker morrer, o polling
+    de /api/jobs/<id> percebe o heartbeat parado e encerra o job com
+    JOB_LOST. Se o job já foi encerrado assim (worker travado, não morto),
+    o executor para sem regravá-lo.
+    """
+    job_id = job['job_id']
+    job_lock = threading.Lock()
+    stop_heartbeat = threading.Event()
+    closed = threading.Event()  # arquivo já em estado final (ex.: JOB_LOST)
+    changed = False  # progresso ainda não gravado
+
+    def heartbeat():
+        nonlocal changed
+        while not stop_heartbeat.wait(JOB_SAVE_INTERVAL):
+            with job_lock:
+                alive = save_job(job) if changed else touch_job(job_id)
+                changed = False
+                if not alive:
+                    closed.set()
+                    return
+
+    job['status'] = 'running'
+    job['pid'] = os.getpid()
+    if not save_job(job):
+        logger.warning(f"Batch job {job_id} already closed, not started")
+        return
+
+    results = iter_batch_results(items)
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+
+    try:
+        for result in results:
+            with job_lock:
+                job['results'].append(result)
+                job['processed'] += 1
+                if result['status'] == 'sucesso':
+                    job['success'] += 1
+                else:
+                    job['failed'] += 1
+                changed = True
+
+            if closed.is_set():
+                logger.warning(f"Batch job {job_id} closed by another process, stopping")
+                break
+
+            if is_cancel_requested(job_id):
+                job['status'] = 'cancelled'
+                break
+        else:
+            job['status'] = 'done'
+
+    except Exception as e:
+        logger.error(f"Batch job {job_id} error: {e}", exc_info=True)
+        with job_lock:
+            job['status'] = 'error'
+            job['error'] = str(e)
+
+    finally:
+        stop_heartbeat.set()
+        heartbeat_thread.join()
+        results.close()
+        saved = save_job(job)
+
+    if not saved:
+        return
+    logger.info(f"Batch job {job_id} {job['status']}: {job['success']}/{job['total']} success, "
+                f"{job['failed']} failed")
+
+
+# ============================================================
+# MÉTRICAS POR REQUISIÇÃO
+# ============================================================
+# Latência e requisições em andamento por endpoint. A medição termina
+# quando o servidor fecha a resposta (call_on_close), então nas respostas
+# em streaming cobre o envio completo e não só a criação do gerador.
+
+UNTRACKED_ENDPOINTS = {'metrics', 'health', 'static'}
+
+
+@app.before_request
+def _start_request_metrics():
+    if request.endpoint and request.endpoint not in UNTRACKED_ENDPOINTS:
+        g.metrics_start = time.perf_counter()
+        request_started(request.endpoint)
+
+
+@app.after_request
+def _track_response_metrics(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+
+    endpoint = request.endpoint
+    response.call_on_close(lambda: request_finished(endpoint, time.perf_counter() - start))
+
+    # Respostas de erro em JSON: conta pelo código retornado
+    if response.status_code >= 400 and response.is_json:
+        body = response.get_json(silent=True) or {}
+        record_failure(endpoint, body.get('code') or f"HTTP_{response.status_code}")
+    return response
+
+
+@app.teardown_request
+def _finish_request_metrics(exc):
+    # Só quando o after_request não rodou (erro antes de haver resposta)
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        request_finished(request.endpoint, time.perf_counter() - start)
+
+
+# ============================================================
+# ENDPOINTS DA API
+# ============================================================
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Health check."""
+    return jsonify({
+        "status": "ok",
+        "service": "omr-service",
+        "version": "1.0",
+        "questions": 90
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas no formato Prometheus (ver omr_metrics.py)."""
+    if not HAS_PROMETHEUS:
+        return jsonify({
+            "status": "erro",
+            "code": "MISSING_DEPS",
+            "message": "prometheus_client não instalado"
+        }), 501
+
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+@app.route('/api/process-image', methods=['POST'])
+def process_image():
+    """Processa uma imagem de gabarito."""
+    try:
+        # Verificar se tem arquivo
+        if 'image' not in request.files:
+            logger.error("Campo 'image' nao encontrado nos arquivos")
+            return jsonify({"status": "erro", "mensagem": "Arquivo 'image' nao fornecido"}), 400
+
+        img_file = request.files['image']
+        img_bytes = img_file.read()
+
+        if len(img_bytes) == 0:
+            logger.error("Arquivo vazio recebido")
+            return jsonify({"status": "erro", "mensagem": "Arquivo vazio"}), 400
+
+        # Decodificar direto para grayscale (JPEG de alta resolução já reduzido)
+        ctx = SheetContext.from_bytes(img_bytes)
+        if ctx is None:
+            logger.error("Imagem nao decodificavel")
+            return jsonify({"status": "erro", "mensagem": "Nao foi possivel decodificar a imagem"}), 400
+
+        # Processar OMR
+        result = process_omr(ctx)
+        record_omr(result)
+
+        # Numero da pagina
+        page_num = int(request.form.get('page', 1))
+
+        logger.info(f"Pagina {page_num}: {result['answered']}/90 respondidas | {result['blank']} branco | {result['double_marked']} dupla | {result['elapsed_ms']}ms")
+
+        # Formatar resposta
+        questoes = []
+        for i, ans in enumerate(result['answers'], 1):
+            if ans is None:
+                questoes.append({'numero': i, 'resposta': ''})
+            elif ans == 'X':
+                questoes.append({'numero': i, 'resposta': 'X', 'invalida': True, 'motivo': 'Dupla marcacao'})
             else:
                 questoes.append({'numero': i, 'resposta': ans})
 
@@ -970,7 +1786,10 @@ def process_image():
                     "em_branco": result['blank'],
                     "dupla_marcacao": result['double_marked']
                 },
-                "elapsed_ms": result['elapsed_ms']
+                "elapsed_ms": result['elapsed_ms'],
+                "method": result['method'],
+                "detection": result.get('detection'),
+                "stages": result['stages']
             }
         })
 
@@ -993,7 +1812,8 @@ def process_sheet():
         student: { student_name, enrollment, class_name },
         answers: ["A", "B", null, "C", ...],
         stats: { answered, blank, double_marked },
-        timings: { qr_ms, supabase_ms, omr_ms, total_ms }
+        timings: { qr_ms, supabase_ms, omr_ms, save_ms, total_ms,
+                   stages: { decode, gray, qr, markers, bubbles, sampling, decision, fallback } }
     }
     """
     timings = {}
@@ -1020,32 +1840,36 @@ def process_sheet():
                 "message": "Arquivo vazio"
             }), 400
 
-        # Abrir imagem
-        pil_img = Image.open(io.BytesIO(img_bytes))
-
-        if pil_img.mode != 'RGB':
-            pil_img = pil_img.convert('RGB')
-
-        # Converter para OpenCV (BGR)
-        img_array = np.array(pil_img)[:, :, ::-1].copy()
+        # Decodificar direto para grayscale (JPEG de alta resolução já reduzido).
+        # Contexto da folha: gray, marcadores e QR calculados uma única vez
+        ctx = SheetContext.from_bytes(img_bytes)
+        if ctx is None:
+            logger.error("Imagem não decodificável")
+            return jsonify({
+                "status": "erro",
+                "code": "INVALID_IMAGE",
+                "message": "Não foi possível decodificar a imagem"
+            }), 400
 
         # ============================================================
         # STEP 1: LER QR CODE (~10ms)
         # ============================================================
         t0 = time.time()
 
-        if USE_QR_MODULE:
-            # Usar módulo QR com fallback (mais robusto)
-            qr_result = read_qr_with_fallback(img_array)
-            sheet_code = qr_result['sheet_code'] if qr_result['success'] else None
-            start_question = 1  # TODO: adicionar suporte a dia no módulo QR se necessário
-            timings['qr_method'] = qr_result.get('method')
-        else:
-            # Fallback para função interna (retorna tuple: sheet_code, start_question)
-            sheet_code, start_question = read_qr_code(img_array)
-            timings['qr_method'] = 'internal'
+        with ctx.stage('qr'):
+            if USE_QR_MODULE:
+                # Usar módulo QR com fallback (mais robusto)
+                qr_result = read_qr_with_fallback(ctx)
+                sheet_code = qr_result['sheet_code'] if qr_result['success'] else None
+                start_question = 1  # TODO: adicionar suporte a dia no módulo QR se necessário
+                timings['qr_method'] = qr_result.get('method')
+            else:
+                # Fallback para função interna (retorna tuple: sheet_code, start_question)
+                sheet_code, start_question = read_qr_code(ctx)
+                timings['qr_method'] = 'internal'
 
         timings['qr_ms'] = round((time.time() - t0) * 1000, 2)
+        record_qr(timings['qr_method'] if sheet_code else None)
 
         if not sheet_code:
             logger.warning("QR Code não encontrado na imagem")
@@ -1083,8 +1907,10 @@ def process_sheet():
         # STEP 3: PROCESSAR OMR (~50ms)
         # ============================================================
         t0 = time.time()
-        result = process_omr(img_array)
+        result = process_omr(ctx)
         timings['omr_ms'] = round((time.time() - t0) * 1000, 2)
+        timings['stages'] = result['stages']
+        record_omr(result)
 
         stats = {
             "answered": result['answered'],
@@ -1097,11 +1923,12 @@ def process_sheet():
         # ============================================================
         # STEP 4: SALVAR RESULTADO NO SUPABASE
         # ============================================================
+        # (write-behind: só entra na fila, a gravação é em lote)
         t0 = time.time()
-        saved = save_omr_result(sheet_code, result['answers'], stats)
+        save = store_omr_result(sheet_code, result['answers'], stats)
         timings['save_ms'] = round((time.time() - t0) * 1000, 2)
 
-        if saved:
+        if save['saved']:
             logger.info(f"Result saved ({timings['save_ms']}ms)")
 
         # Calcular tempo total
@@ -1131,7 +1958,9 @@ def process_sheet():
             "answers_numbered": result.get('answers_dict', {}),  # Dict com números corretos
             "stats": stats,
             "timings": timings,
-            "saved": saved
+            "method": result['method'],  # 'hough' ou 'legacy'
+            "detection": result.get('detection'),  # 'template' ou 'hough' (bolhas)
+            **save  # saved: null enquanto pendente; ver /api/save-status
         })
 
     except Exception as e:
@@ -1245,17 +2074,41 @@ def batch_status(batch_id):
     """
     Retorna status de um lote de gabaritos.
 
+    Query (opcionais):
+        filter: all (padrão) | pending | processed
+        limit, offset: paginação da lista de alunos (padrão: todos)
+
     Output: {
         status: "sucesso",
         batch: { ... },
         total_students: 30,
         processed_count: 15,
         pending_count: 15,
-        students: [...]
+        filter: "all",
+        students_total: 30,
+        offset: 0,
+        limit: null,
+        students: [...],
+        version: "..."
     }
+
+    A resposta traz ETag (= version); com If-None-Match igual, responde 304.
     """
     try:
-        result = get_batch_status(batch_id)
+        status_filter = request.args.get('filter', 'all')
+        if status_filter not in BATCH_STATUS_FILTERS:
+            return jsonify({
+                "status": "erro",
+                "code": "INVALID_FILTER",
+                "message": f"filter deve ser um de: {', '.join(BATCH_STATUS_FILTERS)}"
+            }), 400
+
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(1, min(limit, 1000))
+        offset = max(0, request.args.get('offset', 0, type=int))
+
+        result = get_batch_status(batch_id, status_filter, limit, offset)
 
         if not result:
             return jsonify({
@@ -1264,33 +2117,79 @@ def batch_status(batch_id):
                 "message": f"Lote {batch_id} não encontrado"
             }), 404
 
+        if request.if_none_match.contains(result['version']):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify({
+                "status": "sucesso",
+                **result
+            })
+        response.set_etag(result['version'])
+        return response
+
+    except Exception as e:
+        logger.error(f"Batch status error: {e}", exc_info=True)
+        return jsonify({
+            "status": "erro",
+            "code": "STATUS_ERROR",
+            "message": str(e)
+        }), 500
+
+
+@app.route('/api/batch/<batch_id>/prewarm', methods=['POST'])
+def batch_prewarm(batch_id):
+    """
+    Carrega os alunos do lote no cache de lookup (chamar ao iniciar a leitura).
+
+    Output: {
+        status: "sucesso",
+        batch_id: "uuid",
+        students: 30
+    }
+    """
+    try:
+        count = prewarm_student_cache(batch_id)
+
         return jsonify({
             "status": "sucesso",
-            **result
+            "batch_id": batch_id,
+            "students": count
         })
 
     except Exception as e:
-        logger.error(f"Batch status error: {e}", exc_info=True)
+        logger.error(f"Batch prewarm error: {e}", exc_info=True)
         return jsonify({
             "status": "erro",
-            "code": "STATUS_ERROR",
+            "code": "PREWARM_ERROR",
             "message": str(e)
         }), 500
 
 
+def _attachment_filename(filename: str) -> Dict[str, str]:
+    """Parâmetros de Content-Disposition para o nome do arquivo (como send_file faz)."""
+    try:
+        filename.encode('ascii')
+        return {'filename': filename}
+    except UnicodeEncodeError:
+        ascii_name = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': ascii_name, 'filename*': f"UTF-8''{quote(filename)}"}
+
+
 @app.route('/api/download-pdf/<batch_id>', methods=['GET'])
 def download_pdf(batch_id):
     """
     Gera e retorna PDF com gabaritos do lote.
     Cada página contém um gabarito com QR Code único.
+
+    O PDF é enviado em streaming (sheet_pdf.iter_batch_pdf): o download
+    começa antes de todas as páginas estarem prontas. A cópia gravada no
+    pdf_cache atende os downloads seguintes enquanto os alunos não mudarem.
     """
     try:
         # Verificar se reportlab está disponível
         try:
-            from reportlab.lib.pagesizes import A4
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.units import mm
-            import qrcode
+            from sheet_pdf import iter_batch_pdf
+            from pdf_cache import cached_pdf_path, store_pdf, students_digest
         except ImportError:
             return jsonify({
                 "status": "erro",
@@ -1308,97 +2207,30 @@ def download_pdf(batch_id):
                 "message": f"Nenhum aluno encontrado para o lote {batch_id}"
             }), 404
 
-        # Gerar PDF em memória
-        pdf_buffer = io.BytesIO()
-        c = canvas.Canvas(pdf_buffer, pagesize=A4)
-        width, height = A4
-
-        for student in students:
-            # Cabeçalho
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(20*mm, height - 20*mm, "GABARITO - PROVA")
-
-            # Dados do aluno
-            c.setFont("Helvetica", 12)
-            c.drawString(20*mm, height - 35*mm, f"Nome: {student['student_name']}")
-            c.drawString(20*mm, height - 42*mm, f"Matrícula: {student.get('enrollment_code', '-')}")
-            c.drawString(20*mm, height - 49*mm, f"Turma: {student.get('class_name', '-')}")
-            c.drawString(20*mm, height - 56*mm, f"Código: {student['sheet_code']}")
-
-            # QR Code (canto superior direito)
-            qr = qrcode.QRCode(version=1, box_size=3, border=2)
-            qr.add_data(student['sheet_code'])
-            qr.make(fit=True)
-            qr_img = qr.make_image(fill_color="black", back_color="white")
-
-            # Salvar QR como imagem temporária
-            qr_buffer = io.BytesIO()
-            qr_img.save(qr_buffer, format='PNG')
-            qr_buffer.seek(0)
-
-            from reportlab.lib.utils import ImageReader
-            qr_reader = ImageReader(qr_buffer)
-            c.drawImage(qr_reader, width - 45*mm, height - 45*mm, 35*mm, 35*mm)
-
-            # Marcadores de canto (quadrados pretos para alinhamento)
-            marker_size = 5*mm
-            # Top-left
-            c.rect(15*mm, height - 130*mm, marker_size, marker_size, fill=1)
-            # Top-right
-            c.rect(width - 20*mm, height - 130*mm, marker_size, marker_size, fill=1)
-            # Bottom-left
-            c.rect(15*mm, 40*mm, marker_size, marker_size, fill=1)
-            # Bottom-right
-            c.rect(width - 20*mm, 40*mm, marker_size, marker_size, fill=1)
-
-            # Grid de respostas (6 colunas x 15 linhas = 90 questões)
-            start_y = height - 140*mm
-            col_width = 28*mm
-            row_height = 8*mm
-            bubble_radius = 2.5*mm
-
-            c.setFont("Helvetica", 8)
-
-            for col in range(6):
-                col_x = 20*mm + col * col_width
-
-                # Cabeçalho da coluna
-                c.setFont("Helvetica-Bold", 8)
-                header_text = "A  B  C  D  E"
-                c.drawString(col_x + 8*mm, start_y + 5*mm, header_text)
-                c.setFont("Helvetica", 8)
-
-                for row in range(15):
-                    q_num = col * 15 + row + 1
-                    row_y = start_y - row * row_height
-
-                    # Número da questão
-                    c.drawString(col_x, row_y, f"{q_num:02d}")
-
-                    # Bolhas A-E
-                    for opt in range(5):
-                        bubble_x = col_x + 10*mm + opt * 5*mm
-                        c.circle(bubble_x, row_y + 1.5*mm, bubble_radius)
-
-            # Nova página
-            c.showPage()
-
-        c.save()
-        pdf_buffer.seek(0)
-
         # Buscar nome do lote para o filename
-        batch_status = get_batch_status(batch_id)
-        batch_name = batch_status['batch'].get('name', 'gabaritos') if batch_status else 'gabaritos'
+        batch = get_batch(batch_id)
+        batch_name = batch.get('name', 'gabaritos') if batch else 'gabaritos'
         filename = f"{batch_name.replace(' ', '_')}.pdf"
 
-        logger.info(f"PDF generated for batch {batch_id}: {len(students)} pages")
-
-        return send_file(
-            pdf_buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=filename
-        )
+        # PDF já gerado para esta mesma lista de alunos: envio direto do disco
+        digest = students_digest(students)
+        cached_path = cached_pdf_path(batch_id, digest)
+        if cached_path:
+            logger.info(f"PDF cache hit for batch {batch_id}")
+            return send_file(
+                cached_path,
+                mimetype='application/pdf',
+                as_attachment=True,
+                download_name=filename
+            )
+
+        def generate():
+            yield from store_pdf(batch_id, digest, iter_batch_pdf(students))
+            logger.info(f"PDF generated for batch {batch_id}: {len(students)} pages")
+
+        response = Response(stream_with_context(generate()), mimetype='application/pdf')
+        response.headers.set('Content-Disposition', 'attachment', **_attachment_filename(filename))
+        return response
 
     except Exception as e:
         logger.error(f"PDF generation error: {e}", exc_info=True)
@@ -1409,12 +2241,54 @@ def download_pdf(batch_id):
         }), 500
 
 
+def _ndjson_stream(results: Iterator[Dict[str, Any]], label: str) -> Iterator[str]:
+    """Linhas NDJSON: um resultado por folha e o resumo no final."""
+    success_count = 0
+    failed_count = 0
+
+    try:
+        for result in results:
+            if result['status'] == 'sucesso':
+                success_count += 1
+            else:
+                failed_count += 1
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+
+        summary = {
+            "status": "sucesso",
+            "processed": success_count + failed_count,
+            "success": success_count,
+            "failed": failed_count
+        }
+
+    except Exception as e:
+        # Cabeçalhos já enviados: o erro vai no resumo
+        logger.error(f"{label} error: {e}", exc_info=True)
+        summary = {
+            "status": "erro",
+            "code": "BATCH_ERROR",
+            "message": str(e),
+            "processed": success_count + failed_count,
+            "success": success_count,
+            "failed": failed_count
+        }
+
+    finally:
+        # Cliente desconectado: cancela as folhas ainda na fila do pool
+        results.close()
+
+    logger.info(f"{label}: {success_count} success, {failed_count} failed")
+    yield json.dumps({"summary": summary}, ensure_ascii=False) + '\n'
+
+
 @app.route('/api/batch-process', methods=['POST'])
 def batch_process():
     """
     Processa múltiplas imagens de gabarito de uma vez.
 
     Input: images[] (multipart/form-data) - array de imagens
+           + async (opcional, form ou query): "1"/"true" para modo job
+           + batch_id (opcional): pré-carrega os alunos do lote no cache
 
     Output: {
         status: "sucesso",
@@ -1423,6 +2297,17 @@ def batch_process():
         failed: 2,
         results: [...]
     }
+
+    Output (stream=1 ou Accept: application/x-ndjson): NDJSON, uma linha
+    por folha assim que processada, na ordem de envio, e uma linha final
+        {"summary": {status, processed, success, failed}}
+
+    Output (async, HTTP 202): {
+        status: "sucesso",
+        job_id: "uuid",
+        total: 10,
+        status_url: "/api/jobs/<job_id>"
+    }
     """
     try:
         if 'images' not in request.files:
@@ -1441,87 +2326,39 @@ def batch_process():
                 "message": "Lista de imagens vazia"
             }), 400
 
-        results = []
-        success_count = 0
-        failed_count = 0
+        items = [(img_file.filename, img_file.read()) for img_file in images]
 
-        for idx, img_file in enumerate(images):
+        batch_id = request.form.get('batch_id', request.args.get('batch_id'))
+        if batch_id:
             try:
-                img_bytes = img_file.read()
-                if len(img_bytes) == 0:
-                    results.append({
-                        "index": idx,
-                        "filename": img_file.filename,
-                        "status": "erro",
-                        "code": "EMPTY_FILE"
-                    })
-                    failed_count += 1
-                    continue
-
-                # Abrir imagem
-                pil_img = Image.open(io.BytesIO(img_bytes))
-                if pil_img.mode != 'RGB':
-                    pil_img = pil_img.convert('RGB')
-
-                img_array = np.array(pil_img)[:, :, ::-1].copy()
-
-                # Ler QR Code
-                if USE_QR_MODULE:
-                    qr_result = read_qr_with_fallback(img_array)
-                    sheet_code = qr_result['sheet_code'] if qr_result['success'] else None
-                    start_question = 1  # TODO: adicionar suporte a dia no módulo QR
-                else:
-                    sheet_code, start_question = read_qr_code(img_array)
-
-                if not sheet_code:
-                    results.append({
-                        "index": idx,
-                        "filename": img_file.filename,
-                        "status": "erro",
-                        "code": "QR_NOT_FOUND"
-                    })
-                    failed_count += 1
-                    continue
-
-                # Processar OMR
-                omr_result = process_omr(img_array)
+                prewarm_student_cache(batch_id)
+            except Exception as e:
+                logger.warning(f"Student cache prewarm failed for batch {batch_id}: {e}")
 
-                # Buscar aluno
-                student = lookup_student_by_sheet_code(sheet_code)
+        # Modo assíncrono: retorna o job_id na hora e processa em background
+        if _is_truthy(request.form.get('async', request.args.get('async'))):
+            job = create_job(len(items))
+            threading.Thread(target=run_batch_job, args=(job, items), daemon=True).start()
 
-                # Salvar resultado
-                stats = {
-                    "answered": omr_result['answered'],
-                    "blank": omr_result['blank'],
-                    "double_marked": omr_result['double_marked']
-                }
-                saved = save_omr_result(sheet_code, omr_result['answers'], stats)
-
-                results.append({
-                    "index": idx,
-                    "filename": img_file.filename,
-                    "status": "sucesso",
-                    "sheet_code": sheet_code,
-                    "student_name": student.get('student_name') if student else None,
-                    "enrollment": student.get('enrollment') if student else None,
-                    "class_name": student.get('class_name') if student else None,
-                    "school_id": student.get('school_id') if student else None,
-                    "answered": omr_result['answered'],
-                    "blank": omr_result['blank'],
-                    "double_marked": omr_result['double_marked'],
-                    "saved": saved
-                })
-                success_count += 1
+            logger.info(f"Batch job {job['job_id']} queued: {len(items)} images")
 
-            except Exception as e:
-                results.append({
-                    "index": idx,
-                    "filename": img_file.filename,
-                    "status": "erro",
-                    "code": "PROCESSING_ERROR",
-                    "message": str(e)
-                })
-                failed_count += 1
+            return jsonify({
+                "status": "sucesso",
+                "job_id": job['job_id'],
+                "total": len(items),
+                "status_url": f"/api/jobs/{job['job_id']}"
+            }), 202
+
+        # Modo streaming: NDJSON, uma linha por folha
+        if (_is_truthy(request.form.get('stream', request.args.get('stream')))
+                or request.accept_mimetypes.best == 'application/x-ndjson'):
+            return Response(stream_with_context(_ndjson_stream(iter_batch_results(items), "Batch stream")),
+                            mimetype='application/x-ndjson')
+
+        # Etapas de CPU (decode, QR, OMR) em paralelo no pool de processos
+        results = list(iter_batch_results(items, incremental=False))
+        success_count = sum(1 for r in results if r['status'] == 'sucesso')
+        failed_count = len(results) - success_count
 
         logger.info(f"Batch process: {success_count}/{len(images)} success, {failed_count} failed")
 
@@ -1542,6 +2379,178 @@ def batch_process():
         }), 500
 
 
+@app.route('/api/process-pdf', methods=['POST'])
+def process_pdf():
+    """
+    Processa um PDF de várias páginas (ex.: PDF do scanner com a turma toda).
+
+    Input: pdf (multipart/form-data)
+           + dpi (opcional): resolução da rasterização (padrão 150)
+
+    Output: NDJSON (application/x-ndjson), uma linha por página assim que
+    processada, no formato de /api/batch-process mais "page", e uma linha
+    final {"summary": {status, processed, success, failed}}.
+    O total de páginas vem no cabeçalho X-Total-Pages.
+    """
+    try:
+        if 'pdf' not in request.files:
+            return jsonify({
+                "status": "erro",
+                "code": "NO_PDF",
+                "message": "Nenhum PDF fornecido"
+            }), 400
+
+        pdf_file = request.files['pdf']
+        pdf_bytes = pdf_file.read()
+        dpi = min(max(request.form.get('dpi', PDF_RENDER_DPI, type=int), 72), 600)
+
+        try:
+            total_pages = count_pdf_pages(pdf_bytes)
+        except PdfError as e:
+            return jsonify({
+                "status": "erro",
+                "code": "INVALID_PDF",
+                "message": f"Não foi possível abrir o PDF: {e}"
+            }), 400
+
+        logger.info(f"PDF process: {pdf_file.filename}, {total_pages} pages at {dpi} DPI")
+
+        results = iter_pdf_results(pdf_bytes, pdf_file.filename, dpi)
+        return Response(stream_with_context(_ndjson_stream(results, "PDF stream")),
+                        mimetype='application/x-ndjson',
+                        headers={"X-Total-Pages": str(total_pages)})
+
+    except Exception as e:
+        logger.error(f"PDF process error: {e}", exc_info=True)
+        return jsonify({
+            "status": "erro",
+            "code": "PDF_ERROR",
+            "message": str(e)
+        }), 500
+
+
+@app.route('/api/save-status', methods=['GET'])
+def save_status():
+    """
+    Status de gravação dos resultados (write-behind).
+
+    Query: sheet_codes - lista separada por vírgula
+
+    Output: {
+        status: "sucesso",
+        results: {
+            "XTRI-ABC234": {status: "pending" | "saved" | "not_found" | "failed"},
+            "XTRI-DEF567": {status: "saved", processed_at: "..."}
+        }
+    }
+
+    Códigos que este worker não gravou são consultados no banco: "saved"
+    com processed_at se já houver resultado, "not_saved" se ainda não,
+    "not_found", ou "unknown" se o banco não estiver acessível.
+    """
+    codes = [c.strip().upper() for c in request.args.get('sheet_codes', '').split(',') if c.strip()]
+    if not codes:
+        return jsonify({
+            "status": "erro",
+            "code": "NO_SHEET_CODES",
+            "message": "Informe sheet_codes"
+        }), 400
+
+    results = {}
+    unknown = []
+    for code in codes:
+        status = get_save_status(code)
+        if status is None:
+            unknown.append(code)
+        else:
+            results[code] = {"status": status}
+
+    client = get_supabase()
+    if unknown and client:
+        try:
+            rows = client.table('answer_sheet_students') \
+                .select('sheet_code, processed_at') \
+                .in_('sheet_code', unknown) \
+                .execute().data or []
+            for row in rows:
+                if row.get('processed_at'):
+                    results[row['sheet_code']] = {"status": SAVE_SAVED, "processed_at": row['processed_at']}
+                else:
+                    results[row['sheet_code']] = {"status": "not_saved"}
+            for code in unknown:
+                results.setdefault(code, {"status": "not_found"})
+        except Exception as e:
+            logger.error(f"Save status lookup error: {e}")
+
+    for code in unknown:
+        results.setdefault(code, {"status": "unknown"})
+
+    return jsonify({
+        "status": "sucesso",
+        "results": results
+    })
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Progresso e resultados parciais de um job de lote assíncrono.
+
+    Query: offset (opcional) - retorna apenas results[offset:], para
+           polling incremental
+
+    Output: {
+        status: "sucesso",
+        job: {
+            job_id, status: "queued" | "running" | "done" | "cancelled" | "error",
+            total, processed, success, failed,
+            offset, results: [...],
+            code, error  (status "error"; code "JOB_LOST" se o worker morreu)
+        }
+    }
+    """
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({
+            "status": "erro",
+            "code": "JOB_NOT_FOUND",
+            "message": f"Job {job_id} não encontrado"
+        }), 404
+
+    expire_stale_job(job)
+
+    offset = max(0, request.args.get('offset', 0, type=int))
+    job['results'] = job['results'][offset:]
+    job['offset'] = offset
+
+    return jsonify({
+        "status": "sucesso",
+        "job": job
+    })
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    Pede o cancelamento de um job de lote. As folhas já processadas são
+    mantidas; o job termina com status "cancelled" após a folha em andamento.
+    """
+    if not request_cancel(job_id):
+        return jsonify({
+            "status": "erro",
+            "code": "JOB_NOT_FOUND",
+            "message": f"Job {job_id} não encontrado"
+        }), 404
+
+    logger.info(f"Batch job {job_id}: cancel requested")
+
+    return jsonify({
+        "status": "sucesso",
+        "job_id": job_id,
+        "cancel_requested": True
+    }), 202
+
+
 # ============================================================
 # MAIN
 # ============================================================
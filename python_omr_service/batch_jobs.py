@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Batch Jobs
+==========
+
+Registro dos jobs assíncronos de processamento em lote (/api/batch-process
+em modo async).
+
+O estado de cada job fica num arquivo JSON em OMR_JOBS_DIR, reescrito de
+forma atômica quando o progresso muda. Assim qualquer worker do gunicorn
+consegue responder ao polling de /api/jobs/<id>, não apenas o que está
+executando o job. O cancelamento é um arquivo marcador (<id>.cancel) que o
+executor verifica entre uma folha e outra.
+
+Enquanto o job roda, o heartbeat é o mtime de um arquivo vazio (<id>.hb),
+tocado periodicamente pelo executor (touch_job) sem regravar o JSON com os
+resultados. Se o heartbeat parar e o processo dono (pid no JSON) não
+existir mais (os workers que compartilham OMR_JOBS_DIR estão na mesma
+máquina), o próximo polling marca o job como 'error' / JOB_LOST, em vez de
+deixá-lo 'running' para sempre. Ao finalizar, o <id>.hb é removido e o job
+não é mais regravado: um worker que volte de um travamento não o ressuscita.
+
+Estados: queued -> running -> done | cancelled | error
+
+Autor: GabaritAI / X-TRI
+"""
+
+import json
+import os
+import tempfile
+import time
+import uuid
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+OMR_JOBS_DIR = os.getenv('OMR_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'omr_jobs'))
+OMR_JOB_TTL = int(os.getenv('OMR_JOB_TTL', 24 * 3600))  # segundos
+# Sem heartbeat há mais que isso (s), um job queued/running é dado como perdido
+OMR_JOB_STALE_AFTER = float(os.getenv('OMR_JOB_STALE_AFTER', 10))
+
+FINAL_STATES = ('done', 'cancelled', 'error')
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(OMR_JOBS_DIR, f"{job_id}.json")
+
+
+def _cancel_path(job_id: str) -> str:
+    return os.path.join(OMR_JOBS_DIR, f"{job_id}.cancel")
+
+
+def _heartbeat_path(job_id: str) -> str:
+    return os.path.join(OMR_JOBS_DIR, f"{job_id}.hb")
+
+
+def _valid_id(job_id: str) -> bool:
+    try:
+        return str(uuid.UUID(job_id)) == job_id
+    except (ValueError, TypeError):
+        return False
+
+
+def _is_closed(job_id: str) -> bool:
+    """Arquivo do job já em estado final. Só lê o JSON se o <id>.hb sumiu."""
+    if os.path.exists(_heartbeat_path(job_id)):
+        return False
+    current = get_job(job_id)
+    return current is not None and current['status'] in FINAL_STATES
+
+
+def save_job(job: Dict[str, Any]) -> bool:
+    """
+    Grava o estado do job (escrita atômica via arquivo temporário + rename)
+    e renova o heartbeat; num estado final, remove o heartbeat.
+    Retorna False, sem gravar, se o arquivo já está num estado final (job
+    encerrado por outro processo, ex.: JOB_LOST).
+    """
+    job_id = job['job_id']
+    if _is_closed(job_id):
+        return False
+
+    job['updated_at'] = time.time()
+    fd, tmp = tempfile.mkstemp(dir=OMR_JOBS_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(tmp, _job_path(job_id))
+
+    if job['status'] in FINAL_STATES:
+        try:
+            os.remove(_heartbeat_path(job_id))
+        except FileNotFoundError:
+            pass
+    else:
+        with open(_heartbeat_path(job_id), 'w'):
+            pass
+    return True
+
+
+def touch_job(job_id: str) -> bool:
+    """
+    Heartbeat sem regravar o job: atualiza o mtime do <id>.hb.
+    Retorna False se o job já foi finalizado (ex.: JOB_LOST por outro processo).
+    """
+    try:
+        os.utime(_heartbeat_path(job_id))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def last_heartbeat(job: Dict[str, Any]) -> float:
+    """Momento do último sinal de vida do executor (heartbeat ou gravação)."""
+    last = job.get('updated_at', job.get('created_at', 0))
+    try:
+        return max(last, os.path.getmtime(_heartbeat_path(job['job_id'])))
+    except OSError:
+        return last
+
+
+def create_job(total: int) -> Dict[str, Any]:
+    """Cria e grava um job novo (status 'queued') para `total` folhas."""
+    os.makedirs(OMR_JOBS_DIR, exist_ok=True)
+    cleanup_jobs()
+
+    now = time.time()
+    job = {
+        'job_id': str(uuid.uuid4()),
+        'status': 'queued',
+        'total': total,
+        'processed': 0,
+        'success': 0,
+        'failed': 0,
+        'results': [],
+        'created_at': now,
+        'pid': os.getpid()
+    }
+    save_job(job)
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Lê o estado do job, ou None se não existir."""
+    if not _valid_id(job_id):
+        return None
+    try:
+        with open(_job_path(job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def expire_stale_job(job: Dict[str, Any], now: Optional[float] = None) -> bool:
+    """
+    Marca como 'error' (code JOB_LOST) um job não finalizado cujo heartbeat
+    parou há mais de OMR_JOB_STALE_AFTER e cujo worker dono (pid) não existe
+    mais. Um worker vivo mas travado não perde o job. Retorna True se o job
+    foi marcado.
+    """
+    if job['status'] in FINAL_STATES:
+        return False
+
+    now = time.time() if now is None else now
+    silent_for = now - last_heartbeat(job)
+    if silent_for <= OMR_JOB_STALE_AFTER:
+        return False
+    if job.get('pid') and _pid_alive(job['pid']):
+        return False
+
+    job['status'] = 'error'
+    job['code'] = 'JOB_LOST'
+    job['error'] = (f"Job interrompido: worker {job.get('pid', '?')} encerrado, sem heartbeat "
+                    f"há {silent_for:.0f}s")
+    save_job(job)
+    logger.warning(f"Batch job {job['job_id']} lost: {job['error']}")
+    return True
+
+
+def request_cancel(job_id: str) -> bool:
+    """Pede o cancelamento do job. Retorna False se o job não existir."""
+    if get_job(job_id) is None:
+        return False
+    with open(_cancel_path(job_id), 'w'):
+        pass
+    return True
+
+
+def is_cancel_requested(job_id: str) -> bool:
+    return os.path.exists(_cancel_path(job_id))
+
+
+def cleanup_jobs() -> None:
+    """Remove jobs (e marcadores de cancelamento) mais antigos que OMR_JOB_TTL."""
+    cutoff = time.time() - OMR_JOB_TTL
+    try:
+        entries = os.listdir(OMR_JOBS_DIR)
+    except FileNotFoundError:
+        return
+
+    for name in entries:
+        path = os.path.join(OMR_JOBS_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError as e:
+            logger.debug(f"Job cleanup skipped {name}: {e}")
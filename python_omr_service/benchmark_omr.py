@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Benchmark OMR por estágio
+=========================
+
+Mede cada estágio do pipeline OMR offline (sem serviço rodando), sobre um
+corpus sintético fixo gerado pelo gabarito_generator (--scans), em 150, 200
+e 300 DPI:
+
+    decode          bytes da imagem -> grayscale (decode_gray)
+    qr              read_qr_with_fallback (qr_reader_module)
+    markers         find_grid_markers
+    template        project_template_bubbles + check_template_fit
+    bubbles         detect_bubbles (Hough)
+    answers         sample_bubbles + detect_answer
+    legacy_deskew   deskew_image (caminho legado)
+    legacy_read     read_legacy_answers / read_question (caminho legado)
+    pipeline        process_omr completo a partir dos bytes
+
+Para cada estágio e DPI grava p50/p95 da latência (ms) e o pico de memória
+alocada (tracemalloc, KB) num JSON. Com --baseline, compara com um JSON
+anterior e termina com código 1 se o p50 ou o pico de memória de algum
+estágio piorar além da tolerância (o p95 só entra com --p95-tolerance).
+O baseline é específico da máquina: gere-o no mesmo ambiente em que a
+comparação vai rodar.
+
+Cada estágio tem uma passada de aquecimento (não medida) e depois --repeat
+passadas sobre o corpus. O p50 comparado é o menor dos p50 das passadas e
+o p95 a mediana dos p95. Cada passada também mede uma carga de referência
+fixa (REFERENCE), e os limites do baseline são escalados pela razão ref_ms
+atual / ref_ms do baseline, compensando a máquina inteira mais lenta ou
+mais rápida entre execuções (--absolute desliga).
+
+Ajuste: --tolerance (fração, padrão 0.3) limita o p50 e --mem-tolerance
+(padrão 0.2) o pico de memória. Em VM compartilhada, tolerâncias menores
+reprovam execuções sem regressão; numa máquina dedicada podem baixar. O
+p95 é mais ruidoso: só ative --p95-tolerance com folga maior que a do p50.
+
+Uso:
+    python benchmark_omr.py --save-baseline omr_baseline.json
+    python benchmark_omr.py --baseline omr_baseline.json --tolerance 0.3
+
+Autor: GabaritAI / X-TRI
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sheet_context import SheetContext, decode_gray
+from gabarito_generator import DEFAULT_SCAN_OPTIONS, generate_scan_corpus, synthetic_students
+from qr_reader_module import read_qr_with_fallback
+from xtri_gabarito_reader import (find_grid_markers, detect_bubbles, project_template_bubbles,
+                                  check_template_fit, sample_bubbles, detect_answer)
+from app import deskew_image, read_legacy_answers, process_omr
+
+DEFAULT_DPIS = [150, 200, 300]
+DEFAULT_SHEETS = 10
+DEFAULT_REPEAT = 5
+DEFAULT_SEED = 20260101
+
+# Diferenças abaixo disso não contam como regressão (ruído de estágios de poucos ms)
+MIN_DELTA_MS = 1.0
+MIN_DELTA_KB = 256
+
+# Versão das estatísticas gravadas: baselines de outra versão não são comparáveis
+BENCHMARK_FORMAT = 2
+
+
+# ============================================================
+# CORPUS
+# ============================================================
+
+def load_corpus(corpus_dir: str, dpi: int, sheets: int, seed: int) -> List[bytes]:
+    """Bytes das imagens do corpus no DPI pedido (gerado na primeira vez)."""
+    out_dir = os.path.join(corpus_dir, f"dpi{dpi}_n{sheets}_s{seed}")
+    manifest = os.path.join(out_dir, 'corpus.json')
+    if not os.path.exists(manifest):
+        print(f"Gerando corpus {dpi} DPI em {out_dir}...")
+        options = dict(DEFAULT_SCAN_OPTIONS, dpi=dpi, seed=seed)
+        generate_scan_corpus(synthetic_students(sheets), out_dir, options)
+
+    with open(manifest, encoding='utf-8') as f:
+        images = [sheet['image'] for sheet in json.load(f)['sheets']]
+
+    data = []
+    for image in images:
+        with open(os.path.join(out_dir, image), 'rb') as f:
+            data.append(f.read())
+    return data
+
+
+# ============================================================
+# ESTÁGIOS
+# ============================================================
+# Cada estágio recebe as entradas já prontas (geradas sem medir) e roda
+# sobre um SheetContext novo, para que nada venha memorizado de outra
+# medição.
+
+def _prepare(data: bytes) -> Dict[str, Any]:
+    """Entradas de cada estágio para uma imagem (calculadas uma vez, fora da medição)."""
+    gray = decode_gray(data)
+    markers = find_grid_markers(SheetContext(gray))
+
+    # Bolhas pelo mesmo caminho do leitor em modo 'auto': template, senão Hough
+    positions = []
+    if markers:
+        positions = project_template_bubbles(markers)
+        if not check_template_fit(gray, positions):
+            positions = detect_bubbles(gray, markers)
+    deskewed, aligned = deskew_image(SheetContext(gray))
+    return {
+        'data': data,
+        'gray': gray,
+        'markers': markers,
+        'positions': positions,
+        'deskewed': deskewed,
+        'aligned': aligned
+    }
+
+
+def _answers(gray, positions):
+    return [detect_answer(row) for row in sample_bubbles(gray, positions)]
+
+
+STAGES: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'decode': lambda s: decode_gray(s['data']),
+    'qr': lambda s: read_qr_with_fallback(SheetContext(s['gray'])),
+    'markers': lambda s: find_grid_markers(SheetContext(s['gray'])),
+    'template': lambda s: check_template_fit(s['gray'], project_template_bubbles(s['markers'])),
+    'bubbles': lambda s: detect_bubbles(s['gray'], s['markers']),
+    'answers': lambda s: _answers(s['gray'], s['positions']),
+    'legacy_deskew': lambda s: deskew_image(SheetContext(s['gray'])),
+    'legacy_read': lambda s: read_legacy_answers(s['deskewed'], s['aligned']),
+    'pipeline': lambda s: process_omr(SheetContext.from_bytes(s['data'])),
+}
+
+
+def _reference(s):
+    """Carga fixa de OpenCV, medida junto com cada estágio para calibrar a velocidade da máquina."""
+    blurred = cv2.GaussianBlur(s['gray'], (5, 5), 0)
+    return cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 31, 10)
+
+
+REFERENCE = _reference
+
+# Estágios que dependem dos marcadores / das 90 questões mapeadas (pulados
+# nas folhas em que não foram achados)
+NEEDS_MARKERS = {'template', 'bubbles'}
+NEEDS_POSITIONS = {'answers'}
+
+
+def run_stage(fn: Callable, samples: List[Dict[str, Any]], repeat: int) -> Dict[str, float]:
+    """
+    Latência (ms) e pico de memória (KB) do estágio sobre o corpus.
+
+    p50_ms: menor p50 entre as passadas; p95_ms: mediana dos p95 das
+    passadas; ref_ms: menor p50 da carga de referência, medida nas mesmas
+    passadas (ver docstring do módulo).
+    """
+    # Aquecimento: caches, alocações e imports preguiçosos fora da medição
+    for sample in samples:
+        fn(sample)
+        REFERENCE(sample)
+
+    p50s, p95s, refs = [], [], []
+    for _ in range(repeat):
+        times, ref_times = [], []
+        for sample in samples:
+            start = time.perf_counter()
+            fn(sample)
+            times.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            REFERENCE(sample)
+            ref_times.append((time.perf_counter() - start) * 1000)
+        p50s.append(float(np.percentile(times, 50)))
+        p95s.append(float(np.percentile(times, 95)))
+        refs.append(float(np.percentile(ref_times, 50)))
+
+    # Memória numa passada separada: o tracemalloc deixa a medição de tempo mais lenta
+    peak = 0
+    tracemalloc.start()
+    try:
+        for sample in samples:
+            tracemalloc.reset_peak()
+            fn(sample)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(min(p50s), 3),
+        'p95_ms': round(float(np.median(p95s)), 3),
+        'ref_ms': round(min(refs), 3),
+        'peak_kb': round(peak / 1024, 1),
+        'runs': repeat * len(samples)
+    }
+
+
+def run_benchmark(dpis: List[int], sheets: int, repeat: int, seed: int, corpus_dir: str,
+                  stages: List[str]) -> Dict[str, Any]:
+    results = {}
+    for dpi in dpis:
+        samples = [_prepare(data) for data in load_corpus(corpus_dir, dpi, sheets, seed)]
+        with_markers = [s for s in samples if s['markers']]
+        with_positions = [s for s in samples if len(s['positions']) == 90]
+        if len(with_positions) < len(samples):
+            print(f"  {dpi} DPI: grid não mapeado em {len(samples) - len(with_positions)} folhas")
+
+        results[str(dpi)] = {}
+        for name in stages:
+            stage_samples = (with_markers if name in NEEDS_MARKERS else
+                             with_positions if name in NEEDS_POSITIONS else samples)
+            if not stage_samples:
+                continue
+            stats = run_stage(STAGES[name], stage_samples, repeat)
+            results[str(dpi)][name] = stats
+            print(f"  {dpi:>3} DPI  {name:<14} p50={stats['p50_ms']:>8.2f} ms  "
+                  f"p95={stats['p95_ms']:>8.2f} ms  ref={stats['ref_ms']:>6.2f} ms  "
+                  f"pico={stats['peak_kb']:>9.1f} KB")
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'format': BENCHMARK_FORMAT,
+            'sheets': sheets,
+            'repeat': repeat,
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+# ============================================================
+# COMPARAÇÃO COM O BASELINE
+# ============================================================
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            mem_tolerance: float, absolute: bool = False,
+            p95_tolerance: Optional[float] = None) -> List[str]:
+    """
+    Lista de regressões (vazia = dentro da tolerância). A latência do
+    baseline é escalada pela velocidade relativa da máquina (ref_ms), salvo
+    com absolute=True. O p95 só é comparado se p95_tolerance for dado.
+    """
+    regressions = []
+    for dpi, stages in current['results'].items():
+        for name, stats in stages.items():
+            base = baseline.get('results', {}).get(dpi, {}).get(name)
+            if not base:
+                continue
+
+            speed = 1.0 if absolute else stats['ref_ms'] / base['ref_ms']
+            limits = {'p50_ms': tolerance}
+            if p95_tolerance is not None:
+                limits['p95_ms'] = p95_tolerance
+            for key, key_tolerance in limits.items():
+                expected = base[key] * speed
+                limit = max(expected * (1 + key_tolerance), expected + MIN_DELTA_MS)
+                if stats[key] > limit:
+                    regressions.append(f"{dpi} DPI {name} {key}: {stats[key]:.2f} > {limit:.2f} "
+                                       f"(baseline {base[key]:.2f}, máquina x{speed:.2f})")
+
+            limit = max(base['peak_kb'] * (1 + mem_tolerance), base['peak_kb'] + MIN_DELTA_KB)
+            if stats['peak_kb'] > limit:
+                regressions.append(f"{dpi} DPI {name} peak_kb: {stats['peak_kb']:.1f} > {limit:.1f} "
+                                   f"(baseline {base['peak_kb']:.1f})")
+    return regressions
+
+
+# ============================================================
+# MAIN
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark por estágio do pipeline OMR')
+    parser.add_argument('--dpi', type=int, nargs='+', default=DEFAULT_DPIS, help='DPIs do corpus')
+    parser.add_argument('--sheets', type=int, default=DEFAULT_SHEETS, help='Folhas por DPI')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Repetições por folha')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Semente do corpus')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'omr_bench_corpus'),
+                        help='Onde o corpus é gerado/reaproveitado')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES),
+                        help='Estágios a medir (padrão: todos)')
+    parser.add_argument('--output', help='Grava o resultado em JSON')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Grava o resultado como novo baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='Compara com o baseline e falha em regressão')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='Piora máxima do p50 (fração, padrão: 0.3 = 30%%)')
+    parser.add_argument('--p95-tolerance', type=float,
+                        help='Também compara o p95, com esta piora máxima (padrão: não compara)')
+    parser.add_argument('--absolute', action='store_true',
+                        help='Compara a latência sem escalar pela carga de referência')
+    parser.add_argument('--mem-tolerance', type=float, default=0.2,
+                        help='Piora máxima do pico de memória (fração, padrão: 0.2)')
+    args = parser.parse_args()
+
+    # Os leitores logam cada folha em INFO
+    logging.disable(logging.INFO)
+
+    print(f"Benchmark OMR: {args.sheets} folhas x {args.repeat} repetições, DPIs {args.dpi}")
+    current = run_benchmark(args.dpi, args.sheets, args.repeat, args.seed, args.corpus_dir, args.stages)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2)
+            print(f"Resultado gravado em {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('format') != BENCHMARK_FORMAT:
+            print(f"\n❌ {args.baseline} foi gerado por outra versão do benchmark: "
+                  f"regere com --save-baseline")
+            sys.exit(2)
+        regressions = compare(current, baseline, args.tolerance, args.mem_tolerance, args.absolute,
+                              args.p95_tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressões em relação a {args.baseline}:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"\n✅ Nenhuma regressão em relação a {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,22 +8,47 @@ Coordenadas calibradas para o template XTRI original.
 Uso:
     python gabarito_generator.py --csv alunos.csv --output gabaritos.pdf --dia 1
 
+    # Corpus de "scans" sintéticos (imagem + gabarito esperado por folha)
+    python gabarito_generator.py --scans corpus/ --count 500 --dpi 200 --seed 42
+
+    # Rede inteira: blocos de alunos renderizados em paralelo, um PDF por escola
+    python gabarito_generator.py --csv rede.csv --output gabaritos.pdf --workers 8 --split-by escola
+
 CSV esperado (separador ;):
     MATRICULA;NOME;TURMA
     101018;JOSE ABRAHAN LEOPOLDINO DA SILVA FILHO;EM3VA
     ...
 
+    Coluna ESCOLA opcional (usada por --split-by escola).
+
+Corpus sintético (--scans): cada folha é rasterizada no DPI pedido e
+recebe defeitos de digitalização (rotação, perspectiva, blur, compressão
+JPEG) e de preenchimento (marcações fracas, rasuras apagadas, duplas
+marcações, questões em branco). Para cada imagem é gravado um .json com
+as respostas esperadas do leitor (null = em branco ou dupla marcação) e
+os parâmetros aplicados; corpus.json lista todas as folhas. Com o mesmo
+--seed o corpus é idêntico.
+
 Autor: Claude para Xandão/XTRI
 Data: Janeiro 2026
 """
 
 import csv
+import os
+import re
+import math
 import random
+import shutil
 import string
 import sys
+import tempfile
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from io import BytesIO
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, Iterator, List, Dict, Optional, Tuple
 import argparse
+import json
 
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
@@ -31,6 +56,9 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.colors import black, white, gray
 import qrcode
 
+if TYPE_CHECKING:
+    import numpy as np  # só nas anotações; importado de fato em _scan_modules
+
 
 # ============================================================
 # CONFIGURAÇÃO DO TEMPLATE XTRI
@@ -76,21 +104,27 @@ NUM_QUESTIONS = 90
 QUESTIONS_PER_COLUMN = 15
 NUM_COLUMNS = 6
 
+# Estilos de marcação (corpus sintético)
+MARK_FILLED = 'filled'   # caneta preta
+MARK_LIGHT = 'light'     # marcação fraca (lápis, caneta falhando)
+MARK_ERASED = 'erased'   # resíduo de borracha (não é resposta)
+MARK_GRAY = {MARK_LIGHT: 0.45, MARK_ERASED: 0.82}  # tom do preenchimento (0 = preto)
+
 
 # ============================================================
 # FUNÇÕES AUXILIARES
 # ============================================================
 
-def generate_sheet_code() -> str:
-    """Gera código único do gabarito: XTRI-XXXXXX"""
+def generate_sheet_code(rng=random) -> str:
+    """Gera código único do gabarito: XTRI-XXXXXX (rng: random.Random ou o módulo random)"""
     chars = string.ascii_uppercase + string.digits
-    random_part = ''.join(random.choice(chars) for _ in range(6))
+    random_part = ''.join(rng.choice(chars) for _ in range(6))
     return f"XTRI-{random_part}"
 
 
-def generate_random_answers() -> List[str]:
+def generate_random_answers(rng=random) -> List[str]:
     """Gera 90 respostas aleatórias (A-E)"""
-    return [random.choice(OPTIONS) for _ in range(NUM_QUESTIONS)]
+    return [rng.choice(OPTIONS) for _ in range(NUM_QUESTIONS)]
 
 
 def px_to_pt_x(px: float) -> float:
@@ -201,8 +235,15 @@ def draw_markers(c: canvas.Canvas):
                marker_size_pt, marker_size_pt, fill=1, stroke=0)
 
 
-def draw_bubble_grid(c: canvas.Canvas, answers: List[str]):
-    """Desenha o grid de bolhas com as respostas preenchidas"""
+def draw_bubble_grid(c: canvas.Canvas, answers: List[Optional[str]],
+                     marks: Optional[Dict[int, Dict[str, str]]] = None):
+    """
+    Desenha o grid de bolhas com as respostas preenchidas.
+
+    marks (opcional) define o estilo de cada bolha marcada por questão,
+    ex. {12: {'B': 'light'}, 30: {'A': 'filled', 'D': 'filled'}}; as
+    questões fora de marks usam a resposta de answers.
+    """
 
     bubble_r_pt = px_to_pt_x(BUBBLE_RADIUS)
 
@@ -239,7 +280,22 @@ def draw_bubble_grid(c: canvas.Canvas, answers: List[str]):
                 cx = px_to_pt_x(x)
                 cy = px_to_pt_y(y)
 
-                if opt == answer:
+                style = marks[q_num].get(opt) if marks and q_num in marks \
+                    else (MARK_FILLED if opt == answer else None)
+
+                if style in MARK_GRAY:
+                    # Marcação fraca ou resíduo de borracha: bolha vazia com
+                    # preenchimento cinza por cima
+                    c.setStrokeColor(black)
+                    c.setFillColor(white)
+                    c.setLineWidth(0.5)
+                    c.circle(cx, cy, bubble_r_pt, fill=1, stroke=1)
+                    c.setFillColor(black)
+                    c.setFont("Helvetica-Bold", 7)
+                    c.drawCentredString(cx, cy - 2.5, opt)
+                    c.setFillGray(MARK_GRAY[style])
+                    c.circle(cx, cy, bubble_r_pt * 0.9, fill=1, stroke=0)
+                elif style == MARK_FILLED:
                     # Bolha preenchida (resposta) - círculo preto com letra branca
                     c.setFillColor(black)
                     c.circle(cx, cy, bubble_r_pt, fill=1, stroke=0)
@@ -259,18 +315,19 @@ def draw_bubble_grid(c: canvas.Canvas, answers: List[str]):
                     c.drawCentredString(cx, cy - 2.5, opt)
 
 
-def generate_gabarito(c: canvas.Canvas, student: Dict, dia: int, answers: Optional[List[str]] = None):
-    """Gera uma página de gabarito completa"""
+def generate_gabarito(c: canvas.Canvas, student: Dict, dia: int, answers: Optional[List[str]] = None,
+                      marks: Optional[Dict[int, Dict[str, str]]] = None, rng=random):
+    """Gera uma página de gabarito completa (sorteios com `rng`)"""
 
-    sheet_code = generate_sheet_code()
+    sheet_code = generate_sheet_code(rng)
 
     if answers is None:
-        answers = generate_random_answers()
+        answers = generate_random_answers(rng)
 
     # Desenhar elementos
     draw_header(c, student, sheet_code, dia)
     draw_markers(c)
-    draw_bubble_grid(c, answers)
+    draw_bubble_grid(c, answers, marks)
 
     return sheet_code
 
@@ -297,44 +354,34 @@ def read_csv(filepath: str) -> List[Dict]:
             row_upper = {k.upper(): v for k, v in row.items()}
 
             students.append({
-                'matricula': row_upper.get('MATRICULA', '').strip(),
-                'nome': row_upper.get('NOME', '').strip(),
-                'turma': row_upper.get('TURMA', '').strip()
+                'matricula': (row_upper.get('MATRICULA') or '').strip(),
+                'nome': (row_upper.get('NOME') or '').strip(),
+                'turma': (row_upper.get('TURMA') or '').strip(),
+                'escola': (row_upper.get('ESCOLA') or '').strip()
             })
 
     return students
 
 
 # ============================================================
-# MAIN
+# RENDERIZAÇÃO (SEQUENCIAL E EM PARALELO)
 # ============================================================
 
-def main():
-    parser = argparse.ArgumentParser(description='Gera gabaritos digitais preenchidos')
-    parser.add_argument('--csv', required=True, help='Arquivo CSV com alunos')
-    parser.add_argument('--output', required=True, help='Arquivo PDF de saída')
-    parser.add_argument('--dia', type=int, default=1, help='Dia da prova (1 ou 2)')
-    parser.add_argument('--limit', type=int, help='Limitar número de gabaritos')
-
-    args = parser.parse_args()
+# Alunos por bloco no modo --workers
+DEFAULT_CHUNK_SIZE = 200
 
-    # Ler alunos do CSV
-    print(f"Lendo CSV: {args.csv}")
-    students = read_csv(args.csv)
-    print(f"Total de alunos: {len(students)}")
+CODE_FIELDS = ['matricula', 'nome', 'turma', 'sheet_code']
 
-    if args.limit:
-        students = students[:args.limit]
-        print(f"Limitado a: {len(students)} alunos")
 
-    # Criar PDF
-    print(f"Gerando PDF: {args.output}")
-    c = canvas.Canvas(args.output, pagesize=A4)
+def render_students(students: List[Dict], output: str, dia: int, verbose: bool = True) -> List[Dict]:
+    """Renderiza os gabaritos dos alunos num PDF. Retorna o mapeamento de códigos."""
+    c = canvas.Canvas(output, pagesize=A4)
 
     codes = []
     for i, student in enumerate(students):
-        print(f"  [{i+1}/{len(students)}] {student['nome'][:40]}...")
-        sheet_code = generate_gabarito(c, student, args.dia)
+        if verbose:
+            print(f"  [{i+1}/{len(students)}] {student['nome'][:40]}...")
+        sheet_code = generate_gabarito(c, student, dia)
         codes.append({
             'matricula': student['matricula'],
             'nome': student['nome'],
@@ -344,17 +391,417 @@ def main():
         c.showPage()
 
     c.save()
-
-    # Salvar mapeamento de códigos
-    codes_file = args.output.replace('.pdf', '_codes.csv')
+    return codes
+
+
+def _render_chunk(task: Tuple[List[Dict], str, int]) -> Tuple[List[Dict], int]:
+    """Executado nos processos do pool: renderiza um bloco num PDF temporário."""
+    students, output, dia = task
+    return render_students(students, output, dia, verbose=False), os.getpid()
+
+
+def merge_pdfs(paths: List[str], output: str):
+    """Junta os PDFs dos blocos, na ordem, num único arquivo."""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise RuntimeError("--workers requer pypdfium2 (pip install pypdfium2)")
+
+    merged = pdfium.PdfDocument.new()
+    for path in paths:
+        part = pdfium.PdfDocument(path)
+        merged.import_pages(part)
+        part.close()
+    merged.save(output)
+    merged.close()
+
+
+def chunk_size_for(total: int, workers: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Tamanho do bloco: no máximo chunk_size, e pequeno o bastante para ocupar todos os workers."""
+    return max(1, min(chunk_size, math.ceil(total / max(1, workers))))
+
+
+def render_groups_parallel(pool: ProcessPoolExecutor, groups: List[Tuple[str, List[Dict]]], dia: int,
+                           chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Renderiza um PDF por grupo (output, alunos) no mesmo pool.
+
+    Os blocos de todos os grupos são enviados de uma vez; cada PDF é montado
+    assim que os blocos do seu grupo terminam. Gera (output, codes) na ordem
+    em que os grupos ficam prontos.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='gabaritos_', dir=os.path.dirname(os.path.abspath(groups[0][0]))) \
+        if groups else None
+    try:
+        futures = {}
+        paths, results, pending = [], [], []
+        for g, (output, students) in enumerate(groups):
+            chunks = [students[i:i + chunk_size] for i in range(0, len(students), chunk_size)]
+            paths.append([os.path.join(tmp_dir, f"grupo_{g:04d}_bloco_{i:05d}.pdf") for i in range(len(chunks))])
+            results.append([None] * len(chunks))
+            pending.append(len(chunks))
+            for i, (chunk, path) in enumerate(zip(chunks, paths[g])):
+                futures[pool.submit(_render_chunk, (chunk, path, dia))] = (g, i)
+
+        total = sum(len(students) for _, students in groups)
+        done = 0
+        pids = set()
+        for future in as_completed(futures):
+            g, i = futures[future]
+            codes, pid = future.result()
+            results[g][i] = codes
+            pids.add(pid)
+            done += len(codes)
+            pending[g] -= 1
+            print(f"  [{done}/{total}] {os.path.basename(groups[g][0])} bloco {i+1}/{len(results[g])} pronto")
+
+            if pending[g] == 0:
+                output = groups[g][0]
+                merge_pdfs(paths[g], output)
+                yield output, [code for chunk_codes in results[g] for code in chunk_codes]
+
+        print(f"  {len(futures)} blocos renderizados em {len(pids)} processos")
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def render_parallel(pool: ProcessPoolExecutor, students: List[Dict], output: str, dia: int,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[Dict]:
+    """
+    Divide os alunos em blocos, renderiza cada bloco num processo do pool
+    e junta os PDFs na ordem original.
+    """
+    rendered = list(render_groups_parallel(pool, [(output, students)], dia, chunk_size))
+    return rendered[0][1] if rendered else []
+
+
+def split_students(students: List[Dict], split_by: Optional[str]) -> 'OrderedDict[Optional[str], List[Dict]]':
+    """Agrupa os alunos por turma ou escola (ordem da primeira ocorrência)."""
+    groups = OrderedDict()
+    if not split_by:
+        groups[None] = students
+        return groups
+
+    for student in students:
+        groups.setdefault(student[split_by] or 'SEM_' + split_by.upper(), []).append(student)
+    return groups
+
+
+def group_output_path(output: str, group: Optional[str]) -> str:
+    """gabaritos.pdf + 'EM3VA' -> gabaritos_EM3VA.pdf ('Escola São José' -> Escola_Sao_Jose, '3º A' -> 3o_A)"""
+    if group is None:
+        return output
+    stem, ext = os.path.splitext(output)
+    ascii_group = unicodedata.normalize('NFKD', group).encode('ascii', 'ignore').decode('ascii')
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '_', ascii_group).strip('_') or 'grupo'
+    return f"{stem}_{slug}{ext or '.pdf'}"
+
+
+def group_jobs(output: str, groups: Dict[Optional[str], List[Dict]]) -> List[Tuple[str, List[Dict]]]:
+    """
+    [(pdf, alunos)] de cada grupo. Grupos cujo nome vira o mesmo arquivo
+    ('3 A' e '3-A', ou só diferindo em maiúsculas) ganham sufixo _2, _3...,
+    senão um sobrescreveria o PDF e os códigos do outro.
+    """
+    jobs = []
+    used = set()
+    for group, group_students in groups.items():
+        path = group_output_path(output, group)
+        stem, ext = os.path.splitext(path)
+        n = 1
+        while path.lower() in used:
+            n += 1
+            path = f"{stem}_{n}{ext}"
+        if n > 1:
+            print(f"⚠️  Grupo {group!r} gravado em {path} (nome de arquivo repetido)")
+        used.add(path.lower())
+        jobs.append((path, group_students))
+    return jobs
+
+
+def write_codes(codes: List[Dict], output: str) -> str:
+    """Salva o mapeamento aluno -> sheet_code ao lado do PDF."""
+    codes_file = output.replace('.pdf', '_codes.csv')
     with open(codes_file, 'w', encoding='utf-8', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=['matricula', 'nome', 'turma', 'sheet_code'], delimiter=';')
+        writer = csv.DictWriter(f, fieldnames=CODE_FIELDS, delimiter=';')
         writer.writeheader()
         writer.writerows(codes)
+    return codes_file
+
+
+# ============================================================
+# CORPUS SINTÉTICO (SCANS)
+# ============================================================
+
+DEFAULT_SCAN_OPTIONS = {
+    'dpi': 150,
+    'dia': 1,
+    'seed': 0,
+    'rotation': 2.0,       # graus (máximo, sorteado em ±)
+    'skew': 0.01,          # deslocamento máximo dos cantos (fração do tamanho da página)
+    'blur': 1.0,           # sigma máximo do blur gaussiano (em 150 DPI)
+    'jpeg_quality': 75,    # 0 = PNG sem perdas
+    'blank_rate': 0.05,    # fração das questões de cada tipo
+    'double_rate': 0.02,
+    'light_rate': 0.05,
+    'erase_rate': 0.03,
+}
+
+
+def plan_marks(rng: random.Random, options: Dict) -> Tuple[List[Optional[str]], Dict[int, Dict[str, str]], Dict[str, Dict]]:
+    """
+    Sorteia o preenchimento das 90 questões.
+
+    Returns:
+        (esperadas, marks, defeitos) - resposta esperada do leitor por questão
+        (None = em branco ou dupla marcação), estilos para draw_bubble_grid e
+        as questões com defeito {'12': {'kind': 'light', 'options': ['B']}}
+    """
+    expected, marks, defects = [], {}, {}
+
+    # Limites acumulados de cada tipo em [0, 1)
+    blank = options['blank_rate']
+    double = blank + options['double_rate']
+    light = double + options['light_rate']
+    erased = light + options['erase_rate']
+
+    for q_num in range(1, NUM_QUESTIONS + 1):
+        answer = rng.choice(OPTIONS)
+        other = rng.choice([opt for opt in OPTIONS if opt != answer])
+        r = rng.random()
+
+        if r < blank:
+            kind, styles, answer = 'blank', {}, None
+        elif r < double:
+            kind, styles, answer = 'double', {answer: MARK_FILLED, other: MARK_FILLED}, None
+        elif r < light:
+            kind, styles = 'light', {answer: MARK_LIGHT}
+        elif r < erased:
+            kind, styles = 'erased', {answer: MARK_FILLED, other: MARK_ERASED}
+        else:
+            kind, styles = None, {answer: MARK_FILLED}
+
+        expected.append(answer)
+        marks[q_num] = styles
+        if kind:
+            defects[str(q_num)] = {'kind': kind, 'options': sorted(styles)}
+
+    return expected, marks, defects
+
+
+def _scan_modules():
+    """cv2 e numpy, importados só para --scans (o CSV -> PDF não precisa deles)."""
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        raise RuntimeError("--scans requer opencv-python (pip install opencv-python-headless)")
+    return cv2, np
+
+
+def degrade_scan(gray: 'np.ndarray', rng: 'np.random.Generator', options: Dict) -> Tuple['np.ndarray', Dict]:
+    """
+    Aplica defeitos de digitalização: rotação + perspectiva (uma única
+    homografia) e blur. Retorna a imagem e os valores sorteados.
+    """
+    cv2, np = _scan_modules()
+    h, w = gray.shape
+    scale = options['dpi'] / 150
+
+    angle = float(rng.uniform(-options['rotation'], options['rotation']))
+    rotation = np.vstack([cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0), [0, 0, 1]])
+
+    corners = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    jitter = rng.uniform(-options['skew'], options['skew'], size=(4, 2)) * [w, h]
+    perspective = cv2.getPerspectiveTransform(corners, np.float32(corners + jitter))
+
+    out = cv2.warpPerspective(gray, perspective @ rotation, (w, h),
+                              flags=cv2.INTER_LINEAR, borderValue=255)
+
+    sigma = float(rng.uniform(0, options['blur']))
+    if sigma > 0.05:
+        out = cv2.GaussianBlur(out, (0, 0), sigma * scale)
+
+    applied = {
+        'rotation': round(angle, 3),
+        'skew_px': np.round(jitter, 1).tolist(),
+        'blur_sigma': round(sigma, 3),
+        'jpeg_quality': options['jpeg_quality'] or None
+    }
+    return out, applied
+
+
+def render_scan(task: Tuple[int, Dict, str, Dict]) -> Dict:
+    """
+    Gera uma folha do corpus: PDF em memória -> raster no DPI pedido ->
+    defeitos -> imagem + .json com o gabarito esperado.
+    Executado nos processos do pool; a semente é derivada do índice.
+    """
+    cv2, np = _scan_modules()
+    from pdf_rasterizer import iter_pdf_pages
+
+    index, student, out_dir, options = task
+    seed = options['seed'] * 1_000_003 + index
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+
+    expected, marks, mark_defects = plan_marks(rng, options)
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    sheet_code = generate_gabarito(c, student, options['dia'], expected, marks, rng=rng)
+    c.showPage()
+    c.save()
+
+    _, gray = next(iter_pdf_pages(buffer.getvalue(), dpi=options['dpi']))
+    scan, applied = degrade_scan(gray, np_rng, options)
+
+    name = f"sheet_{index + 1:05d}"
+    if options['jpeg_quality']:
+        image_name = name + '.jpg'
+        cv2.imwrite(os.path.join(out_dir, image_name), scan,
+                    [cv2.IMWRITE_JPEG_QUALITY, int(options['jpeg_quality'])])
+    else:
+        image_name = name + '.png'
+        cv2.imwrite(os.path.join(out_dir, image_name), scan)
+
+    truth = {
+        'image': image_name,
+        'sheet_code': sheet_code,
+        'matricula': student['matricula'],
+        'dia': options['dia'],
+        'dpi': options['dpi'],
+        'seed': seed,
+        'scan': applied,
+        'answers': {str(q): ans for q, ans in enumerate(expected, 1)},
+        'marks': mark_defects
+    }
+    with open(os.path.join(out_dir, name + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(truth, f, ensure_ascii=False, indent=1)
+
+    return {'image': image_name, 'truth': name + '.json', 'sheet_code': sheet_code}
+
+
+def synthetic_students(count: int) -> List[Dict]:
+    """Alunos fictícios para o corpus quando não há --csv."""
+    return [{'matricula': f"{900000 + i}", 'nome': f"ALUNO SINTETICO {i + 1:05d}",
+             'turma': f"T{i % 10 + 1:02d}", 'escola': ''} for i in range(count)]
+
+
+def generate_scan_corpus(students: List[Dict], out_dir: str, options: Dict,
+                         pool: Optional[ProcessPoolExecutor] = None) -> str:
+    """Gera o corpus em out_dir (uma imagem + .json por aluno). Retorna o caminho do corpus.json."""
+    _scan_modules()  # falha antes de criar o diretório ou subir o pool
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(i, student, out_dir, options) for i, student in enumerate(students)]
+
+    results = pool.map(render_scan, tasks, chunksize=8) if pool is not None else map(render_scan, tasks)
+    sheets = []
+    for sheet in results:
+        sheets.append(sheet)
+        if len(sheets) % 50 == 0 or len(sheets) == len(tasks):
+            print(f"  [{len(sheets)}/{len(tasks)}] {sheet['image']}")
+
+    manifest = os.path.join(out_dir, 'corpus.json')
+    with open(manifest, 'w', encoding='utf-8') as f:
+        json.dump({'options': options, 'sheets': sheets}, f, ensure_ascii=False, indent=1)
+    return manifest
+
+
+# ============================================================
+# MAIN
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera gabaritos digitais preenchidos')
+    parser.add_argument('--csv', help='Arquivo CSV com alunos')
+    parser.add_argument('--output', help='Arquivo PDF de saída')
+    parser.add_argument('--dia', type=int, default=1, help='Dia da prova (1 ou 2)')
+    parser.add_argument('--limit', type=int, help='Limitar número de gabaritos')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processos em paralelo (blocos de alunos; 1 = sequencial)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Alunos por bloco no modo --workers (padrão: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--split-by', choices=['turma', 'escola'],
+                        help='Um PDF (e um CSV de códigos) por turma ou escola')
+
+    scans = parser.add_argument_group('corpus sintético (--scans)')
+    scans.add_argument('--scans', metavar='DIR', help='Gera imagens "escaneadas" + gabarito esperado em DIR')
+    scans.add_argument('--count', type=int, default=100, help='Folhas do corpus sem --csv (padrão: 100)')
+    scans.add_argument('--dpi', type=int, default=150, help='Resolução das imagens (padrão: 150)')
+    scans.add_argument('--seed', type=int, default=0, help='Semente (mesmo seed = mesmo corpus)')
+    scans.add_argument('--rotation', type=float, default=2.0, help='Rotação máxima em graus (padrão: 2.0)')
+    scans.add_argument('--skew', type=float, default=0.01,
+                       help='Perspectiva: deslocamento máximo dos cantos, fração da página (padrão: 0.01)')
+    scans.add_argument('--blur', type=float, default=1.0, help='Sigma máximo do blur (padrão: 1.0)')
+    scans.add_argument('--jpeg-quality', type=int, default=75, help='Qualidade JPEG; 0 = PNG (padrão: 75)')
+    scans.add_argument('--blank-rate', type=float, default=0.05, help='Fração de questões em branco')
+    scans.add_argument('--double-rate', type=float, default=0.02, help='Fração de duplas marcações')
+    scans.add_argument('--light-rate', type=float, default=0.05, help='Fração de marcações fracas')
+    scans.add_argument('--erase-rate', type=float, default=0.03, help='Fração de rasuras apagadas')
+
+    args = parser.parse_args()
+    if not args.scans and not (args.csv and args.output):
+        parser.error('--csv e --output são obrigatórios (ou use --scans DIR)')
+
+    # Ler alunos do CSV
+    if args.csv:
+        print(f"Lendo CSV: {args.csv}")
+        students = read_csv(args.csv)
+        print(f"Total de alunos: {len(students)}")
+    else:
+        students = synthetic_students(args.count)
+
+    if args.limit:
+        students = students[:args.limit]
+        print(f"Limitado a: {len(students)} alunos")
+
+    if args.scans:
+        options = {name: getattr(args, name) for name in DEFAULT_SCAN_OPTIONS}
+        print(f"Gerando corpus: {args.scans} ({len(students)} folhas, {options['dpi']} DPI)")
+        pool = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+        try:
+            manifest = generate_scan_corpus(students, args.scans, options, pool)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        print(f"\nConcluído!\n  Corpus: {manifest}")
+        return
+
+    groups = split_students(students, args.split_by)
+
+    # random.seed no initializer: com fork, os processos herdariam o mesmo
+    # estado do gerador e repetiriam os sheet_codes
+    pool = ProcessPoolExecutor(max_workers=args.workers, initializer=random.seed) \
+        if args.workers > 1 else None
+
+    jobs = group_jobs(args.output, groups)
+    outputs = {}
+    try:
+        if pool is not None:
+            # Blocos de todas as turmas/escolas no pool de uma vez: com grupos
+            # pequenos, um grupo por vez ocuparia um único processo
+            chunk_size = chunk_size_for(len(students), args.workers, args.chunk_size)
+            print(f"Gerando {len(jobs)} PDF(s) em {args.workers} processos (blocos de até {chunk_size} alunos)")
+            for output, codes in render_groups_parallel(pool, jobs, args.dia, chunk_size):
+                outputs[output] = write_codes(codes, output)
+        else:
+            for output, group_students in jobs:
+                # Criar PDF
+                print(f"Gerando PDF: {output} ({len(group_students)} alunos)")
+                codes = render_students(group_students, output, args.dia)
+
+                # Salvar mapeamento de códigos
+                outputs[output] = write_codes(codes, output)
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
     print(f"\nConcluído!")
-    print(f"  PDF: {args.output}")
-    print(f"  Códigos: {codes_file}")
+    for output, _ in jobs:
+        print(f"  PDF: {output}")
+        print(f"  Códigos: {outputs[output]}")
     print(f"  Total de gabaritos: {len(students)}")
 
 
@@ -0,0 +1,31 @@
+# =============================================================================
+# GabaritAI OMR Service - configuração do gunicorn
+# =============================================================================
+# Carregado automaticamente pelo gunicorn (./gunicorn.conf.py). Threads e
+# bind continuam no CMD do Dockerfile.
+#
+# Workers vêm de WEB_CONCURRENCY, a mesma variável que o app usa para
+# dividir os núcleos entre os pools OMR de cada worker (OMR_POOL_WORKERS).
+#
+# Métricas em modo multiprocess (PROMETHEUS_MULTIPROC_DIR): o diretório é
+# limpo ao iniciar o master e os arquivos de cada worker encerrado são
+# descartados (ver omr_metrics.py).
+# =============================================================================
+
+import os
+import glob
+
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+
+def on_starting(server):
+    metrics_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    from omr_metrics import mark_process_dead
+    mark_process_dead(worker.pid)
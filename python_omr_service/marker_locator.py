@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Marker Locator
+==============
+
+Localização dos marcadores quadrados pretos do gabarito em pirâmide.
+
+Em vez de binarizar e buscar contornos na página inteira em resolução
+cheia (~8.7 MP a 300 DPI), os candidatos são encontrados numa versão
+reduzida (1/4 ou 1/8, conforme o DPI) e cada centro é refinado numa
+janela pequena da imagem original. O custo fica praticamente constante
+quando o DPI do scanner aumenta.
+
+Usado por xtri_gabarito_reader.find_grid_markers e app.find_corner_markers.
+
+Autor: GabaritAI / X-TRI
+"""
+
+import cv2
+import numpy as np
+from typing import Dict, List, Tuple
+
+from sheet_context import SheetContext
+
+# Largura mínima (px) do nível reduzido da pirâmide. Com ~300 px os
+# marcadores de 32 px (150 DPI) ainda ficam com ~8 px no nível grosso.
+PYRAMID_TARGET_WIDTH = 300
+PYRAMID_MAX_FACTOR = 8
+
+
+def pyramid_factor(width: int) -> int:
+    """Fator de redução (1, 2, 4 ou 8) para a largura da imagem."""
+    factor = 1
+    while factor < PYRAMID_MAX_FACTOR and width / (factor * 2) >= PYRAMID_TARGET_WIDTH:
+        factor *= 2
+    return factor
+
+
+def _square_contours(binary: np.ndarray, min_area: float, max_area: float,
+                     aspect_range: Tuple[float, float], min_vertices: int,
+                     offset: Tuple[int, int] = (0, 0)) -> List[Dict]:
+    """Filtra contornos externos quase quadrados dentro da faixa de área."""
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    ox, oy = offset
+    h, w = binary.shape
+
+    squares = []
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if area <= min_area or area >= max_area:
+            continue
+
+        x, y, cw, ch = cv2.boundingRect(cnt)
+        aspect = cw / ch if ch > 0 else 0
+        if not aspect_range[0] < aspect < aspect_range[1]:
+            continue
+
+        if min_vertices:
+            peri = cv2.arcLength(cnt, True)
+            approx = cv2.approxPolyDP(cnt, 0.04 * peri, True)
+            if len(approx) < min_vertices:
+                continue
+
+        squares.append({
+            'center': (ox + x + cw // 2, oy + y + ch // 2),
+            'area': area,
+            'bbox': (ox + x, oy + y, cw, ch),
+            'touches_border': x == 0 or y == 0 or x + cw >= w or y + ch >= h
+        })
+
+    return squares
+
+
+def find_square_markers(gray: np.ndarray, threshold: int, min_area: float, max_area: float,
+                        aspect_range: Tuple[float, float] = (0.7, 1.4),
+                        min_vertices: int = 0) -> List[Dict]:
+    """
+    Encontra marcadores quadrados escuros (coarse-to-fine).
+
+    Args:
+        gray: Imagem em escala de cinza (resolução cheia) ou SheetContext,
+            que fornece o nível reduzido e a binarização memorizados
+        threshold: Limiar de binarização (pixels abaixo são "tinta")
+        min_area, max_area: Faixa de área do contorno em resolução cheia
+        aspect_range: Faixa aceita de largura/altura do bounding box
+        min_vertices: Mínimo de vértices do polígono aproximado (0 = não verifica)
+
+    Returns:
+        Lista de dicts com 'center', 'area' e 'bbox' em coordenadas da imagem
+        original, com os mesmos critérios de uma busca em resolução cheia
+    """
+    ctx = SheetContext.of(gray)
+    gray = ctx.gray
+    h, w = gray.shape
+    factor = pyramid_factor(w)
+
+    if factor > 1:
+        # Decimação simples (sem filtro): só toca 1/factor² dos pixels, e o
+        # interior sólido dos marcadores sobrevive intacto
+        small = ctx.decimated(factor)
+        _, binary = cv2.threshold(small, threshold, 255, cv2.THRESH_BINARY_INV)
+
+        # Nível grosso: filtro de área folgado (bordas perdem/ganham pixels na decimação)
+        f2 = factor * factor
+        coarse = _square_contours(binary, min_area / f2 * 0.5, max_area / f2 * 1.5,
+                                  (aspect_range[0] * 0.8, aspect_range[1] * 1.25), 0)
+
+        markers = []
+        seen = set()
+        for cand in coarse:
+            cx, cy, cw, ch = cand['bbox']
+            pad = max(cw, ch) * factor // 2 + 2 * factor
+            x1 = max(0, cx * factor - pad)
+            y1 = max(0, cy * factor - pad)
+            x2 = min(w, (cx + cw) * factor + pad)
+            y2 = min(h, (cy + ch) * factor + pad)
+
+            _, window = cv2.threshold(gray[y1:y2, x1:x2], threshold, 255, cv2.THRESH_BINARY_INV)
+            for sq in _square_contours(window, min_area, max_area, aspect_range,
+                                       min_vertices, offset=(x1, y1)):
+                # Contorno cortado pela janela continua fora dela: na página
+                # inteira ele seria maior e reprovado no filtro de área
+                if sq.pop('touches_border') or sq['center'] in seen:
+                    continue
+                seen.add(sq['center'])
+                markers.append(sq)
+
+        if len(markers) >= 4:
+            return markers
+
+    # Resolução cheia: imagens pequenas ou quando o nível grosso não basta
+    squares = _square_contours(ctx.binary(threshold), min_area, max_area, aspect_range, min_vertices)
+    for sq in squares:
+        del sq['touches_border']
+    return squares
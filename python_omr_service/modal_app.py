@@ -23,6 +23,15 @@ image = (
         "requests",
     )
     .add_local_file("app.py", "/app/app.py")
+    .add_local_file("marker_locator.py", "/app/marker_locator.py")
+    .add_local_file("sheet_context.py", "/app/sheet_context.py")
+    .add_local_file("batch_jobs.py", "/app/batch_jobs.py")
+    .add_local_file("pdf_rasterizer.py", "/app/pdf_rasterizer.py")
+    .add_local_file("result_writer.py", "/app/result_writer.py")
+    .add_local_file("student_cache.py", "/app/student_cache.py")
+    .add_local_file("sheet_pdf.py", "/app/sheet_pdf.py")
+    .add_local_file("pdf_cache.py", "/app/pdf_cache.py")
+    .add_local_file("omr_metrics.py", "/app/omr_metrics.py")
 )
 
 
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+OMR Metrics
+===========
+
+Métricas Prometheus do serviço OMR (/metrics).
+
+    omr_stage_seconds{stage}              histograma por estágio da leitura
+                                          (decode, gray, qr, markers, bubbles,
+                                          sampling, decision, fallback)
+    omr_request_seconds{endpoint}         histograma de latência por endpoint
+    omr_requests_in_flight{endpoint}      requisições em andamento
+    omr_reads_total{method, detection}    leituras por caminho: hough/legacy e
+                                          bolhas via template/hough
+    omr_qr_total{method}                  QR lido por método (roi, full, ...,
+                                          none = não encontrado)
+    omr_failures_total{endpoint, code}    falhas por código (QR_NOT_FOUND, ...)
+
+Com vários workers do gunicorn, defina PROMETHEUS_MULTIPROC_DIR (diretório
+vazio e gravável): cada processo grava suas métricas lá e /metrics agrega
+todos. O gunicorn.conf.py limpa o diretório no início e descarta os
+workers encerrados.
+
+Sem prometheus_client instalado as funções de registro não fazem nada e
+/metrics responde 501.
+
+Autor: GabaritAI / X-TRI
+"""
+
+import os
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter,
+                                   Gauge, Histogram, generate_latest, multiprocess)
+    HAS_PROMETHEUS = True
+except ImportError:
+    HAS_PROMETHEUS = False
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR', '')
+
+# Estágios da leitura: milissegundos a centenas de ms
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Requisições: de uma folha (~50 ms) a lotes e PDFs inteiros (minutos)
+REQUEST_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+if HAS_PROMETHEUS:
+    STAGE_SECONDS = Histogram('omr_stage_seconds', 'Duração de cada estágio da leitura OMR',
+                              ['stage'], buckets=STAGE_BUCKETS)
+    REQUEST_SECONDS = Histogram('omr_request_seconds', 'Latência das requisições por endpoint',
+                                ['endpoint'], buckets=REQUEST_BUCKETS)
+    IN_FLIGHT = Gauge('omr_requests_in_flight', 'Requisições em andamento por endpoint',
+                      ['endpoint'], multiprocess_mode='livesum')
+    READS = Counter('omr_reads_total', 'Folhas lidas por caminho do OMR', ['method', 'detection'])
+    QR_READS = Counter('omr_qr_total', 'Leituras de QR Code por método', ['method'])
+    FAILURES = Counter('omr_failures_total', 'Falhas por código de erro', ['endpoint', 'code'])
+
+
+def observe_stages(stages: Optional[Dict[str, float]]) -> None:
+    """Registra as durações por estágio ({'markers': 1.4, ...} em ms)."""
+    if not HAS_PROMETHEUS or not stages:
+        return
+    for stage, ms in stages.items():
+        STAGE_SECONDS.labels(stage=stage).observe(ms / 1000)
+
+
+def record_omr(result: Dict[str, Any]) -> None:
+    """Registra uma leitura do process_omr: caminho usado e durações por estágio."""
+    if not HAS_PROMETHEUS:
+        return
+    READS.labels(method=result.get('method') or 'unknown',
+                 detection=result.get('detection') or 'none').inc()
+    observe_stages(result.get('stages'))
+
+
+def record_qr(method: Optional[str]) -> None:
+    """Registra o método que leu o QR (None = não encontrado)."""
+    if HAS_PROMETHEUS:
+        QR_READS.labels(method=method or 'none').inc()
+
+
+def record_failure(endpoint: str, code: Optional[str]) -> None:
+    if HAS_PROMETHEUS:
+        FAILURES.labels(endpoint=endpoint, code=code or 'UNKNOWN').inc()
+
+
+def request_started(endpoint: str) -> None:
+    if HAS_PROMETHEUS:
+        IN_FLIGHT.labels(endpoint=endpoint).inc()
+
+
+def request_finished(endpoint: str, seconds: float) -> None:
+    if HAS_PROMETHEUS:
+        IN_FLIGHT.labels(endpoint=endpoint).dec()
+        REQUEST_SECONDS.labels(endpoint=endpoint).observe(seconds)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Corpo e content-type do /metrics (agregando os processos no modo multiprocess)."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Descarta os gauges de um worker encerrado (hook child_exit do gunicorn)."""
+    if HAS_PROMETHEUS and PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
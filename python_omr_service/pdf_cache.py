@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+PDF Cache
+=========
+
+Cache em disco dos PDFs de gabaritos de um lote (/api/download-pdf).
+
+A chave é o batch_id mais um hash da lista de alunos (e da versão do
+renderizador), então qualquer mudança nos alunos gera uma chave nova e o
+arquivo antigo do lote é descartado. O primeiro download é enviado em
+streaming enquanto é gravado no cache; os seguintes saem direto do disco
+com send_file (sendfile/zero-copy quando o servidor suporta).
+
+O tamanho total é limitado por PDF_CACHE_MAX_MB; os arquivos acessados há
+mais tempo saem primeiro.
+
+Uso:
+    digest = students_digest(students)
+    path = cached_pdf_path(batch_id, digest)
+    if path:
+        return send_file(path, ...)
+    return Response(store_pdf(batch_id, digest, iter_batch_pdf(students)), ...)
+
+Autor: GabaritAI / X-TRI
+"""
+
+import os
+import re
+import json
+import glob
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Iterator, List, Optional
+
+from sheet_pdf import RENDER_VERSION
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'omr_pdf_cache'))
+PDF_CACHE_MAX_MB = int(os.getenv('PDF_CACHE_MAX_MB', 512))
+
+# Campos dos alunos que aparecem no PDF
+_STUDENT_FIELDS = ('sheet_code', 'student_name', 'enrollment_code', 'class_name')
+
+_SAFE_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def students_digest(students: List[Dict]) -> str:
+    """Hash do conteúdo do PDF: alunos (na ordem das páginas) e versão do renderizador."""
+    payload = [RENDER_VERSION] + [[s.get(f) for f in _STUDENT_FIELDS] for s in students]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()[:24]
+
+
+def _pdf_path(batch_id: str, digest: str) -> Optional[str]:
+    if not _SAFE_ID.match(batch_id):
+        return None
+    return os.path.join(PDF_CACHE_DIR, f"{batch_id}.{digest}.pdf")
+
+
+def cached_pdf_path(batch_id: str, digest: str) -> Optional[str]:
+    """Caminho do PDF em cache para o conteúdo atual do lote, ou None."""
+    path = _pdf_path(batch_id, digest)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        os.utime(path)  # marca como usado recentemente (eviction por mtime)
+    except OSError:
+        return None
+    return path
+
+
+def store_pdf(batch_id: str, digest: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """
+    Repassa os pedaços do PDF e grava uma cópia no cache.
+
+    O arquivo só entra no cache se o PDF for gerado até o fim; versões
+    anteriores do mesmo lote são removidas.
+    """
+    path = _pdf_path(batch_id, digest)
+    if path is None:
+        yield from chunks
+        return
+
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=PDF_CACHE_DIR, suffix='.tmp')
+        out = os.fdopen(fd, 'wb')
+    except OSError as e:
+        logger.warning(f"PDF cache disabled for batch {batch_id}: {e}")
+        yield from chunks
+        return
+
+    complete = False
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            yield chunk
+        complete = True
+    finally:
+        out.close()
+        if complete:
+            invalidate_batch(batch_id)
+            os.replace(tmp, path)
+            _evict()
+        else:
+            os.remove(tmp)
+
+
+def invalidate_batch(batch_id: str) -> None:
+    """Remove todos os PDFs em cache do lote."""
+    if not _SAFE_ID.match(batch_id):
+        return
+    for path in glob.glob(os.path.join(PDF_CACHE_DIR, f"{batch_id}.*.pdf")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _evict() -> None:
+    """Remove os PDFs usados há mais tempo até o cache caber em PDF_CACHE_MAX_MB."""
+    entries = []
+    for path in glob.glob(os.path.join(PDF_CACHE_DIR, '*.pdf')):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    limit = PDF_CACHE_MAX_MB * 1024 * 1024
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            logger.info(f"PDF cache evicted {os.path.basename(path)}")
+        except OSError:
+            pass
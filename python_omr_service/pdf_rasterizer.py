@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+PDF Rasterizer
+==============
+
+Rasterização de PDFs de várias páginas (ex.: um PDF de scanner com 200+
+gabaritos) direto para grayscale na resolução dos leitores.
+
+O documento é aberto uma única vez e as páginas são geradas uma a uma,
+para que a leitura OMR de uma página rode enquanto a próxima é renderizada.
+
+Backends:
+    - pypdfium2 (preferido): renderização no próprio processo, sem abrir
+      um poppler por página
+    - pdf2image (fallback): poppler em blocos de PDF_FALLBACK_CHUNK páginas
+
+Uso:
+    for page, gray in iter_pdf_pages('gabaritos.pdf', dpi=150):
+        result = process_answer_sheet(gray)
+
+Autor: GabaritAI / X-TRI
+"""
+
+import os
+import threading
+import numpy as np
+from typing import Iterator, Optional, Tuple, Union
+
+try:
+    import pypdfium2 as pdfium
+    HAS_PDFIUM = True
+except ImportError:
+    HAS_PDFIUM = False
+
+# Resolução padrão: a dos templates (A4 em 150 DPI)
+PDF_RENDER_DPI = int(os.getenv('PDF_RENDER_DPI', 150))
+# Páginas por chamada ao poppler no fallback pdf2image
+PDF_FALLBACK_CHUNK = 10
+
+# O PDFium não é thread-safe: serializa as chamadas entre threads do worker
+_PDFIUM_LOCK = threading.Lock()
+
+
+class PdfError(Exception):
+    """PDF inválido ou sem backend de rasterização disponível."""
+
+
+def count_pdf_pages(source: Union[str, bytes]) -> int:
+    """
+    Número de páginas do PDF (caminho ou bytes).
+
+    Raises:
+        PdfError: se o PDF não puder ser aberto
+    """
+    if HAS_PDFIUM:
+        try:
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(source)
+                try:
+                    return len(pdf)
+                finally:
+                    pdf.close()
+        except pdfium.PdfiumError as e:
+            raise PdfError(str(e)) from e
+
+    try:
+        from pdf2image import pdfinfo_from_bytes, pdfinfo_from_path
+    except ImportError:
+        raise PdfError('pypdfium2 ou pdf2image não instalado')
+
+    try:
+        if isinstance(source, bytes):
+            return int(pdfinfo_from_bytes(source)['Pages'])
+        return int(pdfinfo_from_path(source)['Pages'])
+    except Exception as e:
+        raise PdfError(str(e)) from e
+
+
+def iter_pdf_pages(source: Union[str, bytes], dpi: int = PDF_RENDER_DPI,
+                   first_page: int = 1,
+                   last_page: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Gera (número da página, imagem grayscale) para cada página do intervalo.
+
+    Args:
+        source: Caminho do PDF ou bytes
+        dpi: Resolução da renderização
+        first_page, last_page: Intervalo de páginas (1-indexed, inclusivo)
+
+    Raises:
+        PdfError: se o PDF não puder ser aberto
+    """
+    if HAS_PDFIUM:
+        yield from _iter_pages_pdfium(source, dpi, first_page, last_page)
+    else:
+        yield from _iter_pages_pdf2image(source, dpi, first_page, last_page)
+
+
+def _iter_pages_pdfium(source, dpi, first_page, last_page):
+    try:
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(source)
+    except pdfium.PdfiumError as e:
+        raise PdfError(str(e)) from e
+
+    try:
+        last_page = min(last_page or len(pdf), len(pdf))
+        for page_num in range(first_page, last_page + 1):
+            with _PDFIUM_LOCK:
+                page = pdf[page_num - 1]
+                try:
+                    bitmap = page.render(scale=dpi / 72, grayscale=True)
+                    # Cópia: o buffer do bitmap é liberado junto com ele
+                    gray = np.array(bitmap.to_numpy())
+                finally:
+                    page.close()
+            yield page_num, gray
+    finally:
+        with _PDFIUM_LOCK:
+            pdf.close()
+
+
+def _iter_pages_pdf2image(source, dpi, first_page, last_page):
+    try:
+        from pdf2image import convert_from_bytes, convert_from_path
+    except ImportError:
+        raise PdfError('pypdfium2 ou pdf2image não instalado')
+
+    total = count_pdf_pages(source)
+    last_page = min(last_page or total, total)
+    convert = convert_from_bytes if isinstance(source, bytes) else convert_from_path
+
+    for start in range(first_page, last_page + 1, PDF_FALLBACK_CHUNK):
+        end = min(start + PDF_FALLBACK_CHUNK - 1, last_page)
+        pages = convert(source, dpi=dpi, first_page=start, last_page=end, grayscale=True)
+        for offset, image in enumerate(pages):
+            yield start + offset, np.array(image.convert('L'))
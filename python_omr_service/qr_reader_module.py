@@ -15,12 +15,12 @@ Métodos:
 Autor: GabaritAI / X-TRI
 """
 
-import cv2
-import numpy as np
 from pyzbar import pyzbar
 import re
 import logging
 
+from sheet_context import SheetContext
+
 logger = logging.getLogger(__name__)
 
 # Regex para validar formato do sheet_code: XTRI-XXXXXX (6 caracteres alfanuméricos)
@@ -59,17 +59,12 @@ def read_qr_code(img) -> str | None:
     Leitura básica de QR Code.
 
     Args:
-        img: Imagem OpenCV (BGR ou grayscale)
+        img: Imagem OpenCV (BGR ou grayscale) ou SheetContext
 
     Returns:
         Conteúdo do QR Code ou None se não encontrar
     """
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
-
-    return _decode_qr(gray)
+    return _decode_qr(SheetContext.of(img).gray)
 
 
 def read_qr_roi(img) -> str | None:
@@ -77,11 +72,7 @@ def read_qr_roi(img) -> str | None:
     Lê QR Code na região de interesse (canto superior direito).
     O QR Code no template X-TRI fica nos 25% superiores e 35% direitos.
     """
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
-
+    gray = SheetContext.of(img).gray
     h, w = gray.shape
 
     # ROI: 35% direita, 25% topo
@@ -94,46 +85,25 @@ def read_qr_roi(img) -> str | None:
 
 def read_qr_binary(img) -> str | None:
     """Lê QR Code usando binarização adaptativa."""
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
-
-    binary = cv2.adaptiveThreshold(
-        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY, 11, 2
-    )
-    return _decode_qr(binary)
+    return _decode_qr(SheetContext.of(img).adaptive_binary)
 
 
 def read_qr_enhanced(img) -> str | None:
     """Lê QR Code com CLAHE para melhorar contraste."""
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
-
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    enhanced = clahe.apply(gray)
-    return _decode_qr(enhanced)
+    return _decode_qr(SheetContext.of(img).clahe)
 
 
 def read_qr_scaled(img, scale: float = 0.5) -> str | None:
     """Lê QR Code em versão escalada da imagem."""
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
-
-    h, w = gray.shape
+    ctx = SheetContext.of(img)
+    h, w = ctx.shape
     new_w = int(w * scale)
     new_h = int(h * scale)
 
     if new_w < 100 or new_h < 100:
         return None
 
-    scaled = cv2.resize(gray, (new_w, new_h), interpolation=cv2.INTER_AREA)
-    return _decode_qr(scaled)
+    return _decode_qr(ctx.scaled(scale))
 
 
 def read_qr_with_fallback(img) -> dict:
@@ -148,8 +118,11 @@ def read_qr_with_fallback(img) -> dict:
     5. Escala 50%
     6. Escala 75%
 
+    Com um SheetContext o resultado é memorizado: chamadas repetidas (e o
+    leitor Hough, via 'qr_text') reaproveitam a mesma decodificação.
+
     Args:
-        img: Imagem OpenCV (BGR ou grayscale)
+        img: Imagem OpenCV (BGR ou grayscale) ou SheetContext
 
     Returns:
         dict: {
@@ -159,13 +132,21 @@ def read_qr_with_fallback(img) -> dict:
             'valid': bool (se código é válido)
         }
     """
+    ctx = SheetContext.of(img)
+    result = ctx.memo('qr', lambda: _read_qr_with_fallback(ctx))
+    # Texto bruto compartilhado com xtri_gabarito_reader.read_qr_code
+    ctx.memo('qr_text', lambda: result['sheet_code'])
+    return result
+
+
+def _read_qr_with_fallback(ctx: SheetContext) -> dict:
     methods = [
-        ('roi', lambda: read_qr_roi(img)),
-        ('full', lambda: read_qr_code(img)),
-        ('enhanced', lambda: read_qr_enhanced(img)),
-        ('binary', lambda: read_qr_binary(img)),
-        ('scaled_50', lambda: read_qr_scaled(img, 0.5)),
-        ('scaled_75', lambda: read_qr_scaled(img, 0.75)),
+        ('roi', lambda: read_qr_roi(ctx)),
+        ('full', lambda: read_qr_code(ctx)),
+        ('enhanced', lambda: read_qr_enhanced(ctx)),
+        ('binary', lambda: read_qr_binary(ctx)),
+        ('scaled_50', lambda: read_qr_scaled(ctx, 0.5)),
+        ('scaled_75', lambda: read_qr_scaled(ctx, 0.75)),
     ]
 
     for method_name, method_func in methods:
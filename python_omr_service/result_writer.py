@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Result Writer
+=============
+
+Gravação write-behind dos resultados do OMR.
+
+Em vez de um UPDATE por folha dentro da requisição, os resultados entram
+num buffer em memória e um thread de fundo os grava em lote (upsert),
+quando o buffer chega a OMR_WRITE_BATCH folhas ou OMR_WRITE_INTERVAL
+segundos depois do primeiro pendente. Falhas são repetidas com backoff
+exponencial e o buffer é esvaziado no encerramento do processo.
+
+O status de cada sheet_code pode ser consultado com get_save_status:
+    pending   -> na fila (ou gravando)
+    saved     -> gravado
+    not_found -> sheet_code não existe na tabela
+    failed    -> falhou após OMR_WRITE_RETRIES tentativas
+
+Uso:
+    start_writer(write_fn)   # write_fn({sheet_code: row}) -> {sheet_code: bool}
+    enqueue_result('XTRI-ABC234', row)
+    get_save_status('XTRI-ABC234')
+
+Autor: GabaritAI / X-TRI
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+OMR_WRITE_BEHIND = os.getenv('OMR_WRITE_BEHIND', '1') not in ('0', 'false', 'no', 'off')
+OMR_WRITE_BATCH = int(os.getenv('OMR_WRITE_BATCH', 50))             # folhas por upsert
+OMR_WRITE_INTERVAL = float(os.getenv('OMR_WRITE_INTERVAL', 1.0))    # segundos
+OMR_WRITE_RETRIES = int(os.getenv('OMR_WRITE_RETRIES', 4))
+OMR_WRITE_BACKOFF = 0.5          # segundos, dobra a cada tentativa
+OMR_WRITE_SHUTDOWN_TIMEOUT = 15  # segundos para esvaziar o buffer no encerramento
+SAVE_STATUS_MAX = 20000          # status mantidos em memória (os mais antigos saem)
+
+SAVE_PENDING = 'pending'
+SAVE_SAVED = 'saved'
+SAVE_NOT_FOUND = 'not_found'
+SAVE_FAILED = 'failed'
+
+WriteFn = Callable[[Dict[str, Dict[str, Any]]], Dict[str, bool]]
+
+_write_fn: Optional[WriteFn] = None
+_thread: Optional[threading.Thread] = None
+_cond = threading.Condition()
+_pending: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+_status: 'OrderedDict[str, str]' = OrderedDict()
+_inflight = 0
+_first_pending_at = 0.0
+_flush_requested = False
+
+
+def start_writer(write_fn: WriteFn) -> None:
+    """
+    Inicia (uma vez por processo) o thread de gravação.
+
+    Args:
+        write_fn: Grava {sheet_code: row} em lote e retorna {sheet_code: encontrado}.
+            Exceções são tratadas como falha transitória (nova tentativa).
+    """
+    global _write_fn, _thread
+    with _cond:
+        _write_fn = write_fn
+        if _thread is None:
+            _thread = threading.Thread(target=_writer_loop, name='omr-result-writer', daemon=True)
+            _thread.start()
+            logger.info(f"Result writer started: batch={OMR_WRITE_BATCH}, interval={OMR_WRITE_INTERVAL}s")
+
+
+def enqueue_result(sheet_code: str, row: Dict[str, Any]) -> str:
+    """Coloca o resultado na fila de gravação. Uma releitura substitui a anterior."""
+    global _first_pending_at
+    with _cond:
+        if not _pending:
+            _first_pending_at = time.monotonic()
+        _pending.pop(sheet_code, None)
+        _pending[sheet_code] = row
+        _set_status(sheet_code, SAVE_PENDING)
+        if len(_pending) >= OMR_WRITE_BATCH:
+            _cond.notify_all()
+    return SAVE_PENDING
+
+
+def get_save_status(sheet_code: str) -> Optional[str]:
+    """Status de gravação do sheet_code neste processo, ou None se desconhecido."""
+    with _cond:
+        return _status.get(sheet_code)
+
+
+def flush_results(timeout: float = OMR_WRITE_SHUTDOWN_TIMEOUT) -> bool:
+    """Grava tudo o que está na fila. Retorna False se o timeout estourar."""
+    global _flush_requested
+    deadline = time.monotonic() + timeout
+    with _cond:
+        if _thread is None:
+            return not _pending
+
+        _flush_requested = True
+        _cond.notify_all()
+        while _pending or _inflight:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _cond.wait(remaining)
+        _flush_requested = False
+        return not _pending and not _inflight
+
+
+def _set_status(sheet_code: str, status: str) -> None:
+    _status.pop(sheet_code, None)
+    _status[sheet_code] = status
+    while len(_status) > SAVE_STATUS_MAX:
+        _status.popitem(last=False)
+
+
+def _writer_loop():
+    global _inflight, _first_pending_at
+    while True:
+        with _cond:
+            while not _pending:
+                _cond.wait()
+
+            # Espera encher o lote ou vencer o intervalo do primeiro pendente
+            while len(_pending) < OMR_WRITE_BATCH and not _flush_requested:
+                remaining = _first_pending_at + OMR_WRITE_INTERVAL - time.monotonic()
+                if remaining <= 0:
+                    break
+                _cond.wait(remaining)
+
+            batch = OrderedDict()
+            while _pending and len(batch) < OMR_WRITE_BATCH:
+                sheet_code, row = _pending.popitem(last=False)
+                batch[sheet_code] = row
+            _inflight = len(batch)
+            _first_pending_at = time.monotonic()
+            write_fn = _write_fn
+
+        statuses = _write_with_retry(write_fn, batch)
+
+        with _cond:
+            for sheet_code, status in statuses.items():
+                # Relido enquanto gravava: continua pendente
+                if sheet_code not in _pending:
+                    _set_status(sheet_code, status)
+            _inflight = 0
+            _cond.notify_all()
+
+
+def _write_with_retry(write_fn: WriteFn, batch: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    """Grava o lote com backoff exponencial. Retorna o status final de cada sheet_code."""
+    for attempt in range(OMR_WRITE_RETRIES):
+        try:
+            found = write_fn(batch)
+            saved = sum(1 for ok in found.values() if ok)
+            logger.info(f"Result writer: {saved}/{len(batch)} results saved")
+            return {code: SAVE_SAVED if found.get(code) else SAVE_NOT_FOUND for code in batch}
+        except Exception as e:
+            delay = OMR_WRITE_BACKOFF * (2 ** attempt)
+            logger.warning(f"Result writer attempt {attempt + 1}/{OMR_WRITE_RETRIES} failed: {e}")
+            if attempt + 1 < OMR_WRITE_RETRIES:
+                time.sleep(delay)
+
+    logger.error(f"Result writer: giving up on {len(batch)} results")
+    return {code: SAVE_FAILED for code in batch}
+
+
+@atexit.register
+def _flush_on_exit():
+    if _pending or _inflight:
+        if not flush_results():
+            logger.error(f"Result writer: {len(_pending)} results not saved at shutdown")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Sheet Context
+=============
+
+Contexto de processamento de uma folha (um upload).
+
+Guarda a imagem recebida e calcula sob demanda, uma única vez, tudo o que
+os leitores compartilham: escala de cinza, binarizações, níveis reduzidos
+da pirâmide, CLAHE, marcadores e resultado do QR Code. O leitor de QR, o
+leitor Hough e o leitor legado recebem o mesmo contexto, então nenhuma
+passada de página inteira é repetida dentro de uma requisição.
+
+O contexto também acumula a duração de cada estágio da leitura
+(ctx.timings, em ms), preenchida pelos leitores com ctx.stage(nome).
+
+Uso:
+    ctx = SheetContext.from_bytes(data)  # decode direto para grayscale
+    ctx = SheetContext(image)            # ou a partir de um array BGR/grayscale
+    qr = read_qr_with_fallback(ctx)      # decodifica e memoriza
+    result = process_omr(ctx)            # reaproveita gray, QR, marcadores
+    with ctx.stage('markers'): ...       # soma a duração em ctx.timings['markers']
+
+Autor: GabaritAI / X-TRI
+"""
+
+import io
+import time
+import cv2
+import numpy as np
+from PIL import Image
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+
+# Lado menor da folha A4 em 150 DPI, resolução de referência dos leitores
+REFERENCE_SHORT_SIDE = 1240
+# A imagem reduzida no decode não deve ficar abaixo de 90% da referência
+MIN_REDUCED_RATIO = 0.9
+
+_REDUCED_GRAYSCALE = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def reduction_factor(width: int, height: int) -> int:
+    """
+    Maior fator de redução (1, 2, 4 ou 8) que mantém a folha perto de 150 DPI.
+
+    Usa as dimensões da imagem em vez do DPI declarado no arquivo, que
+    muitos scanners gravam errado. Ex.: 300 DPI (2480x3508) -> 2.
+    """
+    short_side = min(width, height)
+    for factor in (8, 4, 2):
+        if short_side / factor >= REFERENCE_SHORT_SIDE * MIN_REDUCED_RATIO:
+            return factor
+    return 1
+
+
+def decode_gray(data: bytes) -> Optional[np.ndarray]:
+    """
+    Decodifica os bytes do upload direto para um array grayscale (1 canal).
+
+    JPEGs de alta resolução são decodificados já reduzidos no domínio DCT
+    (IMREAD_REDUCED_GRAYSCALE_2/4/8), com o fator escolhido pelo cabeçalho,
+    sem nunca materializar a imagem colorida em resolução cheia.
+
+    Returns:
+        Array uint8 (h, w) ou None se não for possível decodificar
+    """
+    buf = np.frombuffer(data, np.uint8)
+    flags = cv2.IMREAD_GRAYSCALE
+
+    try:
+        # Image.open lê apenas o cabeçalho (formato e dimensões)
+        header = Image.open(io.BytesIO(data))
+        if header.format == 'JPEG':
+            factor = reduction_factor(*header.size)
+            if factor > 1:
+                flags = _REDUCED_GRAYSCALE[factor]
+    except Exception:
+        pass
+
+    # Mesma orientação do decode via PIL (EXIF não é aplicado)
+    gray = cv2.imdecode(buf, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if gray is not None:
+        return gray
+
+    # Formatos que o OpenCV não lê: decode via PIL
+    try:
+        return np.array(Image.open(io.BytesIO(data)).convert('L'))
+    except Exception:
+        return None
+
+
+class SheetContext:
+    """Imagem de uma folha com conversões e resultados memorizados."""
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self._memo: Dict[Any, Any] = {}
+        # Duração acumulada de cada estágio (ms)
+        self.timings: Dict[str, float] = {}
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Optional['SheetContext']:
+        """Cria o contexto a partir dos bytes do upload (decode_gray), ou None."""
+        start = time.perf_counter()
+        gray = decode_gray(data)
+        if gray is None:
+            return None
+        ctx = cls(gray)
+        ctx.timings['decode'] = round((time.perf_counter() - start) * 1000, 3)
+        return ctx
+
+    @classmethod
+    def of(cls, image: Union['SheetContext', np.ndarray]) -> 'SheetContext':
+        """Retorna o próprio contexto, ou cria um para um array BGR/grayscale."""
+        if isinstance(image, cls):
+            return image
+        return cls(image)
+
+    def memo(self, key: Any, compute: Callable[[], Any]) -> Any:
+        """Retorna o valor memorizado em `key`, calculando-o na primeira vez."""
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Mede o bloco e soma a duração (ms) em timings[name]."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[name] = round(self.timings.get(name, 0.0) + elapsed, 3)
+
+    def has(self, key: Any) -> bool:
+        """Indica se `key` já foi calculado neste contexto."""
+        return key in self._memo
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Imagem em escala de cinza (sem cópia se a entrada já for gray)."""
+        def compute():
+            if len(self.image.shape) == 3:
+                return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+            return self.image
+        return self.memo('gray', compute)
+
+    @property
+    def shape(self):
+        """Dimensões (h, w) da folha."""
+        return self.gray.shape
+
+    def binary(self, threshold: int) -> np.ndarray:
+        """Binarização inversa (tinta = 255) com limiar fixo."""
+        def compute():
+            _, binary = cv2.threshold(self.gray, threshold, 255, cv2.THRESH_BINARY_INV)
+            return binary
+        return self.memo(('binary', threshold), compute)
+
+    def decimated(self, factor: int) -> np.ndarray:
+        """Nível da pirâmide: gray decimado por `factor` (1 = resolução cheia)."""
+        if factor <= 1:
+            return self.gray
+        return self.memo(('decimated', factor),
+                         lambda: np.ascontiguousarray(self.gray[::factor, ::factor]))
+
+    def scaled(self, scale: float) -> np.ndarray:
+        """Gray redimensionado por `scale` com INTER_AREA."""
+        def compute():
+            h, w = self.gray.shape
+            return cv2.resize(self.gray, (int(w * scale), int(h * scale)),
+                              interpolation=cv2.INTER_AREA)
+        return self.memo(('scaled', scale), compute)
+
+    @property
+    def clahe(self) -> np.ndarray:
+        """Gray com contraste adaptativo (CLAHE 2.0, 8x8)."""
+        def compute():
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+            return clahe.apply(self.gray)
+        return self.memo('clahe', compute)
+
+    @property
+    def adaptive_binary(self) -> np.ndarray:
+        """Binarização adaptativa gaussiana (11, 2), usada na leitura do QR."""
+        return self.memo('adaptive_binary', lambda: cv2.adaptiveThreshold(
+            self.gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+        ))
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Sheet PDF
+=========
+
+Renderização em streaming do PDF de gabaritos de um lote (/api/download-pdf).
+
+    - A parte fixa da página (cabeçalho, marcadores de canto e a grade de
+      90 questões x 5 bolhas) é desenhada uma única vez como form XObject
+      e reaproveitada por todas as páginas
+    - O QR Code é desenhado em vetor (módulos escuros como retângulos), sem
+      gerar PNG por aluno
+    - O PDF é escrito de forma incremental: cada página sai assim que fica
+      pronta e só as posições dos objetos (xref) ficam em memória
+
+Mesmo layout do gerador anterior em reportlab (mesmas coordenadas).
+
+Uso:
+    for chunk in iter_batch_pdf(students):
+        output.write(chunk)
+
+Autor: GabaritAI / X-TRI
+"""
+
+import zlib
+import qrcode
+from typing import Dict, Iterator, List
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+
+# Versão do layout: mudar ao alterar o desenho (invalida o pdf_cache)
+RENDER_VERSION = 1
+
+WIDTH, HEIGHT = A4
+
+# Grade de respostas (6 colunas x 15 linhas = 90 questões)
+GRID_START_Y = HEIGHT - 140 * mm
+GRID_COL_WIDTH = 28 * mm
+GRID_ROW_HEIGHT = 8 * mm
+BUBBLE_RADIUS = 2.5 * mm
+MARKER_SIZE = 5 * mm
+
+# QR Code (canto superior direito)
+QR_X = WIDTH - 45 * mm
+QR_Y = HEIGHT - 45 * mm
+QR_SIZE = 35 * mm
+
+# Aproximação do círculo por 4 curvas de Bézier
+_KAPPA = 0.5522847498
+
+
+def _num(value: float) -> str:
+    """Número no formato compacto do PDF (até 3 casas decimais)."""
+    text = f"{value:.3f}".rstrip('0').rstrip('.')
+    return text if text not in ('', '-0') else '0'
+
+
+def _pdf_text(text: str) -> str:
+    """String literal do PDF em WinAnsiEncoding (fontes padrão Helvetica)."""
+    raw = str(text).encode('cp1252', errors='replace').decode('latin-1')
+    return '(' + raw.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+
+def _text(font: str, size: float, x: float, y: float, text: str) -> str:
+    return f"BT /{font} {_num(size)} Tf {_num(x)} {_num(y)} Td {_pdf_text(text)} Tj ET"
+
+
+def _circle(x: float, y: float, r: float) -> str:
+    k = _KAPPA * r
+    n = _num
+    return (
+        f"{n(x + r)} {n(y)} m "
+        f"{n(x + r)} {n(y + k)} {n(x + k)} {n(y + r)} {n(x)} {n(y + r)} c "
+        f"{n(x - k)} {n(y + r)} {n(x - r)} {n(y + k)} {n(x - r)} {n(y)} c "
+        f"{n(x - r)} {n(y - k)} {n(x - k)} {n(y - r)} {n(x)} {n(y - r)} c "
+        f"{n(x + k)} {n(y - r)} {n(x + r)} {n(y - k)} {n(x + r)} {n(y)} c"
+    )
+
+
+def static_page_content() -> bytes:
+    """Conteúdo fixo de todas as páginas (desenhado uma vez no form XObject)."""
+    ops = [_text('F2', 16, 20 * mm, HEIGHT - 20 * mm, "GABARITO - PROVA")]
+
+    # Marcadores de canto (quadrados pretos para alinhamento)
+    for x, y in ((15 * mm, HEIGHT - 130 * mm), (WIDTH - 20 * mm, HEIGHT - 130 * mm),
+                 (15 * mm, 40 * mm), (WIDTH - 20 * mm, 40 * mm)):
+        ops.append(f"{_num(x)} {_num(y)} {_num(MARKER_SIZE)} {_num(MARKER_SIZE)} re B")
+
+    circles = []
+    for col in range(6):
+        col_x = 20 * mm + col * GRID_COL_WIDTH
+
+        # Cabeçalho da coluna
+        ops.append(_text('F2', 8, col_x + 8 * mm, GRID_START_Y + 5 * mm, "A  B  C  D  E"))
+
+        for row in range(15):
+            q_num = col * 15 + row + 1
+            row_y = GRID_START_Y - row * GRID_ROW_HEIGHT
+
+            # Número da questão
+            ops.append(_text('F1', 8, col_x, row_y, f"{q_num:02d}"))
+
+            # Bolhas A-E
+            for opt in range(5):
+                circles.append(_circle(col_x + 10 * mm + opt * 5 * mm, row_y + 1.5 * mm, BUBBLE_RADIUS))
+
+    # As 450 bolhas num único path
+    ops.append('\n'.join(circles) + ' S')
+    return '\n'.join(ops).encode('latin-1')
+
+
+def qr_modules(data: str) -> List[List[bool]]:
+    """Matriz do QR Code (com borda), a mesma que o gerador PNG usava."""
+    qr = qrcode.QRCode(version=1, box_size=3, border=2)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _qr_content(data: str) -> str:
+    """QR Code em vetor: cada sequência horizontal de módulos escuros é um retângulo."""
+    matrix = qr_modules(data)
+    module = QR_SIZE / len(matrix)
+    rects = []
+
+    for r, row in enumerate(matrix):
+        y = QR_Y + QR_SIZE - (r + 1) * module
+        c = 0
+        while c < len(row):
+            if not row[c]:
+                c += 1
+                continue
+            start = c
+            while c < len(row) and row[c]:
+                c += 1
+            rects.append(f"{_num(QR_X + start * module)} {_num(y)} "
+                         f"{_num((c - start) * module)} {_num(module)} re")
+
+    return '\n'.join(rects) + ' f'
+
+
+def page_content(student: Dict) -> bytes:
+    """Conteúdo variável da página de um aluno (dados e QR) sobre o form fixo."""
+    ops = [
+        "q /Grid Do Q",
+        # Dados do aluno
+        _text('F1', 12, 20 * mm, HEIGHT - 35 * mm, f"Nome: {student['student_name']}"),
+        _text('F1', 12, 20 * mm, HEIGHT - 42 * mm, f"Matrícula: {student.get('enrollment_code') or '-'}"),
+        _text('F1', 12, 20 * mm, HEIGHT - 49 * mm, f"Turma: {student.get('class_name') or '-'}"),
+        _text('F1', 12, 20 * mm, HEIGHT - 56 * mm, f"Código: {student['sheet_code']}"),
+        _qr_content(student['sheet_code'])
+    ]
+    return '\n'.join(ops).encode('latin-1', errors='replace')
+
+
+class _PdfWriter:
+    """Escrita sequencial de objetos PDF, guardando só os offsets para o xref."""
+
+    def __init__(self):
+        self.offsets: Dict[int, int] = {}
+        self.position = 0
+        self.count = 0
+
+    def reserve(self) -> int:
+        self.count += 1
+        return self.count
+
+    def _emit(self, data: bytes) -> bytes:
+        self.position += len(data)
+        return data
+
+    def header(self) -> bytes:
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def obj(self, num: int, body: str) -> bytes:
+        self.offsets[num] = self.position
+        return self._emit(f"{num} 0 obj\n{body}\nendobj\n".encode('latin-1'))
+
+    def stream(self, num: int, entries: str, data: bytes) -> bytes:
+        data = zlib.compress(data, 6)
+        self.offsets[num] = self.position
+        return self._emit(
+            f"{num} 0 obj\n<< {entries} /Filter /FlateDecode /Length {len(data)} >>\nstream\n".encode('latin-1')
+            + data + b"\nendstream\nendobj\n"
+        )
+
+    def trailer(self, root: int) -> bytes:
+        xref = [f"xref\n0 {self.count + 1}\n0000000000 65535 f \n"]
+        xref.extend(f"{self.offsets[num]:010d} 00000 n \n" for num in range(1, self.count + 1))
+        xref.append(f"trailer\n<< /Size {self.count + 1} /Root {root} 0 R >>\n"
+                    f"startxref\n{self.position}\n%%EOF\n")
+        return self._emit(''.join(xref).encode('latin-1'))
+
+
+def iter_batch_pdf(students: List[Dict]) -> Iterator[bytes]:
+    """
+    Gera o PDF de gabaritos (uma página por aluno) em pedaços de bytes.
+
+    Args:
+        students: Dicts com student_name, sheet_code, enrollment_code e class_name
+
+    Yields:
+        Pedaços consecutivos do arquivo PDF; o primeiro sai antes de qualquer
+        página ser desenhada
+    """
+    w = _PdfWriter()
+    catalog, pages, font, font_bold, grid = (w.reserve() for _ in range(5))
+    fonts = f"/Font << /F1 {font} 0 R /F2 {font_bold} 0 R >>"
+    media_box = f"[0 0 {_num(WIDTH)} {_num(HEIGHT)}]"
+
+    yield w.header()
+    yield w.obj(font, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    yield w.obj(font_bold, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+    yield w.stream(grid, f"/Type /XObject /Subtype /Form /BBox {media_box} /Resources << {fonts} >>",
+                   static_page_content())
+
+    kids = []
+    for student in students:
+        content, page = w.reserve(), w.reserve()
+        yield w.stream(content, "", page_content(student))
+        yield w.obj(page, f"<< /Type /Page /Parent {pages} 0 R /MediaBox {media_box} "
+                          f"/Resources << {fonts} /XObject << /Grid {grid} 0 R >> >> /Contents {content} 0 R >>")
+        kids.append(f"{page} 0 R")
+
+    yield w.obj(pages, f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>")
+    yield w.obj(catalog, f"<< /Type /Catalog /Pages {pages} 0 R >>")
+    yield w.trailer(catalog)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Student Cache
+=============
+
+Cache em dois níveis do lookup de alunos por sheet_code.
+
+    1. Memória do processo: LRU com TTL (STUDENT_CACHE_MAX entradas)
+    2. Disco (opcional, STUDENT_CACHE_PATH): SQLite compartilhado entre os
+       workers do gunicorn e mantido entre reinícios
+
+Também guarda:
+    - entradas negativas (sheet_code não encontrado), com TTL menor, para
+      que releituras de um código inválido não custem duas consultas
+    - a tabela em que cada código foi encontrado ('students' ou
+      'answer_sheet_students'), para consultá-la primeiro quando a
+      entrada expirar
+
+Uso:
+    hit, student = get_student(code)   # hit=False -> consultar o banco
+    put_students({code: student, ...}) # student=None -> entrada negativa
+    preferred_source(code)             # tabela onde o código foi achado
+    invalidate([code, ...])            # descarta entradas (escritas do serviço)
+
+Validade: as escritas feitas por este serviço invalidam os códigos
+afetados (alunos criados em create_students_batch, códigos que
+save_omr_results_bulk não encontrou ou cujo aluno mudou). Alterações
+feitas fora dele (outro sistema renomeando ou movendo alunos) só
+aparecem quando a entrada expira: até STUDENT_CACHE_TTL para alunos e
+STUDENT_CACHE_NEGATIVE_TTL para "não encontrado", inclusive no SQLite
+mantido entre reinícios.
+
+Autor: GabaritAI / X-TRI
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STUDENT_CACHE_TTL = int(os.getenv('STUDENT_CACHE_TTL', 600))                  # segundos
+STUDENT_CACHE_NEGATIVE_TTL = int(os.getenv('STUDENT_CACHE_NEGATIVE_TTL', 60))  # segundos
+STUDENT_CACHE_MAX = int(os.getenv('STUDENT_CACHE_MAX', 20000))
+# Arquivo SQLite do segundo nível (vazio = só memória)
+STUDENT_CACHE_PATH = os.getenv('STUDENT_CACHE_PATH', '')
+
+_lock = threading.Lock()
+# sheet_code -> (expira_em, aluno ou None)
+_memory: 'OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]' = OrderedDict()
+# sheet_code -> tabela de origem (sobrevive à expiração da entrada)
+_sources: 'OrderedDict[str, str]' = OrderedDict()
+_disk: Optional[sqlite3.Connection] = None
+_disk_failed = False
+
+
+def get_student(sheet_code: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    Busca o aluno no cache.
+
+    Returns:
+        (True, aluno) ou (True, None) para entrada negativa; (False, None) se
+        não estiver em cache ou tiver expirado
+    """
+    now = time.time()
+    with _lock:
+        entry = _memory.get(sheet_code)
+        if entry is not None:
+            if entry[0] > now:
+                _memory.move_to_end(sheet_code)
+                return True, entry[1]
+            del _memory[sheet_code]
+
+        row = _disk_get(sheet_code)
+        if row is not None and row[0] > now:
+            _memory_put(sheet_code, row[0], row[1])
+            return True, row[1]
+
+    return False, None
+
+
+def put_students(students: Dict[str, Optional[Dict[str, Any]]]) -> None:
+    """
+    Guarda os alunos nos dois níveis (uma única transação em disco).
+    Aluno None = não encontrado, com TTL menor.
+    """
+    now = time.time()
+    rows = []
+    with _lock:
+        for sheet_code, student in students.items():
+            ttl = STUDENT_CACHE_TTL if student is not None else STUDENT_CACHE_NEGATIVE_TTL
+            _memory_put(sheet_code, now + ttl, student)
+            if student is not None and student.get('source'):
+                _remember_source(sheet_code, student['source'])
+            rows.append((sheet_code, now + ttl, student))
+        _disk_put(rows)
+
+
+def preferred_source(sheet_code: str) -> Optional[str]:
+    """Tabela em que o sheet_code foi encontrado da última vez, se conhecida."""
+    with _lock:
+        source = _sources.get(sheet_code)
+        if source is None:
+            source = _disk_source(sheet_code)
+        return source
+
+
+def invalidate(sheet_codes: Iterable[str]) -> None:
+    """Remove os sheet_codes do cache (a origem conhecida é mantida)."""
+    sheet_codes = list(sheet_codes)
+    if not sheet_codes:
+        return
+    with _lock:
+        for sheet_code in sheet_codes:
+            _memory.pop(sheet_code, None)
+        db = _get_disk()
+        if db is not None:
+            try:
+                db.executemany("UPDATE students SET expires_at = 0 WHERE sheet_code = ?",
+                               [(sheet_code,) for sheet_code in sheet_codes])
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Student cache disk error: {e}")
+
+
+# ============================================================
+# NÍVEL 1: MEMÓRIA
+# ============================================================
+
+def _memory_put(sheet_code, expires_at, student):
+    _memory[sheet_code] = (expires_at, student)
+    _memory.move_to_end(sheet_code)
+    while len(_memory) > STUDENT_CACHE_MAX:
+        _memory.popitem(last=False)
+
+
+def _remember_source(sheet_code, source):
+    _sources[sheet_code] = source
+    _sources.move_to_end(sheet_code)
+    while len(_sources) > STUDENT_CACHE_MAX:
+        _sources.popitem(last=False)
+
+
+# ============================================================
+# NÍVEL 2: DISCO (SQLITE)
+# ============================================================
+
+def _get_disk() -> Optional[sqlite3.Connection]:
+    """Conexão SQLite do processo (lazy), ou None se desabilitado ou indisponível."""
+    global _disk, _disk_failed
+    if _disk is not None or _disk_failed or not STUDENT_CACHE_PATH:
+        return _disk
+
+    try:
+        db = sqlite3.connect(STUDENT_CACHE_PATH, timeout=5, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS students (
+                sheet_code TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL,
+                student TEXT,
+                source TEXT
+            )
+        """)
+        db.commit()
+        _disk = db
+    except sqlite3.Error as e:
+        logger.warning(f"Student cache disk disabled ({STUDENT_CACHE_PATH}): {e}")
+        _disk_failed = True
+    return _disk
+
+
+def _disk_get(sheet_code):
+    db = _get_disk()
+    if db is None:
+        return None
+    try:
+        row = db.execute("SELECT expires_at, student, source FROM students WHERE sheet_code = ?",
+                         (sheet_code,)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"Student cache disk error: {e}")
+        return None
+    if row is None:
+        return None
+    if row[2]:
+        _remember_source(sheet_code, row[2])
+    return row[0], json.loads(row[1]) if row[1] else None
+
+
+def _disk_put(rows):
+    db = _get_disk()
+    if db is None:
+        return
+    try:
+        db.executemany(
+            "INSERT OR REPLACE INTO students (sheet_code, expires_at, student, source) VALUES (?, ?, ?, ?)",
+            [(sheet_code, expires_at,
+              json.dumps(student, ensure_ascii=False) if student else None,
+              # Entrada negativa não apaga a origem conhecida
+              student.get('source') if student else _sources.get(sheet_code))
+             for sheet_code, expires_at, student in rows]
+        )
+        db.commit()
+    except sqlite3.Error as e:
+        logger.warning(f"Student cache disk error: {e}")
+
+
+def _disk_source(sheet_code):
+    db = _get_disk()
+    if db is None:
+        return None
+    try:
+        row = db.execute("SELECT source FROM students WHERE sheet_code = ?", (sheet_code,)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"Student cache disk error: {e}")
+        return None
+    return row[0] if row else None
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Teste dos jobs de lote assíncronos: heartbeat e job perdido (JOB_LOST)
+
+Roda offline, sem subir o serviço (usa o test client do Flask e um
+diretório de jobs temporário):
+    python test_batch_jobs.py
+    python -m pytest test_batch_jobs.py
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+os.environ['OMR_JOBS_DIR'] = tempfile.mkdtemp(prefix='omr_jobs_test_')
+
+import app as omr_app
+from batch_jobs import (FINAL_STATES, OMR_JOB_STALE_AFTER, create_job, expire_stale_job, get_job,
+                        last_heartbeat, save_job)
+
+
+try:
+    import pytest
+except ImportError:  # rodando como script, sem pytest instalado
+    pytest = None
+else:
+    @pytest.fixture
+    def client():
+        return omr_app.app.test_client()
+
+
+def dead_pid():
+    """Pid de um processo que já terminou (e foi coletado)."""
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+def job_file(job_id, ext):
+    return os.path.join(os.environ['OMR_JOBS_DIR'], f"{job_id}.{ext}")
+
+
+def write_status(job_id, **fields):
+    """Regrava campos do job direto no arquivo, como outro processo faria (save_job)."""
+    job = get_job(job_id)
+    job.update(fields)
+    with open(job_file(job_id, 'json'), 'w', encoding='utf-8') as f:
+        json.dump(job, f)
+    if job['status'] in FINAL_STATES and os.path.exists(job_file(job_id, 'hb')):
+        os.remove(job_file(job_id, 'hb'))
+
+
+def write_stale(job_id, age):
+    """Último heartbeat `age` s no passado (save_job sempre usa o horário atual)."""
+    past = time.time() - age
+    write_status(job_id, updated_at=past)
+    if os.path.exists(job_file(job_id, 'hb')):
+        os.utime(job_file(job_id, 'hb'), (past, past))
+
+
+@contextmanager
+def folhas_lentas(seconds):
+    """Substitui a leitura do lote por folhas que demoram `seconds` cada."""
+    def folha_lenta(items):
+        for idx, (filename, _) in enumerate(items):
+            time.sleep(seconds)
+            yield {"index": idx, "filename": filename, "status": "sucesso"}
+
+    original = omr_app.iter_batch_results
+    omr_app.iter_batch_results = folha_lenta
+    try:
+        yield
+    finally:
+        omr_app.iter_batch_results = original
+
+
+def poll(client, job_id):
+    response = client.get(f'/api/jobs/{job_id}')
+    assert response.status_code == 200, response.status_code
+    return response.get_json()['job']
+
+
+def teste_job_sem_heartbeat_vira_job_lost(client):
+    """Worker morreu com o job 'running': o polling encerra com JOB_LOST."""
+    job = create_job(3)
+    job['status'] = 'running'
+    pid = dead_pid()
+    job['pid'] = pid
+    save_job(job)
+
+    write_stale(job['job_id'], OMR_JOB_STALE_AFTER + 5)
+
+    polled = poll(client, job['job_id'])
+    assert polled['status'] == 'error', polled
+    assert polled['code'] == 'JOB_LOST', polled
+    assert str(pid) in polled['error'], polled['error']
+
+    # Persistido: os próximos pollings (de qualquer worker) já veem o erro
+    assert get_job(job['job_id'])['code'] == 'JOB_LOST'
+    print("✓ job 'running' sem heartbeat -> error / JOB_LOST")
+
+
+def teste_worker_vivo_travado_nao_perde_o_job(client):
+    """Heartbeat parado mas o processo dono existe: o job não é encerrado."""
+    job = create_job(3)
+    job['status'] = 'running'
+    job['pid'] = os.getpid()
+    save_job(job)
+
+    write_stale(job['job_id'], OMR_JOB_STALE_AFTER + 5)
+    assert poll(client, job['job_id'])['status'] == 'running'
+    print("✓ job de worker vivo (travado) continua 'running'")
+
+
+def teste_job_lost_nao_e_ressuscitado(client):
+    """Depois do JOB_LOST, o heartbeat do worker não volta o job para 'running'."""
+    job = create_job(3)
+    job['status'] = 'running'
+    save_job(job)
+
+    write_status(job['job_id'], status='error', code='JOB_LOST')
+    job['processed'] = 1
+    assert not save_job(job)
+    assert get_job(job['job_id'])['status'] == 'error'
+    print("✓ save_job não sobrescreve job em estado final")
+
+
+def teste_executor_para_apos_job_lost(client):
+    """Worker que volta de um travamento encontra o job encerrado e para sem regravá-lo."""
+    slow = omr_app.JOB_SAVE_INTERVAL * 2
+    items = [(f'{i}.png', b'x') for i in range(10)]
+
+    with folhas_lentas(slow):
+        job = create_job(len(items))
+        runner = omr_app.threading.Thread(target=omr_app.run_batch_job, args=(job, items))
+        runner.start()
+
+        time.sleep(slow * 1.5)
+        write_status(job['job_id'], status='error', code='JOB_LOST')
+        runner.join(timeout=slow * len(items))
+        assert not runner.is_alive()
+
+    final = poll(client, job['job_id'])
+    assert final['status'] == 'error' and final['code'] == 'JOB_LOST', final
+    assert job['processed'] < len(items), job['processed']
+    print(f"✓ executor parou após JOB_LOST ({job['processed']}/{len(items)} folhas)")
+
+
+def teste_job_com_heartbeat_recente_continua(client):
+    job = create_job(3)
+    job['status'] = 'running'
+    job['pid'] = os.getpid()
+    save_job(job)
+
+    assert poll(client, job['job_id'])['status'] == 'running'
+    print("✓ job com heartbeat recente continua 'running'")
+
+
+def teste_job_finalizado_nao_expira(client):
+    job = create_job(1)
+    job['status'] = 'done'
+    save_job(job)
+
+    write_stale(job['job_id'], OMR_JOB_STALE_AFTER * 10)
+    assert poll(client, job['job_id'])['status'] == 'done'
+    assert not expire_stale_job(get_job(job['job_id']))
+    print("✓ job finalizado não é marcado como perdido")
+
+
+def teste_heartbeat_durante_folha_lenta(client):
+    """Uma folha demorada não pode fazer o job parecer perdido."""
+    slow = omr_app.JOB_SAVE_INTERVAL * 4
+
+    with folhas_lentas(slow):
+        job = create_job(1)
+        start = time.time()
+        runner = omr_app.threading.Thread(target=omr_app.run_batch_job, args=(job, [('a.png', b'x')]))
+        runner.start()
+
+        time.sleep(slow * 0.75)
+        during = get_job(job['job_id'])
+        assert during['status'] == 'running', during['status']
+        assert during['pid'] == os.getpid(), during
+        beat = last_heartbeat(during) - start
+        assert beat >= omr_app.JOB_SAVE_INTERVAL, \
+            f"sem heartbeat durante a folha: último {beat:.2f}s após o início"
+        assert during['updated_at'] - start < omr_app.JOB_SAVE_INTERVAL, \
+            "job regravado sem progresso (o heartbeat deveria só tocar o .hb)"
+
+        runner.join()
+
+    done = poll(client, job['job_id'])
+    assert done['status'] == 'done' and done['success'] == 1, done
+    print("✓ heartbeat grava o job durante uma folha lenta")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("TESTE DE JOBS DE LOTE (heartbeat / JOB_LOST)")
+    print("=" * 60)
+
+    client = omr_app.app.test_client()
+
+    teste_job_sem_heartbeat_vira_job_lost(client)
+    teste_worker_vivo_travado_nao_perde_o_job(client)
+    teste_job_com_heartbeat_recente_continua(client)
+    teste_job_lost_nao_e_ressuscitado(client)
+    teste_executor_para_apos_job_lost(client)
+    teste_job_finalizado_nao_expira(client)
+    teste_heartbeat_durante_folha_lenta(client)
+
+    print("\n✅ TODOS OS TESTES PASSARAM!")
+    sys.exit(0)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Teste da verificação do caminho por template (check_template_fit)
+
+Um grid projetado deslocado de uma linha inteira ou de uma opção ainda cai
+quase todo sobre bolhas reais; a verificação precisa rejeitá-lo para que o
+leitor caia no Hough em vez de atribuir as respostas à questão errada.
+
+Roda offline, sobre folhas sintéticas do gabarito_generator:
+    python test_template_fit.py
+"""
+
+import sys
+import random
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+import xtri_gabarito_reader as reader
+from gabarito_generator import DEFAULT_SCAN_OPTIONS, degrade_scan, generate_gabarito, synthetic_students
+from pdf_rasterizer import iter_pdf_pages
+from sheet_context import SheetContext
+
+SEED = 20260101
+DPIS = (150, 200, 300)
+
+
+@lru_cache(maxsize=None)
+def folha(dpi):
+    """Folha preenchida rasterizada em `dpi`, com leve rotação/perspectiva/blur."""
+    rng = random.Random(SEED)
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    generate_gabarito(c, synthetic_students(1)[0], 1, rng=rng)
+    c.showPage()
+    c.save()
+
+    _, gray = next(iter_pdf_pages(buffer.getvalue(), dpi=dpi))
+    scan, _ = degrade_scan(gray, np.random.default_rng(SEED), dict(DEFAULT_SCAN_OPTIONS, dpi=dpi))
+    return scan
+
+
+def projecao(gray, linhas=0, opcoes=0):
+    """Bolhas do template projetadas com o grid deslocado de `linhas` linhas e `opcoes` opções."""
+    markers = reader.find_grid_markers(SheetContext(gray))
+    assert markers, "marcadores não encontrados"
+
+    original = reader.TEMPLATE_MARKERS
+    # Deslocar os marcadores do template ao contrário desloca o grid projetado
+    reader.TEMPLATE_MARKERS = {
+        k: (x - opcoes * reader.TEMPLATE_OPTION_SPACING, y - linhas * reader.TEMPLATE_ROW_SPACING)
+        for k, (x, y) in original.items()
+    }
+    try:
+        return reader.project_template_bubbles(markers)
+    finally:
+        reader.TEMPLATE_MARKERS = original
+
+
+def test_template_alinhado_e_aceito():
+    for dpi in DPIS:
+        gray = folha(dpi)
+        assert reader.check_template_fit(gray, projecao(gray)), f"{dpi} DPI: grid correto rejeitado"
+    print("✓ grid alinhado aceito (150/200/300 DPI)")
+
+
+def test_template_deslocado_uma_linha_e_rejeitado():
+    for dpi in DPIS:
+        gray = folha(dpi)
+        for linhas in (1, -1):
+            assert not reader.check_template_fit(gray, projecao(gray, linhas=linhas)), \
+                f"{dpi} DPI: grid deslocado {linhas:+d} linha aceito"
+    print("✓ grid deslocado de uma linha rejeitado")
+
+
+def test_template_deslocado_uma_opcao_e_rejeitado():
+    for dpi in DPIS:
+        gray = folha(dpi)
+        for opcoes in (1, -1):
+            assert not reader.check_template_fit(gray, projecao(gray, opcoes=opcoes)), \
+                f"{dpi} DPI: grid deslocado {opcoes:+d} opção aceito"
+    print("✓ grid deslocado de uma opção rejeitado")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("TESTE DA VERIFICAÇÃO DO TEMPLATE")
+    print("=" * 60)
+
+    test_template_alinhado_e_aceito()
+    test_template_deslocado_uma_linha_e_rejeitado()
+    test_template_deslocado_uma_opcao_e_rejeitado()
+
+    print("\n✅ TODOS OS TESTES PASSARAM!")
+    sys.exit(0)
@@ -16,6 +16,11 @@ Uso:
     # Processar PDF (página específica)
     result = process_pdf('gabaritos.pdf', page=1)
 
+    # Processar PDF inteiro (páginas em ordem, OMR em paralelo)
+    with ProcessPoolExecutor() as pool:
+        for result in process_pdf_pages('gabaritos.pdf', executor=pool):
+            print(result['page'], result['stats'])
+
     # Resultado
     print(result['sheet_code'])      # XTRI-U6M9R7
     print(result['answers'])         # {'1': 'A', '2': 'C', ...}
@@ -27,7 +32,13 @@ Data: Janeiro 2026
 
 import cv2
 import numpy as np
-from typing import Dict, List, Tuple, Optional, Any
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Tuple, Optional, Any, Iterator
+
+from marker_locator import find_square_markers
+from pdf_rasterizer import PdfError, iter_pdf_pages
+from sheet_context import SheetContext
 
 # ============================================================
 # CONFIGURAÇÃO DO TEMPLATE
@@ -43,6 +54,36 @@ OPTIONS = ['A', 'B', 'C', 'D', 'E']
 FILL_THRESHOLD = 28      # % mínimo de pixels escuros para considerar marcado
 DARK_PIXEL_VALUE = 170   # Valor de pixel considerado "escuro" (0-255) - aumentado para incluir cinzas
 
+# Geometria do template em 150 DPI (mesmas constantes de gabarito_generator.py)
+TEMPLATE_MARKERS = {
+    'TL': (57, 463),
+    'TR': (1184, 463),
+    'BL': (57, 1141),
+    'BR': (1184, 1141)
+}
+TEMPLATE_GRID_START = (120, 520)  # Centro da bolha A da questão 1
+TEMPLATE_OPTION_SPACING = 25      # Entre opções A-B-C-D-E
+TEMPLATE_COLUMN_SPACING = 179     # Entre colunas de questões
+TEMPLATE_ROW_SPACING = 41.7       # Entre linhas
+TEMPLATE_BUBBLE_RADIUS = 9
+
+# Verificação de consistência do caminho por template
+# Contraste (níveis de cinza) entre o entorno da bolha e o seu contorno
+TEMPLATE_MIN_CONTRAST = 30
+# Fração mínima de bolhas com contorno encontrado onde o template prevê
+TEMPLATE_MIN_MATCH = 0.85
+# Fração máxima de "bolhas fantasma" (linha acima de Q1, abaixo da última
+# linha, opção antes de A e depois de E) com contorno encontrado. Um grid
+# deslocado de uma linha ou de uma opção passa em TEMPLATE_MIN_MATCH, mas
+# um dos conjuntos fantasma cai sobre bolhas reais.
+TEMPLATE_MAX_PHANTOM = 0.5
+
+# Modos de detecção das bolhas:
+#   'auto'     - projeta o template pelos marcadores; Hough só se a verificação falhar
+#   'template' - apenas projeção do template
+#   'hough'    - apenas Hough Circle Transform
+DETECTION_MODE = 'auto'
+
 
 # ============================================================
 # DETECÇÃO DE MARCADORES
@@ -53,33 +94,31 @@ def find_grid_markers(gray: np.ndarray) -> Optional[Dict[str, Tuple[int, int]]]:
     Encontra os 4 marcadores quadrados pretos do grid de respostas.
 
     Args:
-        gray: Imagem em escala de cinza
+        gray: Imagem em escala de cinza ou SheetContext (resultado memorizado)
 
     Returns:
         Dict com 'TL', 'TR', 'BL', 'BR' (top-left, etc) ou None se não encontrar
     """
-    h, w = gray.shape
+    ctx = SheetContext.of(gray)
+    return ctx.memo('grid_markers', lambda: _find_grid_markers(ctx))
+
+
+def _find_grid_markers(ctx: SheetContext) -> Optional[Dict[str, Tuple[int, int]]]:
+    h, w = ctx.shape
 
     # Calcular escala baseado no tamanho da imagem
     # Referência: 150 DPI = ~1240x1754, 300 DPI = ~2480x3508
     scale = max(w / 1240, h / 1754)
     area_scale = scale * scale  # Área escala quadraticamente
 
-    _, binary = cv2.threshold(gray, 80, 255, cv2.THRESH_BINARY_INV)
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
     # Filtrar candidatos a marcadores (quadrados de tamanho apropriado, escalado)
     min_area = int(800 * area_scale)
     max_area = int(2500 * area_scale)
 
-    candidates = []
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if min_area < area < max_area:
-            x, y, cw, ch = cv2.boundingRect(cnt)
-            aspect = cw / ch if ch > 0 else 0
-            if 0.7 < aspect < 1.4:  # Aproximadamente quadrado
-                candidates.append((x + cw//2, y + ch//2))
+    # Busca em pirâmide: candidatos na imagem reduzida, centro refinado em resolução cheia
+    candidates = [
+        m['center'] for m in find_square_markers(ctx, 80, min_area, max_area, (0.7, 1.4))
+    ]
 
     if len(candidates) < 4:
         return None
@@ -210,10 +249,155 @@ def detect_bubbles(gray: np.ndarray, markers: Dict) -> List[Dict]:
     return bubble_positions
 
 
+def _template_bubble_grid() -> np.ndarray:
+    """Centros das 90x5 bolhas no template (150 DPI), em ordem de questão."""
+    points = np.zeros((NUM_QUESTIONS, len(OPTIONS), 2), dtype=np.float32)
+    x0, y0 = TEMPLATE_GRID_START
+
+    for col_idx in range(NUM_COLUMNS):
+        for row_idx in range(QUESTIONS_PER_COLUMN):
+            q_idx = col_idx * QUESTIONS_PER_COLUMN + row_idx
+            for opt_idx in range(len(OPTIONS)):
+                points[q_idx, opt_idx] = (
+                    x0 + col_idx * TEMPLATE_COLUMN_SPACING + opt_idx * TEMPLATE_OPTION_SPACING,
+                    y0 + row_idx * TEMPLATE_ROW_SPACING
+                )
+
+    return points
+
+
+TEMPLATE_BUBBLES = _template_bubble_grid()
+
+
+def project_template_bubbles(markers: Dict) -> List[Dict]:
+    """
+    Projeta as bolhas do template na imagem usando a homografia dos marcadores.
+
+    Args:
+        markers: Dicionário com posições dos marcadores (find_grid_markers)
+
+    Returns:
+        Lista de dicts com 'question' e 'options', no mesmo formato de detect_bubbles
+    """
+    keys = ('TL', 'TR', 'BL', 'BR')
+    src = np.float32([TEMPLATE_MARKERS[k] for k in keys])
+    dst = np.float32([markers[k] for k in keys])
+    H = cv2.getPerspectiveTransform(src, dst)
+
+    projected = cv2.perspectiveTransform(TEMPLATE_BUBBLES.reshape(-1, 1, 2), H)
+    projected = np.rint(projected.reshape(NUM_QUESTIONS, len(OPTIONS), 2)).astype(int)
+
+    # Escala pela distância entre marcadores (média horizontal/vertical)
+    scale_x = np.linalg.norm(dst[1] - dst[0]) / np.linalg.norm(src[1] - src[0])
+    scale_y = np.linalg.norm(dst[2] - dst[0]) / np.linalg.norm(src[2] - src[0])
+    r = max(1, int(round(TEMPLATE_BUBBLE_RADIUS * (scale_x + scale_y) / 2)))
+
+    bubble_positions = []
+    for q_idx in range(NUM_QUESTIONS):
+        options = []
+        for opt_idx, opt in enumerate(OPTIONS):
+            x, y = projected[q_idx, opt_idx]
+            options.append({
+                'option': opt,
+                'x': int(x),
+                'y': int(y),
+                'r': r
+            })
+        bubble_positions.append({
+            'question': q_idx + 1,
+            'options': options
+        })
+
+    return bubble_positions
+
+
+def _phantom_bubbles(coords: np.ndarray) -> List[np.ndarray]:
+    """
+    Bolhas fantasma de um grid completo (NUM_QUESTIONS x opções, em ordem
+    de questão): um passo além da primeira/última linha de cada coluna e
+    da primeira/última opção de cada questão, extrapolado na própria imagem.
+    """
+    grid = coords.reshape(NUM_COLUMNS, QUESTIONS_PER_COLUMN, len(OPTIONS), 3)
+    return [
+        (2 * grid[:, 0] - grid[:, 1]).reshape(-1, 3),           # linha acima de Q1
+        (2 * grid[:, -1] - grid[:, -2]).reshape(-1, 3),         # linha abaixo da última
+        (2 * grid[:, :, 0] - grid[:, :, 1]).reshape(-1, 3),     # opção antes de A
+        (2 * grid[:, :, -1] - grid[:, :, -2]).reshape(-1, 3),   # opção depois de E
+    ]
+
+
+def check_template_fit(gray: np.ndarray, bubble_positions: List[Dict]) -> bool:
+    """
+    Verificação barata de que a projeção do template caiu sobre as bolhas.
+
+    Em 16 direções ao redor de cada bolha compara o cinza do contorno
+    previsto (o pixel mais escuro entre 0.8r e 1.2r) com o do papel logo
+    fora dele (1.5r). Bolhas em branco e preenchidas têm contorno escuro e
+    entorno claro em todas as direções; uma projeção deslocada não.
+
+    Um grid deslocado de uma linha inteira (ou de uma opção) ainda cai
+    quase todo sobre bolhas reais; por isso, com o grid completo, as bolhas
+    fantasma logo fora dele também são verificadas e não podem bater.
+
+    Returns:
+        True se a fração de bolhas confirmadas >= TEMPLATE_MIN_MATCH e
+        nenhum conjunto fantasma passa de TEMPLATE_MAX_PHANTOM
+    """
+    h, w = gray.shape
+
+    coords = np.array(
+        [[opt['x'], opt['y'], opt['r']]
+         for q in bubble_positions for opt in q['options']],
+        dtype=np.float32
+    )
+    if len(coords) == 0:
+        return False
+
+    angles = np.linspace(0, 2 * np.pi, 16, endpoint=False)
+    cos, sin = np.cos(angles), np.sin(angles)
+
+    def matched(points):
+        cx, cy, r = points[:, 0, None, None], points[:, 1, None, None], points[:, 2, None, None]
+
+        def ring(factors):
+            f = np.asarray(factors, dtype=np.float32)[None, None, :]
+            xs = np.clip(np.rint(cx + r * f * cos[None, :, None]), 0, w - 1).astype(np.intp)
+            ys = np.clip(np.rint(cy + r * f * sin[None, :, None]), 0, h - 1).astype(np.intp)
+            return gray[ys, xs].astype(np.int16)  # (n_bolhas, 16, n_raios)
+
+        edge = ring([0.8, 0.9, 1.0, 1.1, 1.2]).min(axis=2)
+        outside = ring([1.5])[:, :, 0]
+
+        # Bolha confirmada: contorno encontrado em pelo menos 3/4 das direções
+        hits = ((outside - edge) >= TEMPLATE_MIN_CONTRAST).mean(axis=1)
+        return float((hits >= 0.75).mean())
+
+    if matched(coords) < TEMPLATE_MIN_MATCH:
+        return False
+
+    if len(coords) != NUM_QUESTIONS * len(OPTIONS):
+        return True
+    return all(matched(phantom) <= TEMPLATE_MAX_PHANTOM for phantom in _phantom_bubbles(coords))
+
+
 # ============================================================
 # ANÁLISE DE BOLHAS
 # ============================================================
 
+@lru_cache(maxsize=32)
+def _circle_offsets(r: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Offsets (dy, dx) dos pixels dentro da máscara circular de raio r.
+
+    A máscara é a mesma usada por analyze_bubble (janela 2r x 2r com
+    cv2.circle centrado em (r, r)), calculada uma única vez por raio.
+    """
+    mask = np.zeros((2 * r, 2 * r), dtype=np.uint8)
+    cv2.circle(mask, (r, r), r, 255, -1)
+    dy, dx = np.nonzero(mask)
+    return (dy - r).astype(np.intp), (dx - r).astype(np.intp)
+
+
 def analyze_bubble(gray: np.ndarray, x: int, y: int, r: int = 12) -> float:
     """
     Analisa uma bolha e retorna o percentual de pixels escuros.
@@ -245,24 +429,65 @@ def analyze_bubble(gray: np.ndarray, x: int, y: int, r: int = 12) -> float:
     return (dark / total * 100) if total > 0 else 0.0
 
 
-def detect_answer(gray: np.ndarray, options: List[Dict]) -> Tuple[Optional[str], Dict]:
+def sample_bubbles(gray: np.ndarray, bubble_positions: List[Dict]) -> np.ndarray:
     """
-    Detecta qual opção foi marcada para uma questão.
+    Calcula a escuridão de todas as bolhas da folha de uma vez.
+
+    Equivalente a chamar analyze_bubble para cada opção, mas agrupa as
+    bolhas por raio e coleta os pixels de todas as máscaras circulares
+    com uma única indexação NumPy por raio.
 
     Args:
         gray: Imagem em escala de cinza
-        options: Lista de opções com posições
+        bubble_positions: Saída de detect_bubbles (questões com 5 opções)
+
+    Returns:
+        Matriz (n_questões, 5) com o percentual de pixels escuros (0-100)
+    """
+    h, w = gray.shape
+    n_options = len(OPTIONS)
+
+    coords = np.array(
+        [[opt['x'], opt['y'], opt.get('r', 12)]
+         for q in bubble_positions for opt in q['options']],
+        dtype=np.intp
+    ).reshape(-1, 3)
+
+    darkness = np.zeros(len(coords), dtype=np.float64)
+
+    for r in np.unique(coords[:, 2]):
+        r = int(r)
+        idx = np.nonzero(coords[:, 2] == r)[0]
+        dy, dx = _circle_offsets(r)
+        if dy.size == 0:
+            continue
+
+        # Mesmo clamp de analyze_bubble: janela inteira dentro da imagem
+        xs = np.maximum(np.minimum(coords[idx, 0], w - r - 1), r)
+        ys = np.maximum(np.minimum(coords[idx, 1], h - r - 1), r)
+
+        pixels = gray[ys[:, None] + dy[None, :], xs[:, None] + dx[None, :]]
+        dark = np.count_nonzero(pixels < DARK_PIXEL_VALUE, axis=1)
+        darkness[idx] = dark / dy.size * 100
+
+    return darkness.reshape(-1, n_options)
+
+
+def detect_answer(darkness: np.ndarray) -> Tuple[Optional[str], Dict]:
+    """
+    Detecta qual opção foi marcada para uma questão.
+
+    Args:
+        darkness: Percentual de pixels escuros de cada opção (A-E),
+            uma linha da matriz retornada por sample_bubbles
 
     Returns:
         (resposta, stats) - resposta detectada e estatísticas
     """
-    results = []
-    for opt in options:
-        darkness = analyze_bubble(gray, opt['x'], opt['y'], opt.get('r', 12))
-        results.append({
-            'option': opt['option'],
-            'darkness': round(darkness, 1)
-        })
+    results = [
+        {'option': OPTIONS[i], 'darkness': round(float(d), 1)}
+        for i, d in enumerate(darkness)
+    ]
 
     results.sort(key=lambda r: r['darkness'], reverse=True)
 
@@ -309,40 +534,23 @@ def read_qr_code(image: np.ndarray) -> Tuple[Optional[str], int]:
     """
     Lê o QR Code do gabarito e extrai sheet_code e dia.
 
+    Com um SheetContext, o texto do QR já decodificado por outro leitor
+    (qr_reader_module) é reaproveitado em vez de decodificar de novo.
+
     Args:
-        image: Imagem BGR ou grayscale
+        image: Imagem BGR ou grayscale, ou SheetContext
 
     Returns:
         Tuple (sheet_code, start_question):
         - sheet_code: Código do gabarito (ex: XTRI-U6M9R7) ou None
         - start_question: 1 para DIA 1, 91 para DIA 2
     """
-    try:
-        from pyzbar import pyzbar
-    except ImportError:
-        return None, 1
-
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
-    h, w = gray.shape
-
-    qr_data = None
-
-    # Tentar ROI do canto superior direito primeiro
-    roi = gray[0:int(h*0.3), int(w*0.6):w]
-    for obj in pyzbar.decode(roi):
-        if obj.type == 'QRCODE':
-            qr_data = obj.data.decode('utf-8').strip()
-            break
-
-    # Fallback: imagem completa
-    if qr_data is None:
-        for obj in pyzbar.decode(gray):
-            if obj.type == 'QRCODE':
-                qr_data = obj.data.decode('utf-8').strip()
-                break
+    ctx = SheetContext.of(image)
+    qr_data = ctx.memo('qr_text', lambda: _decode_sheet_qr(ctx.gray))
 
     if qr_data is None:
         return None, 1
+    qr_data = qr_data.strip()
 
     # Parsear formato: XTRI-BJC3VP-D1 ou XTRI-BJC3VP-D2
     if qr_data.endswith('-D2'):
@@ -356,16 +564,40 @@ def read_qr_code(image: np.ndarray) -> Tuple[Optional[str], int]:
         return qr_data, 1
 
 
+def _decode_sheet_qr(gray: np.ndarray) -> Optional[str]:
+    """Decodifica o QR (ROI do canto superior direito, depois página inteira)."""
+    try:
+        from pyzbar import pyzbar
+    except ImportError:
+        return None
+
+    h, w = gray.shape
+
+    # Tentar ROI do canto superior direito primeiro
+    roi = gray[0:int(h*0.3), int(w*0.6):w]
+    for obj in pyzbar.decode(roi):
+        if obj.type == 'QRCODE':
+            return obj.data.decode('utf-8').strip()
+
+    # Fallback: imagem completa
+    for obj in pyzbar.decode(gray):
+        if obj.type == 'QRCODE':
+            return obj.data.decode('utf-8').strip()
+
+    return None
+
+
 # ============================================================
 # PROCESSAMENTO PRINCIPAL
 # ============================================================
 
-def process_answer_sheet(image: np.ndarray) -> Dict[str, Any]:
+def process_answer_sheet(image: np.ndarray, mode: str = None) -> Dict[str, Any]:
     """
     Processa uma imagem de gabarito e extrai todas as respostas.
 
     Args:
-        image: Imagem BGR do gabarito
+        image: Imagem BGR/grayscale do gabarito ou SheetContext
+        mode: 'auto', 'template' ou 'hough' (padrão: DETECTION_MODE)
 
     Returns:
         Dict com:
@@ -373,12 +605,17 @@ def process_answer_sheet(image: np.ndarray) -> Dict[str, Any]:
             - sheet_code: str ou None
             - answers: Dict[str, str] (número -> letra)
             - stats: Dict com answered, blank, double_marked
+            - detection: 'template' ou 'hough' (caminho usado para as bolhas)
             - error: str (se success=False)
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    mode = mode or DETECTION_MODE
+    ctx = SheetContext.of(image)
+    with ctx.stage('gray'):
+        gray = ctx.gray
 
     # Ler QR Code para obter sheet_code e start_question
-    sheet_code, start_question = read_qr_code(image)
+    with ctx.stage('qr'):
+        sheet_code, start_question = read_qr_code(ctx)
 
     result = {
         'success': False,
@@ -389,17 +626,30 @@ def process_answer_sheet(image: np.ndarray) -> Dict[str, Any]:
             'answered': 0,
             'blank': 0,
             'double_marked': 0
-        }
+        },
+        'detection': None
     }
 
     # 1. Encontrar marcadores
-    markers = find_grid_markers(gray)
+    with ctx.stage('markers'):
+        markers = find_grid_markers(ctx)
     if not markers:
         result['error'] = 'Marcadores do grid não encontrados'
         return result
 
-    # 2. Detectar e organizar bolhas
-    bubble_positions = detect_bubbles(gray, markers)
+    # 2. Posições das bolhas: projeção do template (rápido) ou Hough
+    bubble_positions = []
+    with ctx.stage('bubbles'):
+        if mode in ('auto', 'template'):
+            bubble_positions = project_template_bubbles(markers)
+            if check_template_fit(gray, bubble_positions):
+                result['detection'] = 'template'
+            else:
+                bubble_positions = []
+
+        if not bubble_positions and mode in ('auto', 'hough'):
+            bubble_positions = detect_bubbles(gray, markers)
+            result['detection'] = 'hough'
 
     if len(bubble_positions) != 90:
         result['error'] = f'Mapeamento incorreto: {len(bubble_positions)} questões detectadas'
@@ -409,18 +659,23 @@ def process_answer_sheet(image: np.ndarray) -> Dict[str, Any]:
     # Aplicar offset baseado no start_question (1 para DIA 1, 91 para DIA 2)
     question_offset = start_question - 1
 
-    for q_data in bubble_positions:
-        q_num = q_data['question'] + question_offset  # Ajusta numeração
-        answer, stats = detect_answer(gray, q_data['options'])
+    # Escuridão das 90x5 bolhas calculada em lote
+    with ctx.stage('sampling'):
+        darkness = sample_bubbles(gray, bubble_positions)
 
-        result['answers'][str(q_num)] = answer
+    with ctx.stage('decision'):
+        for q_data, row in zip(bubble_positions, darkness):
+            q_num = q_data['question'] + question_offset  # Ajusta numeração
+            answer, stats = detect_answer(row)
 
-        if answer:
-            result['stats']['answered'] += 1
-        elif stats.get('warning') == 'double_mark':
-            result['stats']['double_marked'] += 1
-        else:
-            result['stats']['blank'] += 1
+            result['answers'][str(q_num)] = answer
+
+            if answer:
+                result['stats']['answered'] += 1
+            elif stats.get('warning') == 'double_mark':
+                result['stats']['double_marked'] += 1
+            else:
+                result['stats']['blank'] += 1
 
     result['success'] = True
     return result
@@ -463,27 +718,71 @@ def process_pdf(filepath: str, page: int = 1, dpi: int = 150) -> Dict[str, Any]:
         Resultado do processamento
     """
     try:
-        from pdf2image import convert_from_path
-    except ImportError:
+        pages = list(iter_pdf_pages(filepath, dpi=dpi, first_page=page, last_page=page))
+    except PdfError as e:
         return {
             'success': False,
-            'error': 'pdf2image não instalado'
+            'error': str(e)
         }
 
-    pages = convert_from_path(filepath, dpi=dpi, first_page=page, last_page=page)
     if not pages:
         return {
             'success': False,
             'error': f'Não foi possível converter página {page}'
         }
 
-    image = cv2.cvtColor(np.array(pages[0]), cv2.COLOR_RGB2BGR)
-    result = process_answer_sheet(image)
-    result['page'] = page
+    return _process_pdf_page(*pages[0])
+
 
+def _process_pdf_page(page: int, gray: np.ndarray) -> Dict[str, Any]:
+    result = process_answer_sheet(gray)
+    result['page'] = page
     return result
 
 
+def process_pdf_pages(source, dpi: int = 150, executor=None,
+                      window: int = 4) -> Iterator[Dict[str, Any]]:
+    """
+    Processa todas as páginas de um PDF, abrindo o arquivo uma única vez.
+
+    Com um executor (ex.: ProcessPoolExecutor), a leitura OMR das páginas
+    roda nele enquanto as próximas são renderizadas, com no máximo
+    `window` páginas em andamento.
+
+    Args:
+        source: Caminho do PDF ou bytes
+        dpi: Resolução da renderização
+        executor: concurrent.futures.Executor opcional
+        window: Páginas em andamento no executor
+
+    Yields:
+        Resultado de cada página (com 'page'), na ordem do PDF
+
+    Raises:
+        PdfError: se o PDF não puder ser aberto
+    """
+    pages = iter_pdf_pages(source, dpi=dpi)
+
+    if executor is None:
+        for page, gray in pages:
+            yield _process_pdf_page(page, gray)
+        return
+
+    pending = deque()
+    try:
+        for page, gray in pages:
+            pending.append(executor.submit(_process_pdf_page, page, gray))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        pages.close()
+
+
 def process_image_bytes(image_bytes: bytes) -> Dict[str, Any]:
     """
     Processa imagem a partir de bytes.
@@ -494,16 +793,16 @@ def process_image_bytes(image_bytes: bytes) -> Dict[str, Any]:
     Returns:
         Resultado do processamento
     """
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    # Decode direto para grayscale (JPEG de alta resolução já reduzido)
+    ctx = SheetContext.from_bytes(image_bytes)
 
-    if image is None:
+    if ctx is None:
         return {
             'success': False,
             'error': 'Não foi possível decodificar a imagem'
         }
 
-    return process_answer_sheet(image)
+    return process_answer_sheet(ctx)
 
 
 # ============================================================
@@ -13,7 +13,7 @@ import json
 import numpy as np
 
 # Importar motor TRI V2 do arquivo LOCAL (versão corrigida com coerência)
-from tri_v2_producao import TRIProcessadorV2 as ProcessadorTRICompleto, TabelaReferenciaTRI
+from tri_v2_producao import TRIProcessadorV2 as ProcessadorTRICompleto, TabelaReferenciaTRI, CuboTRIAnual
 
 app = Flask(__name__)
 CORS(app)
@@ -35,20 +35,41 @@ app.json_encoder = NumpyEncoder
 # CONFIGURAÇÃO GLOBAL
 # ============================================================================
 
-TABELA_TRI_PATH = os.path.join(
-    os.path.dirname(__file__),
-    'tri_tabela_referencia_oficial.csv'
-)
+# Tabela em JSON (só stdlib, conferida pelo .sha256 ao lado). Um .csv também
+# é aceito, mas exige pandas.
+TABELA_TRI_PATH = os.getenv('TABELA_TRI_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'tri_tabela_referencia_oficial.json'
+))
+
+# O .sha256 ao lado da tabela e do cubo é obrigatório; TRI_EXIGIR_CHECKSUM=0
+# carrega sem ele (ex.: tabela de teste), conferindo só quando existir
+TRI_EXIGIR_CHECKSUM = os.getenv('TRI_EXIGIR_CHECKSUM', '1') != '0'
 
 # Instanciar processador (carrega tabela UMA VEZ)
 try:
-    tabela_referencia = TabelaReferenciaTRI(TABELA_TRI_PATH)
+    tabela_referencia = TabelaReferenciaTRI(TABELA_TRI_PATH, exigir_checksum=TRI_EXIGIR_CHECKSUM)
+    tabela_referencia.validar()
     processador = ProcessadorTRICompleto(tabela_referencia)
     print(f"✅ Processador TRI V2 inicializado com tabela: {TABELA_TRI_PATH}")
 except Exception as e:
     print(f"❌ ERRO ao carregar tabela TRI: {e}")
     processador = None
 
+# Cubo por edição (compilar_tabela_tri.py): permite escolher as edições de
+# referência por requisição ("anos" em /api/calcular-tri)
+TRI_CUBO_PATH = os.getenv('TRI_CUBO_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'tri_cubo_anual.npz'
+))
+
+try:
+    cubo_tri = CuboTRIAnual(TRI_CUBO_PATH, exigir_checksum=TRI_EXIGIR_CHECKSUM)
+    print(f"✅ Cubo TRI por edição carregado: {cubo_tri.anos}")
+except Exception as e:
+    print(f"⚠️ Cubo TRI por edição indisponível ({e}): 'anos' não será aceito")
+    cubo_tri = None
+
 
 # ============================================================================
 # ENDPOINTS
@@ -93,7 +114,8 @@ def calcular_tri():
         "CH": [46, 90],
         "CN": [1, 45],
         "MT": [46, 90]
-      }
+      },
+      "anos": {"ultimas": 5}  // opcional: edições de referência (ver CuboTRIAnual.pesos)
     }
     
     Saída JSON:
@@ -183,15 +205,35 @@ def calcular_tri():
         
         alunos = alunos_convertidos
         
+        # Edições de referência: sem "anos", usa a tabela oficial agregada
+        processador_turma = processador
+        anos_referencia = None
+        if data.get('anos') is not None:
+            if cubo_tri is None:
+                return jsonify({
+                    'status': 'erro',
+                    'mensagem': 'Seleção de anos indisponível (cubo TRI por edição não carregado)'
+                }), 503
+            try:
+                pesos = cubo_tri.pesos(data['anos'])
+                processador_turma = ProcessadorTRICompleto(cubo_tri.tabela(pesos))
+            except (ValueError, TypeError) as e:
+                return jsonify({
+                    'status': 'erro',
+                    'mensagem': str(e)
+                }), 400
+            anos_referencia = {str(ano): peso for ano, peso in pesos}
+        
         print(f"\n{'='*100}")
         print(f"[TRI SERVICE] Processando {len(alunos)} alunos...")
         print(f"[TRI SERVICE] Gabarito: {len(gabarito)} questões")
         print(f"[TRI SERVICE] Áreas: {list(areas_config.keys())}")
+        print(f"[TRI SERVICE] Edições: {anos_referencia or 'tabela oficial'}")
         print(f"[TRI SERVICE] Primeiro aluno tem chaves: {list(alunos[0].keys())[:10]}..." if alunos else "")
         print(f"{'='*100}")
         
         # Processar com TRI V2
-        prova_analysis, resultados = processador.processar_turma(
+        prova_analysis, resultados = processador_turma.processar_turma(
             alunos=alunos,
             gabarito=gabarito,
             areas_config=areas_config
@@ -223,6 +265,7 @@ def calcular_tri():
             'status': 'sucesso',
             'total_alunos': len(alunos),
             'prova_analysis': prova_analysis_converted,
+            'anos_referencia': anos_referencia,
             'resultados': resultados_converted
         }), 200
         
@@ -252,7 +295,12 @@ def debug():
         'version': '2.0.0',
         'tabela_tri_path': TABELA_TRI_PATH,
         'tabela_carregada': processador is not None,
-        'tabela_linhas': len(processador.tabela.df) if processador else 0,
+        'tabela_linhas': len(processador.tabela) if processador else 0,
+        'tabela_checksum': processador.tabela.checksum if processador else None,
+        'cubo_tri_path': TRI_CUBO_PATH,
+        'cubo_anos': cubo_tri.anos if cubo_tri else [],
+        'cubo_checksum': cubo_tri.checksum if cubo_tri else None,
+        'cubo_cache': cubo_tri.tabela.cache_info()._asdict() if cubo_tri else None,
         'python_version': sys.version,
         'flask_version': '3.0.0',
     }), 200
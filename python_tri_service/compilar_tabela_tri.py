@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+COMPILAÇÃO DA TABELA TRI POR EDIÇÃO
+
+Lê a tabela bruta do ENEM (tri/TRI ENEM DE 2009 A 2023 MIN MED E MAX.csv:
+separada por ';', decimais com vírgula, uma linha por área/acertos/ano) e
+grava o cubo binário usado pelo serviço (CuboTRIAnual):
+
+    tri_cubo_anual.npz
+        anos   (Y,)             edições, em ordem crescente
+        areas  (A,)             LC, CH, CN, MT
+        cubo   (Y, A, 46, 3)    tri_min, tri_med, tri_max (NaN = sem linha)
+    tri_cubo_anual.npz.sha256   checksum conferido na carga
+
+Linhas vazias são ignoradas e decimais digitados com espaço ('820 8') são
+aceitos; ambos aparecem no resumo.
+
+Uso:
+    python compilar_tabela_tri.py
+    python compilar_tabela_tri.py --entrada outra_tabela.csv --saida tri_cubo_anual.npz
+"""
+
+import os
+import csv
+import hashlib
+import argparse
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from tri_v2_producao import COLUNAS_TRI, TRI_MAXIMA_OFICIAL
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+ENTRADA_PADRAO = os.path.join(DIR, '..', 'tri', 'TRI ENEM DE 2009 A 2023 MIN MED E MAX.csv')
+SAIDA_PADRAO = os.path.join(DIR, 'tri_cubo_anual.npz')
+
+# Coluna da tabela bruta -> coluna TRI
+COLUNAS_BRUTAS = {'min': 'tri_min', 'media': 'tri_med', 'max': 'tri_max'}
+
+
+def _numero(texto: str) -> float:
+    """'300,1' / '300' / '820 8' -> float."""
+    return float(texto.strip().replace(',', '.').replace(' ', '.'))
+
+
+def ler_tabela_bruta(path: str) -> Tuple[Dict[Tuple[int, str, int], Tuple[float, ...]], List[str]]:
+    """
+    Returns:
+        ({(ano, area, acertos): (tri_min, tri_med, tri_max)}, avisos)
+    """
+    linhas = {}
+    avisos = []
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for n, row in enumerate(csv.DictReader(f, delimiter=';'), start=2):
+            chave = (int(row['ano']), row['area'].strip(), int(row['acertos']))
+            brutos = {col: row[origem] for origem, col in COLUNAS_BRUTAS.items()}
+
+            if not all(valor.strip() for valor in brutos.values()):
+                avisos.append(f"linha {n}: {chave} sem valores, ignorada")
+                continue
+            if any(' ' in valor.strip() for valor in brutos.values()):
+                avisos.append(f"linha {n}: {chave} decimal com espaço {brutos}")
+
+            valores = tuple(_numero(brutos[col]) for col in COLUNAS_TRI)
+            if chave in linhas and linhas[chave] != valores:
+                avisos.append(f"linha {n}: {chave} duplicada com valores diferentes, mantida a última")
+            linhas[chave] = valores
+    return linhas, avisos
+
+
+def compilar_cubo(linhas: Dict[Tuple[int, str, int], Tuple[float, ...]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    anos = sorted({ano for ano, _, _ in linhas})
+    areas = [area for area in TRI_MAXIMA_OFICIAL if any(a == area for _, a, _ in linhas)]
+    max_acertos = max(acertos for _, _, acertos in linhas)
+
+    cubo = np.full((len(anos), len(areas), max_acertos + 1, len(COLUNAS_TRI)), np.nan)
+    for (ano, area, acertos), valores in linhas.items():
+        if area in areas:
+            cubo[anos.index(ano), areas.index(area), acertos] = valores
+    return np.array(anos, dtype=np.int16), np.array(areas), cubo
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compila a tabela TRI bruta por edição em cubo binário')
+    parser.add_argument('--entrada', default=ENTRADA_PADRAO, help='CSV bruto (area;acertos;min;max;media;ano)')
+    parser.add_argument('--saida', default=SAIDA_PADRAO, help='Arquivo .npz gerado')
+    args = parser.parse_args()
+
+    linhas, avisos = ler_tabela_bruta(args.entrada)
+    anos, areas, cubo = compilar_cubo(linhas)
+
+    np.savez_compressed(args.saida, anos=anos, areas=areas, cubo=cubo)
+    with open(args.saida, 'rb') as f:
+        checksum = hashlib.sha256(f.read()).hexdigest()
+    with open(f'{args.saida}.sha256', 'w', encoding='utf-8') as f:
+        f.write(f"{checksum}  {os.path.basename(args.saida)}\n")
+
+    print(f"✅ {len(linhas)} linhas -> {args.saida} {cubo.shape}")
+    print(f"   Edições: {anos.tolist()}")
+    print(f"   Áreas: {areas.tolist()}")
+    lacunas = np.isnan(cubo[..., 0])
+    for i, ano in enumerate(anos):
+        for j, area in enumerate(areas):
+            faltando = np.flatnonzero(lacunas[i, j]).tolist()
+            if faltando:
+                print(f"   {ano} {area}: sem linha para acertos {faltando}")
+    for aviso in avisos:
+        print(f"⚠️  {aviso}")
+
+
+if __name__ == '__main__':
+    main()
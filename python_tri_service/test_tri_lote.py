@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TESTE DE PARIDADE: CAMINHO VETORIZADO x ESCALAR (TRI V2)
+
+Gera entradas aleatórias (incluindo as bordas: zero acertos, acertos acima
+da tabela, coerência exatamente 0.5, taxas em 0.3) e confere que
+analisar_lote / calcular_lote / processar_turma dão exatamente o mesmo
+resultado de analisar / calcular / processar_aluno.
+
+Roda offline, sem o serviço:
+    python test_tri_lote.py [n_casos]
+    python -m pytest test_tri_lote.py
+"""
+
+import os
+import sys
+import random
+
+import numpy as np
+
+from tri_v2_producao import (TabelaReferenciaTRI, AlunoCoherenceAnalyzer, AnaliseCoerencia,
+                             TRICalculator, TRIProcessadorV2, DIFICULDADES)
+
+AREAS = ['LC', 'CH', 'CN', 'MT']
+TABELA_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tri_tabela_referencia_oficial.json')
+
+SEED = 20260101
+N_CASOS_PYTEST = 500
+
+
+def sortear_por_dificuldade(rng: random.Random) -> list:
+    if rng.random() < 0.1:
+        return [0] * 5
+    return [rng.randint(0, 10) for _ in DIFICULDADES]
+
+
+def sortear_peso(rng: random.Random) -> float:
+    return rng.choice([0.0, 0.5, 1.0, rng.random()])
+
+
+def sortear_coerencia(rng: random.Random) -> float:
+    return rng.choice([0.0, 0.25, 0.5, 0.75, 1.0, rng.random()])
+
+
+def sortear_taxa(rng: random.Random) -> float:
+    return rng.choice([0.0, 0.3, 0.31, rng.random()])
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# CHECAGENS DE PARIDADE
+# ════════════════════════════════════════════════════════════════════════════════
+
+def checar_analisar_lote(rng: random.Random, n: int):
+    por_dificuldade = [sortear_por_dificuldade(rng) for _ in range(n)]
+    pesos = [sortear_peso(rng) for _ in range(n)]
+
+    lote = AlunoCoherenceAnalyzer.analisar_lote(np.array(por_dificuldade), np.array(pesos))
+
+    for i in range(n):
+        respostas = dict(zip(DIFICULDADES, por_dificuldade[i]))
+        respostas['_peso_dificuldade'] = pesos[i]
+        analise = AlunoCoherenceAnalyzer(respostas).analisar()
+        for campo, valores in lote.items():
+            assert getattr(analise, campo) == valores[i], \
+                f"analisar_lote[{i}].{campo}: {valores[i]} != {getattr(analise, campo)} ({respostas})"
+
+    print(f"✓ analisar_lote == analisar ({n} alunos)")
+
+
+def checar_calcular_lote(tabela: TabelaReferenciaTRI, rng: random.Random, n: int):
+    calculator = TRICalculator(tabela)
+
+    acertos = np.array([[rng.choice([0, 1, 45, 50, rng.randint(0, 46)]) for _ in AREAS] for _ in range(n)])
+    coerencia = np.array([[sortear_coerencia(rng) for _ in AREAS] for _ in range(n)])
+    taxa_muito_dificil = np.array([[sortear_taxa(rng) for _ in AREAS] for _ in range(n)])
+    taxa_dificil = np.array([[sortear_taxa(rng) for _ in AREAS] for _ in range(n)])
+
+    for com_coerencia in (True, False):
+        if com_coerencia:
+            lote = calculator.calcular_lote(AREAS, acertos, coerencia, taxa_muito_dificil, taxa_dificil)
+        else:
+            lote = calculator.calcular_lote(AREAS, acertos)
+
+        for i in range(n):
+            for j, area in enumerate(AREAS):
+                analise = None
+                if com_coerencia:
+                    analise = AnaliseCoerencia(
+                        coerencia=coerencia[i, j], padrao_resposta='',
+                        taxa_muito_facil=0.0, taxa_facil=0.0, taxa_media=0.0,
+                        taxa_dificil=taxa_dificil[i, j], taxa_muito_dificil=taxa_muito_dificil[i, j]
+                    )
+                relacao = {k: tabela.obter(k, int(acertos[i, m]))['tri_med']
+                           for m, k in enumerate(AREAS) if k != area}
+                resultado = calculator.calcular(area, int(acertos[i, j]), analise, relacao)
+
+                esperado = {
+                    'tri_baseline': resultado.tri_baseline,
+                    'ajuste_coerencia': resultado.ajuste_coerencia,
+                    'ajuste_relacao': resultado.ajuste_relacao,
+                    'penalidade': resultado.penalidade,
+                    'tri_ajustado': resultado.tri_ajustado
+                }
+                for campo, valor in esperado.items():
+                    assert lote[campo][i, j] == valor, \
+                        f"calcular_lote[{i}, {area}].{campo}: {lote[campo][i, j]} != {valor}"
+
+                motivo = TRICalculator.motivo_lote(
+                    area, int(acertos[i, j]), lote['tri_baseline'][i, j], coerencia[i, j],
+                    lote['bonus_coerencia'][i, j], lote['penalidade'][i, j],
+                    lote['bonus_dificil'][i, j], lote['limitado'][i, j]
+                )
+                assert motivo == resultado.motivo, f"motivo[{i}, {area}]: {motivo!r} != {resultado.motivo!r}"
+
+    print(f"✓ calcular_lote == calcular ({n} alunos x {len(AREAS)} áreas, com e sem coerência)")
+
+
+def checar_processar_turma(tabela: TabelaReferenciaTRI, rng: random.Random, n: int):
+    processador = TRIProcessadorV2(tabela)
+    gabarito = {str(q): rng.choice('ABCDE') for q in range(1, 181)}
+    areas_config = {'LC': [1, 45], 'CH': [46, 90], 'CN': [91, 135], 'MT': [136, 180]}
+
+    alunos = []
+    for i in range(n):
+        habilidade = rng.random()
+        aluno = {'nome': f'Aluno {i}'}
+        for q in range(1, 181):
+            if rng.random() < habilidade:
+                aluno[f'q{q}'] = gabarito[str(q)]
+            else:
+                aluno[f'q{q}'] = rng.choice(['A', 'B', 'C', 'D', 'E', '', 'X'])
+        alunos.append(aluno)
+
+    # processar_turma escreve o log da turma no stdout
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        _, resultados = processador.processar_turma(alunos, gabarito, areas_config)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    # Recalcula cada aluno pelo caminho escalar, a partir do próprio detalhe
+    # por dificuldade da turma (mesmos acertos e coerência)
+    pct_questao = {}
+    for q in range(1, 181):
+        acertos = sum(1 for aluno in alunos if aluno[f'q{q}'] not in ('', 'X') and aluno[f'q{q}'] == gabarito[str(q)])
+        pct_questao[q] = acertos / len(alunos)
+
+    for aluno, resultado in zip(alunos, resultados):
+        respostas_por_dificuldade = {}
+        for area, (inicio, fim) in areas_config.items():
+            contagem = dict.fromkeys(DIFICULDADES, 0)
+            acertadas = []
+            for q in range(inicio, fim + 1):
+                if aluno[f'q{q}'] == gabarito[str(q)]:
+                    pct = pct_questao[q]
+                    dif = ('muito_facil' if pct >= 0.80 else 'facil' if pct >= 0.60 else
+                           'media' if pct >= 0.40 else 'dificil' if pct >= 0.20 else 'muito_dificil')
+                    contagem[dif] += 1
+                    acertadas.append(q)
+            peso = 0.0
+            for q in acertadas:
+                peso += 1.0 - pct_questao[q]
+            contagem['_peso_dificuldade'] = peso / len(acertadas) if acertadas else 0.5
+            respostas_por_dificuldade[area] = contagem
+
+        esperado = processador.processar_aluno(
+            lc_acertos=resultado['lc_acertos'],
+            ch_acertos=resultado['ch_acertos'],
+            cn_acertos=resultado['cn_acertos'],
+            mt_acertos=resultado['mt_acertos'],
+            respostas_por_dificuldade=respostas_por_dificuldade
+        )
+        for chave, valor in esperado.items():
+            assert resultado[chave] == valor, f"{aluno['nome']}.{chave}: {resultado[chave]} != {valor}"
+
+    print(f"✓ processar_turma == processar_aluno ({n} alunos, 180 questões)")
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# PYTEST
+# ════════════════════════════════════════════════════════════════════════════════
+
+def carregar_tabela() -> TabelaReferenciaTRI:
+    tabela = TabelaReferenciaTRI(TABELA_JSON)
+    assert tabela.validar(), "Tabela inválida!"
+    return tabela
+
+
+def test_analisar_lote():
+    checar_analisar_lote(random.Random(SEED), N_CASOS_PYTEST)
+
+
+def test_calcular_lote():
+    checar_calcular_lote(carregar_tabela(), random.Random(SEED), N_CASOS_PYTEST)
+
+
+def test_processar_turma():
+    checar_processar_turma(carregar_tabela(), random.Random(SEED), min(N_CASOS_PYTEST, 200))
+
+
+if __name__ == '__main__':
+    n_casos = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(SEED)
+
+    print("=" * 100)
+    print("TESTE DE PARIDADE TRI V2: LOTE x ESCALAR")
+    print("=" * 100)
+
+    tabela = carregar_tabela()
+
+    checar_analisar_lote(rng, n_casos)
+    checar_calcular_lote(tabela, rng, n_casos)
+    checar_processar_turma(tabela, rng, min(n_casos, 500))
+
+    print("\n✅ TODOS OS TESTES PASSARAM!")
@@ -11,10 +11,13 @@
 ╚════════════════════════════════════════════════════════════════════════════════╝
 """
 
-import pandas as pd
 import json
+import math
+import hashlib
 import numpy as np
 from pathlib import Path
+from operator import itemgetter
+from functools import lru_cache
 from dataclasses import dataclass
 from typing import Dict, Tuple, Optional
 
@@ -34,6 +37,78 @@ TRI_MAXIMA_OFICIAL = {
 # 1. CARREGAMENTO DE TABELA DE REFERÊNCIA
 # ════════════════════════════════════════════════════════════════════════════════
 
+# Colunas do array denso da tabela (TabelaReferenciaTRI.valores / obter_lote)
+COLUNAS_TRI = ('tri_min', 'tri_med', 'tri_max')
+
+def verificar_checksum(path: str, obrigatorio: bool = True) -> Optional[str]:
+    """
+    Confere o arquivo contra o SHA-256 gravado ao lado (<arquivo>.sha256,
+    formato do sha256sum). Levanta ValueError se não bater.
+    
+    Args:
+        obrigatorio: sem o .sha256, levanta FileNotFoundError (True) ou
+                     carrega sem conferir (False)
+    
+    Returns:
+        Hash calculado, ou None se não houver .sha256 e não for obrigatório
+    """
+    checksum_path = f'{path}.sha256'
+    if not Path(checksum_path).exists():
+        if obrigatorio:
+            raise FileNotFoundError(
+                f"Checksum ausente: {checksum_path} (gere com: sha256sum {path} > {checksum_path})"
+            )
+        return None
+    
+    esperado = Path(checksum_path).read_text(encoding='utf-8').split()[0].lower()
+    calculado = hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    if calculado != esperado:
+        raise ValueError(f"Checksum inválido para {path}: {calculado} (esperado {esperado})")
+    return calculado
+
+
+def _ler_tabela_json(path: str) -> Dict[str, Dict[int, Dict[str, float]]]:
+    """{area: {acertos: {tri_min, tri_med, tri_max}}} (formato do .json oficial)."""
+    with open(path, encoding='utf-8') as f:
+        dados = json.load(f)
+    
+    return {
+        area: {
+            int(acertos): {col: round(float(valores[col]), 1) for col in COLUNAS_TRI}
+            for acertos, valores in linhas.items()
+        }
+        for area, linhas in dados.items()
+    }
+
+
+def _ler_tabela_csv(path: str) -> Dict[str, Dict[int, Dict[str, float]]]:
+    """Tabela em CSV (area, acertos, tri_min, tri_med, tri_max). Requer pandas."""
+    try:
+        import pandas as pd
+    except ImportError:
+        raise RuntimeError(f"pandas é necessário para ler {path}; use o .json da tabela")
+    
+    df = pd.read_csv(path)
+    
+    # Validar estrutura
+    required_cols = ['area', 'acertos', 'tri_min', 'tri_med', 'tri_max']
+    assert all(col in df.columns for col in required_cols), \
+        f"Tabela deve ter colunas: {required_cols}"
+    
+    lookup = {}
+    for area in df['area'].unique():
+        lookup[area] = {}
+        area_df = df[df['area'] == area]
+        for _, row in area_df.iterrows():
+            acertos = int(row['acertos'])
+            lookup[area][acertos] = {
+                'tri_min': round(row['tri_min'], 1),
+                'tri_med': round(row['tri_med'], 1),
+                'tri_max': round(row['tri_max'], 1)
+            }
+    return lookup
+
+
 class TabelaReferenciaTRI:
     """
     Gerenciador de tabela de referência TRI oficial.
@@ -44,32 +119,55 @@ class TabelaReferenciaTRI:
     - tri_min, tri_med, tri_max: valores agregados (média dos anos 2009-2023)
     """
     
-    def __init__(self, csv_path: str):
+    def __init__(self, path: str, exigir_checksum: bool = True):
         """
         Carrega tabela de referência agregada.
         
         Args:
-            csv_path: Caminho para 'tri_tabela_referencia_oficial.csv'
+            path: 'tri_tabela_referencia_oficial.json' (só stdlib) ou um .csv
+                  com as mesmas colunas (requer pandas). O arquivo é
+                  conferido contra '<path>.sha256' antes de carregar.
+            exigir_checksum: False aceita um arquivo sem '<path>.sha256'
         """
-        self.df = pd.read_csv(csv_path)
-        
-        # Validar estrutura
-        required_cols = ['area', 'acertos', 'tri_min', 'tri_med', 'tri_max']
-        assert all(col in self.df.columns for col in required_cols), \
-            f"Tabela deve ter colunas: {required_cols}"
-        
-        # Criar dicionário para lookup rápido
-        self.lookup = {}
-        for area in self.df['area'].unique():
-            self.lookup[area] = {}
-            area_df = self.df[self.df['area'] == area]
-            for _, row in area_df.iterrows():
-                acertos = int(row['acertos'])
-                self.lookup[area][acertos] = {
-                    'tri_min': round(row['tri_min'], 1),
-                    'tri_med': round(row['tri_med'], 1),
-                    'tri_max': round(row['tri_max'], 1)
-                }
+        self.path = path
+        self.checksum = verificar_checksum(path, exigir_checksum)
+        
+        # Dicionário para lookup rápido: {area: {acertos: {tri_min, tri_med, tri_max}}}
+        if str(path).endswith('.csv'):
+            self.lookup = _ler_tabela_csv(path)
+        else:
+            self.lookup = _ler_tabela_json(path)
+        self._montar_array()
+    
+    @classmethod
+    def de_lookup(cls, lookup: Dict[str, Dict[int, Dict[str, float]]]) -> 'TabelaReferenciaTRI':
+        """Tabela montada em memória ({area: {acertos: {tri_min, tri_med, tri_max}}})."""
+        tabela = cls.__new__(cls)
+        tabela.path = None
+        tabela.checksum = None
+        tabela.lookup = lookup
+        tabela._montar_array()
+        return tabela
+    
+    def _montar_array(self):
+        """Mesma tabela em array denso (área, acertos, coluna); acertos sem linha ficam NaN."""
+        self.areas = list(self.lookup.keys())
+        self.area_idx = {area: i for i, area in enumerate(self.areas)}
+        self.max_acertos = np.array([max(self.lookup[area].keys()) for area in self.areas])
+        self.valores = np.full((len(self.areas), int(self.max_acertos.max()) + 1, len(COLUNAS_TRI)), np.nan)
+        for i, area in enumerate(self.areas):
+            for acertos, valores in self.lookup[area].items():
+                self.valores[i, acertos] = [valores[col] for col in COLUNAS_TRI]
+    
+    def __len__(self) -> int:
+        """Número de linhas (área, acertos) da tabela."""
+        return sum(len(linhas) for linhas in self.lookup.values())
+    
+    def indice_area(self, area: str) -> int:
+        """Índice da área no array denso (para obter_lote)."""
+        if area not in self.area_idx:
+            raise ValueError(f"Área inválida: {area}")
+        return self.area_idx[area]
     
     def obter(self, area: str, acertos: int) -> Dict[str, float]:
         """
@@ -93,6 +191,30 @@ class TabelaReferenciaTRI:
         
         return self.lookup[area][acertos]
     
+    def obter_lote(self, area_idx, acertos) -> np.ndarray:
+        """
+        Versão vetorizada de obter(): consulta vários pares (área, acertos) de uma vez.
+        
+        Args:
+            area_idx: Índice(s) da área (ver indice_area), escalar ou array
+            acertos: Array de acertos (broadcast com area_idx)
+        
+        Returns:
+            Array (..., 3) com tri_min, tri_med, tri_max (ordem de COLUNAS_TRI)
+        """
+        area_idx = np.asarray(area_idx)
+        acertos = np.asarray(acertos)
+        
+        # Acima do máximo da área: usar valor máximo disponível (como em obter)
+        acertos = np.minimum(acertos, self.max_acertos[area_idx])
+        if np.any(acertos < 0):
+            raise KeyError(f"Acertos fora da tabela: {int(acertos.min())}")
+        
+        valores = self.valores[area_idx, acertos]
+        if np.isnan(valores[..., 0]).any():
+            raise KeyError("Acertos sem linha na tabela de referência")
+        return valores
+    
     def validar(self) -> bool:
         """Valida integridade da tabela."""
         for area in self.lookup:
@@ -104,6 +226,121 @@ class TabelaReferenciaTRI:
         return True
 
 
+# Tabelas agregadas por seleção de edições mantidas em memória (por worker)
+CACHE_TABELAS_ANOS = 32
+
+
+class CuboTRIAnual:
+    """
+    Tabelas TRI por edição do ENEM, compiladas por compilar_tabela_tri.py a
+    partir da tabela bruta, em array (ano, área, acertos, coluna).
+    Células sem dado naquela edição ficam NaN.
+    
+    tabela(pesos) agrega as edições escolhidas numa TabelaReferenciaTRI
+    (média ponderada, ignorando lacunas), memorizada por combinação de pesos.
+    """
+    
+    def __init__(self, path: str, exigir_checksum: bool = True):
+        """
+        Args:
+            path: 'tri_cubo_anual.npz' (conferido contra '<path>.sha256')
+            exigir_checksum: False aceita um arquivo sem '<path>.sha256'
+        """
+        self.path = path
+        self.checksum = verificar_checksum(path, exigir_checksum)
+        with np.load(path, allow_pickle=False) as dados:
+            self.anos = [int(ano) for ano in dados['anos']]
+            self.areas = [str(area) for area in dados['areas']]
+            self.cubo = dados['cubo']
+        
+        # Fallback das células que nenhuma edição escolhida tem
+        self._media_todas = self._media(self.cubo, [1.0] * len(self.anos))
+        self.tabela = lru_cache(maxsize=CACHE_TABELAS_ANOS)(self._agregar)
+    
+    def pesos(self, selecao) -> Tuple[Tuple[int, float], ...]:
+        """
+        Normaliza a seleção de edições da requisição em ((ano, peso), ...) ordenado.
+        
+        Formatos aceitos:
+            [2019, 2021, 2023]              edições com peso igual
+            {"ultimas": 5}                  as N edições mais recentes
+            {"de": 2018, "ate": 2023}       intervalo de anos (inclusivo)
+            {"pesos": {"2023": 2, ...}}     peso por edição
+        
+        Raises:
+            ValueError: formato inválido, edição sem dados ou peso não positivo/não finito
+        """
+        if isinstance(selecao, list):
+            pesos = {int(ano): 1.0 for ano in selecao}
+        elif isinstance(selecao, dict) and 'ultimas' in selecao:
+            n = int(selecao['ultimas'])
+            if n < 1:
+                raise ValueError(f"'ultimas' deve ser >= 1 (recebido {n})")
+            pesos = {ano: 1.0 for ano in self.anos[-n:]}
+        elif isinstance(selecao, dict) and ('de' in selecao or 'ate' in selecao):
+            de = int(selecao.get('de', self.anos[0]))
+            ate = int(selecao.get('ate', self.anos[-1]))
+            pesos = {ano: 1.0 for ano in self.anos if de <= ano <= ate}
+        elif isinstance(selecao, dict) and isinstance(selecao.get('pesos'), dict):
+            pesos = {int(ano): float(peso) for ano, peso in selecao['pesos'].items()}
+        else:
+            raise ValueError(
+                f"Seleção de anos inválida: {selecao}. Use uma lista de anos, "
+                "{'ultimas': N}, {'de': ano, 'ate': ano} ou {'pesos': {ano: peso}}"
+            )
+        
+        if not pesos:
+            raise ValueError(f"Nenhuma edição selecionada. Disponíveis: {self.anos}")
+        sem_dados = sorted(ano for ano in pesos if ano not in self.anos)
+        if sem_dados:
+            raise ValueError(f"Edições sem dados: {sem_dados}. Disponíveis: {self.anos}")
+        if any(not (math.isfinite(peso) and peso > 0) for peso in pesos.values()):
+            raise ValueError(f"Pesos devem ser positivos e finitos: {pesos}")
+        
+        return tuple(sorted(pesos.items()))
+    
+    @staticmethod
+    def _media(fatias: np.ndarray, pesos: list) -> np.ndarray:
+        """Média ponderada (área, acertos, coluna) só entre as edições que têm a célula."""
+        peso = np.array(pesos, dtype=float)[:, None, None, None]
+        presente = ~np.isnan(fatias).any(axis=-1, keepdims=True)
+        soma = (np.where(presente, fatias, 0.0) * peso).sum(axis=0)
+        peso_total = (presente * peso).sum(axis=0)
+        return soma / np.where(peso_total > 0, peso_total, np.nan)
+    
+    def _agregar(self, pesos: Tuple[Tuple[int, float], ...]) -> TabelaReferenciaTRI:
+        """
+        Tabela agregada das edições (chamar via self.tabela, que memoriza).
+        
+        Lacunas da tabela bruta:
+        - células ausentes numa edição ficam fora da média (como na tabela oficial)
+        - se nenhuma edição escolhida tem a célula (ex.: 2023 sem 0 acertos), usa
+          a média de todas as edições
+        - tri_med não pode cair com mais acertos: vira o máximo acumulado (a tabela
+          bruta tem quedas pontuais, ex.: LC 43 acertos em 2016)
+        """
+        fatias = self.cubo[[self.anos.index(ano) for ano, _ in pesos]]
+        selecionado = self._media(fatias, [peso for _, peso in pesos])
+        media = np.where(np.isnan(selecionado), self._media_todas, selecionado)
+        med = COLUNAS_TRI.index('tri_med')
+        media[..., med] = np.fmax.accumulate(media[..., med], axis=1)
+        
+        lookup = {}
+        for i, area in enumerate(self.areas):
+            lookup[area] = {
+                acertos: {col: round(float(valor), 1) for col, valor in zip(COLUNAS_TRI, linha)}
+                for acertos, linha in enumerate(media[i])
+                if not np.isnan(linha[0])
+            }
+        
+        tabela = TabelaReferenciaTRI.de_lookup(lookup)
+        try:
+            tabela.validar()
+        except AssertionError as e:
+            raise ValueError(f"Tabela das edições {[ano for ano, _ in pesos]} inválida: {e}")
+        return tabela
+
+
 # ════════════════════════════════════════════════════════════════════════════════
 # 2. ANÁLISE DE COERÊNCIA (mantém coerência pedagógica)
 # ════════════════════════════════════════════════════════════════════════════════
@@ -216,6 +453,47 @@ class AlunoCoherenceAnalyzer:
             taxa_dificil=taxa_d,
             taxa_muito_dificil=taxa_md
         )
+    
+    @staticmethod
+    def analisar_lote(acertos_por_dificuldade: np.ndarray, peso_dificuldade: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Versão vetorizada de analisar() para vários alunos de uma vez.
+        
+        Equivale a analisar() com '_peso_dificuldade' no dict, como monta
+        processar_turma (o total somado inclui o peso).
+        
+        Args:
+            acertos_por_dificuldade: (..., 5) acertos na ordem de DIFICULDADES
+            peso_dificuldade: (...) valor de '_peso_dificuldade'
+        
+        Returns:
+            Dict de arrays (...) com 'coerencia' e as taxas da AnaliseCoerencia
+        """
+        acertos = np.asarray(acertos_por_dificuldade)
+        peso_dificuldade = np.asarray(peso_dificuldade)
+        mf, f, m, d, md = (acertos[..., k] for k in range(5))
+        total = mf + f + m + d + md + peso_dificuldade
+        
+        vazio = total == 0
+        divisor = np.where(vazio, 1.0, total)
+        taxa_mf, taxa_f, taxa_m, taxa_d, taxa_md = (x / divisor for x in (mf, f, m, d, md))
+        
+        comparacoes = ((taxa_mf >= taxa_f).astype(int) + (taxa_f >= taxa_m) +
+                       (taxa_m >= taxa_d) + (taxa_d >= taxa_md))
+        coerencia_base = comparacoes / 4
+        peso_acertos = mf * 1.0 + f * 0.8 + m * 0.5 + d * 0.3 + md * 0.1
+        peso_normalizado = peso_acertos / (divisor * 1.0)
+        coerencia = coerencia_base * 0.3 + peso_normalizado * 0.3 + peso_dificuldade * 0.4
+        
+        # Aluno não respondeu: coerência e taxas zeradas
+        return {
+            'coerencia': np.where(vazio, 0.0, coerencia),
+            'taxa_muito_facil': np.where(vazio, 0.0, taxa_mf),
+            'taxa_facil': np.where(vazio, 0.0, taxa_f),
+            'taxa_media': np.where(vazio, 0.0, taxa_m),
+            'taxa_dificil': np.where(vazio, 0.0, taxa_d),
+            'taxa_muito_dificil': np.where(vazio, 0.0, taxa_md)
+        }
 
 
 # ════════════════════════════════════════════════════════════════════════════════
@@ -371,12 +649,206 @@ class TRICalculator:
             tri_ajustado=tri_ajustado,
             motivo=motivo
         )
+    
+    def calcular_lote(
+        self,
+        areas: list,
+        acertos: np.ndarray,
+        coerencia: Optional[np.ndarray] = None,
+        taxa_muito_dificil: Optional[np.ndarray] = None,
+        taxa_dificil: Optional[np.ndarray] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Versão vetorizada de calcular() para todos os alunos e áreas de uma vez.
+        
+        A relação com outras áreas usa as demais colunas de `acertos`, como em
+        processar_aluno (com as 4 áreas, resultado idêntico ao caminho escalar).
+        
+        Args:
+            areas: Códigos das áreas, na ordem das colunas
+            acertos: (N, A) acertos por aluno e área
+            coerencia, taxa_muito_dificil, taxa_dificil: (N, A) campos da
+                AnaliseCoerencia (None = sem análise de coerência)
+        
+        Returns:
+            Dict de arrays (N, A): tri_baseline, ajuste_coerencia, ajuste_relacao,
+            penalidade, tri_ajustado e as partes usadas no motivo
+            (bonus_coerencia, bonus_dificil, limitado)
+        """
+        acertos = np.asarray(acertos)
+        area_idx = np.array([self.tabela.indice_area(area) for area in areas])
+        valores = self.tabela.obter_lote(area_idx, acertos)
+        tri_min, tri_med, tri_max = valores[..., 0], valores[..., 1], valores[..., 2]
+        zeros = np.zeros(acertos.shape)
+        
+        # [AJUSTE 1] Coerência: bônus acima de 0.5, penalidade abaixo (50% do range)
+        if coerencia is not None:
+            coerencia = np.asarray(coerencia)
+            range_disponivel = tri_max - tri_min
+            coerente = coerencia >= 0.5
+            bonus_coerencia = np.where(coerente, (coerencia - 0.5) * 2 * (range_disponivel * 0.5), 0.0)
+            penalidade = np.where(coerente, 0.0, (0.5 - coerencia) * 2 * (range_disponivel * 0.5))
+            
+            # Bônus por acertar questões difíceis
+            bonus_dificil = np.where(taxa_muito_dificil > 0.3, taxa_muito_dificil * 20.0,
+                                     np.where(taxa_dificil > 0.3, taxa_dificil * 10.0, 0.0))
+            ajuste_coerencia = bonus_coerencia + bonus_dificil
+        else:
+            bonus_coerencia = bonus_dificil = ajuste_coerencia = penalidade = zeros
+        
+        # [AJUSTE 2] Relação com a média das outras áreas (somada na mesma ordem do np.mean)
+        ajuste_relacao = zeros.copy()
+        n_areas = acertos.shape[1]
+        if n_areas > 1:
+            for j in range(n_areas):
+                outras = [k for k in range(n_areas) if k != j]
+                soma = tri_med[:, outras[0]]
+                for k in outras[1:]:
+                    soma = soma + tri_med[:, k]
+                diferenca = tri_med[:, j] - soma / len(outras)
+                ajuste_relacao[:, j] = np.where(diferenca > 50, -5.0, np.where(diferenca < -50, 5.0, 0.0))
+        
+        tri_ajustado = tri_med + ajuste_coerencia + ajuste_relacao - penalidade
+        tri_ajustado = np.maximum(tri_min, np.minimum(tri_max, tri_ajustado))
+        
+        # [CRÍTICO] Teto absoluto do ENEM
+        teto = np.array([TRI_MAXIMA_OFICIAL.get(area, 1000.0) for area in areas])
+        limitado = tri_ajustado > teto
+        tri_ajustado = np.where(limitado, teto, tri_ajustado)
+        
+        # [CRÍTICO] Zero acertos: TRI média oficial sem ajustes
+        zero = acertos == 0
+        return {
+            'tri_baseline': tri_med,
+            'ajuste_coerencia': np.where(zero, 0.0, ajuste_coerencia),
+            'ajuste_relacao': np.where(zero, 0.0, ajuste_relacao),
+            'penalidade': np.where(zero, 0.0, penalidade),
+            'tri_ajustado': np.where(zero, tri_med, tri_ajustado),
+            'bonus_coerencia': np.where(zero, 0.0, bonus_coerencia),
+            'bonus_dificil': np.where(zero, 0.0, bonus_dificil),
+            'limitado': limitado & ~zero
+        }
+    
+    @staticmethod
+    def motivo_lote(
+        area: str,
+        acertos: int,
+        tri_baseline: float,
+        coerencia: float,
+        bonus_coerencia: float,
+        penalidade: float,
+        bonus_dificil: float,
+        limitado: bool
+    ) -> str:
+        """Texto de motivo de calcular() a partir de um elemento de calcular_lote."""
+        if acertos == 0:
+            return f'Zero acertos: TRI oficial ({tri_baseline:.1f}) sem ajustes'
+        
+        motivo = f'{area}: {acertos} acertos'
+        if bonus_coerencia > 0.5:
+            motivo += f' | Coerência {coerencia:.2f}: +{bonus_coerencia:.1f}'
+        elif penalidade > 0.5:
+            motivo += f' | Incoerência {coerencia:.2f}: -{penalidade:.1f}'
+        if bonus_dificil > 0:
+            motivo += f' | Bônus difíceis: +{bonus_dificil:.1f}'
+        if limitado:
+            motivo += f' | LIMITADO ao máximo oficial {area}: {TRI_MAXIMA_OFICIAL.get(area, 1000.0)}'
+        return motivo
 
 
 # ════════════════════════════════════════════════════════════════════════════════
 # 4. ORQUESTRADOR PRINCIPAL
 # ════════════════════════════════════════════════════════════════════════════════
 
+# Classes de dificuldade, da mais fácil para a mais difícil
+DIFICULDADES = ['muito_facil', 'facil', 'media', 'dificil', 'muito_dificil']
+
+# % de acerto da turma: >= 0.80 muito_facil, >= 0.60 facil, >= 0.40 media,
+# >= 0.20 dificil, abaixo disso muito_dificil
+LIMIARES_DIFICULDADE = np.array([0.20, 0.40, 0.60, 0.80])
+
+# Questão sem chave no aluno (diferente de resposta em branco '')
+_AUSENTE = object()
+
+
+def classificar_dificuldade(pct: np.ndarray) -> np.ndarray:
+    """Índice em DIFICULDADES para cada % de acerto."""
+    return len(LIMIARES_DIFICULDADE) - np.searchsorted(LIMIARES_DIFICULDADE, pct, side='right')
+
+
+@dataclass
+class MatrizRespostas:
+    """
+    Respostas da turma convertidas uma única vez em matriz (N alunos × Q questões).
+
+    Cada valor distinto de resposta ou gabarito vira um código inteiro
+    (0 = aluno sem a chave qN), então comparar com o gabarito é comparar
+    inteiros em bloco, sem montar chaves nem consultar dicts por questão.
+    """
+    questoes: np.ndarray       # (Q,) números das questões do gabarito, em ordem crescente
+    respostas: np.ndarray      # (N, Q) códigos das respostas
+    gabarito: np.ndarray       # (Q,) código da alternativa correta
+    gabarito_area: np.ndarray  # (Q,) código de gabarito.get(str(q)) (contagem por área)
+    valida: np.ndarray         # (códigos,) resposta preenchida e diferente de 'X'
+
+    @classmethod
+    def montar(cls, alunos: list, gabarito: dict) -> 'MatrizRespostas':
+        corretas = {int(q_num_str): resposta for q_num_str, resposta in gabarito.items()}
+        questoes = sorted(corretas)
+        chaves = [f'q{q}' for q in questoes]
+
+        valores = []
+        if chaves:
+            ler = itemgetter(*chaves) if len(chaves) > 1 else (lambda aluno: (aluno[chaves[0]],))
+            for aluno in alunos:
+                try:
+                    valores.extend(ler(aluno))
+                except KeyError:
+                    valores.extend([aluno.get(chave, _AUSENTE) for chave in chaves])
+
+        # A contagem por área compara com gabarito.get(str(q)), que pode diferir
+        # da chave original ('01' -> None)
+        gabarito_area = [gabarito.get(str(q)) for q in questoes]
+
+        distintos = set(valores)
+        distintos.update(corretas.values())
+        distintos.update(gabarito_area)
+        distintos.discard(_AUSENTE)
+        codigos = {_AUSENTE: 0}
+        for valor in distintos:
+            codigos[valor] = len(codigos)
+
+        dtype = np.uint8 if len(codigos) <= 256 else np.uint16
+        respostas = np.fromiter(map(codigos.__getitem__, valores), dtype=dtype, count=len(valores))
+
+        valida = np.zeros(len(codigos), dtype=bool)
+        for valor, codigo in codigos.items():
+            if codigo:
+                valida[codigo] = bool(valor and valor != 'X')
+
+        return cls(
+            questoes=np.array(questoes, dtype=np.int64),
+            respostas=respostas.reshape(len(alunos), len(questoes)),
+            gabarito=np.array([codigos[corretas[q]] for q in questoes], dtype=dtype),
+            gabarito_area=np.array([codigos[v] for v in gabarito_area], dtype=dtype),
+            valida=valida
+        )
+
+    def taxa_acerto(self) -> np.ndarray:
+        """% de acerto de cada questão sobre TODOS os alunos (em branco ou X = erro)."""
+        acertos = ((self.respostas == self.gabarito) & self.valida[self.respostas]).sum(axis=0)
+        total = len(self.respostas)
+        return acertos / total if total > 0 else np.zeros(len(self.questoes))
+
+    def respondidas(self) -> np.ndarray:
+        """(N, Q) aluno tem a chave da questão."""
+        return self.respostas != 0
+
+    def acertos(self) -> np.ndarray:
+        """(N, Q) acertos usados na contagem por área."""
+        return self.respondidas() & (self.respostas == self.gabarito_area)
+
+
 class TRIProcessadorV2:
     """
     Processador completo de TRI V2 para um aluno.
@@ -533,50 +1005,13 @@ class TRIProcessadorV2:
         # ═══════════════════════════════════════════════════════════════════════════
         print("\n📊 [TRI V2] PASSO 1: Calculando dificuldade das questões...")
         
-        # Estrutura: {questao_num: {'acertos': N, 'total': N, 'pct': 0.XX}}
-        questoes_stats = {}
-        
-        for q_num_str in gabarito.keys():
-            q_num = int(q_num_str)
-            acertos = 0
-            total = len(alunos)  # TODOS os alunos contam no total (não só os que responderam)
-            
-            for aluno in alunos:
-                q_key = f'q{q_num}'
-                resposta = aluno.get(q_key, '')
-                # Acertou se: (1) respondeu, (2) resposta != X, (3) resposta == gabarito
-                if resposta and resposta != 'X' and resposta == gabarito[q_num_str]:
-                    acertos += 1
-            
-            # % de acerto considera TODOS os alunos (incluindo quem não respondeu = errou)
-            pct = acertos / total if total > 0 else 0.0
-            questoes_stats[q_num] = {
-                'acertos': acertos,
-                'total': total,
-                'pct': pct
-            }
-        
-        # Classificar questões por dificuldade
-        def classificar_dificuldade(pct):
-            if pct >= 0.80:
-                return 'muito_facil'
-            elif pct >= 0.60:
-                return 'facil'
-            elif pct >= 0.40:
-                return 'media'
-            elif pct >= 0.20:
-                return 'dificil'
-            else:
-                return 'muito_dificil'
-        
-        # Atribuir classificação
-        for q_num, stats in questoes_stats.items():
-            stats['dificuldade'] = classificar_dificuldade(stats['pct'])
+        # Turma convertida uma vez em matriz N × Q: os passos abaixo são operações em bloco
+        matriz = MatrizRespostas.montar(alunos, gabarito)
+        pct = matriz.taxa_acerto()
+        dificuldade = classificar_dificuldade(pct)
         
         # Log: distribuição de dificuldade
-        dif_counts = {'muito_facil': 0, 'facil': 0, 'media': 0, 'dificil': 0, 'muito_dificil': 0}
-        for stats in questoes_stats.values():
-            dif_counts[stats['dificuldade']] += 1
+        dif_counts = {dif: int(np.count_nonzero(dificuldade == k)) for k, dif in enumerate(DIFICULDADES)}
         print(f"📊 [TRI V2] Distribuição de dificuldade: {dif_counts}")
         
         # ═══════════════════════════════════════════════════════════════════════════
@@ -584,97 +1019,112 @@ class TRIProcessadorV2:
         # ═══════════════════════════════════════════════════════════════════════════
         print("\n📊 [TRI V2] PASSO 2: Processando alunos com coerência pedagógica...")
         
-        for aluno_idx, aluno in enumerate(alunos):
-            nome = aluno.get('nome', f'Aluno_{aluno_idx}')
+        acertou = matriz.acertos()
+        respondeu = matriz.respondidas()
+        # (Q, 5) questão -> classe de dificuldade
+        classes = (dificuldade[:, None] == np.arange(len(DIFICULDADES))).astype(np.int32)
+        
+        # Por área: acertos, acertos por dificuldade, total respondido por dificuldade
+        # (só para o log) e _peso_dificuldade
+        por_area = {}
+        for area_code, (start, end) in normalized_areas.items():
+            colunas = (matriz.questoes >= start) & (matriz.questoes <= end)
+            acertou_area = acertou[:, colunas]
+            acertos_area = acertou_area.sum(axis=1)
             
-            # Contar acertos por área E por dificuldade
-            acertos_por_area = {'LC': 0, 'CH': 0, 'CN': 0, 'MT': 0}
+            # DIFERENCIADOR: Peso baseado na DIFICULDADE REAL das questões acertadas
+            # Dificuldade = % de acerto da TURMA (não posição)
+            # Quem acerta questões DIFÍCEIS (baixa % acerto) = peso MAIOR (excepcional)
+            # Quem acerta questões FÁCEIS (alta % acerto) = peso menor (esperado)
+            # Soma acumulada em ordem de questão: mesmo resultado da soma um a um
+            if acertou_area.shape[1]:
+                soma = np.cumsum(np.where(acertou_area, 1.0 - pct[colunas], 0.0), axis=1)[:, -1]
+            else:
+                soma = np.zeros(len(alunos))
+            peso = np.where(acertos_area > 0, soma / np.maximum(acertos_area, 1), 0.5)
             
-            # Estrutura para coerência: {area: {dificuldade: {'acertos': N, 'total': N}}}
-            coerencia_por_area = {
-                area: {
-                    'muito_facil': {'acertos': 0, 'total': 0},
-                    'facil': {'acertos': 0, 'total': 0},
-                    'media': {'acertos': 0, 'total': 0},
-                    'dificil': {'acertos': 0, 'total': 0},
-                    'muito_dificil': {'acertos': 0, 'total': 0}
-                }
-                for area in normalized_areas.keys()
+            por_area[area_code] = {
+                'acertos': acertos_area,
+                'por_dificuldade': acertou_area.astype(np.int32) @ classes[colunas],
+                'total_por_dificuldade': (respondeu[:3, colunas].astype(np.int32) @ classes[colunas]).tolist(),
+                'peso_dificuldade': peso
             }
+        
+        # TRI de todos os alunos e áreas de uma vez (mesmo resultado de processar_aluno)
+        areas = ['LC', 'CH', 'CN', 'MT']
+        acertos = np.zeros((len(alunos), len(areas)), dtype=np.int64)
+        analise = {campo: np.zeros(acertos.shape) for campo in ('coerencia', 'taxa_muito_dificil', 'taxa_dificil')}
+        for j, area_code in enumerate(areas):
+            if area_code in por_area:
+                dados = por_area[area_code]
+                acertos[:, j] = dados['acertos']
+                analise_area = AlunoCoherenceAnalyzer.analisar_lote(dados['por_dificuldade'], dados['peso_dificuldade'])
+                for campo in analise:
+                    analise[campo][:, j] = analise_area[campo]
+        
+        lote = self.calculator.calcular_lote(areas, acertos, **analise)
+        tris = np.minimum(lote['tri_ajustado'], [TRI_MAXIMA_OFICIAL.get(area, 1000.0) for area in areas])
+        # Média das áreas somada em ordem, como np.mean
+        tri_geral = np.round((((tris[:, 0] + tris[:, 1]) + tris[:, 2]) + tris[:, 3]) / 4, 1)
+        
+        # Por área, uma tupla por aluno com floats Python (mesmos tipos do caminho escalar)
+        colunas = dict(lote, coerencia=analise['coerencia'])
+        campos = ('tri_baseline', 'ajuste_coerencia', 'ajuste_relacao', 'penalidade', 'tri_ajustado',
+                  'coerencia', 'bonus_coerencia', 'bonus_dificil', 'limitado')
+        linhas_area = [list(zip(*(colunas[campo][:, j].tolist() for campo in campos))) for j in range(len(areas))]
+        tris_lista = tris.tolist()
+        acertos_lista = acertos.tolist()
+        
+        for aluno_idx, aluno in enumerate(alunos):
+            nome = aluno.get('nome', f'Aluno_{aluno_idx}')
+            acertos_aluno = acertos_lista[aluno_idx]
+            tris_aluno = tris_lista[aluno_idx]
             
-            # Processar cada área + criar hash das questões acertadas
-            questoes_acertadas_por_area = {area: [] for area in normalized_areas.keys()}
-            
-            for area_code, (start, end) in normalized_areas.items():
-                for i in range(start, end + 1):
-                    q_key = f'q{i}'
-                    if i in questoes_stats and q_key in aluno:
-                        dif = questoes_stats[i]['dificuldade']
-                        coerencia_por_area[area_code][dif]['total'] += 1
-                        
-                        if aluno.get(q_key) == gabarito.get(str(i)):
-                            acertos_por_area[area_code] += 1
-                            coerencia_por_area[area_code][dif]['acertos'] += 1
-                            questoes_acertadas_por_area[area_code].append(i)
-            
-            # Converter coerência para formato esperado pelo processar_aluno
-            respostas_por_dificuldade = {}
-            for area_code in normalized_areas.keys():
-                respostas_por_dificuldade[area_code] = {}
-                for dif in ['muito_facil', 'facil', 'media', 'dificil', 'muito_dificil']:
-                    # Usar número de acertos por dificuldade
-                    respostas_por_dificuldade[area_code][dif] = coerencia_por_area[area_code][dif]['acertos']
-                
-                # DIFERENCIADOR: Peso baseado na DIFICULDADE REAL das questões acertadas
-                # Dificuldade = % de acerto da TURMA (não posição)
-                # Quem acerta questões DIFÍCEIS (baixa % acerto) = peso MAIOR (excepcional)
-                # Quem acerta questões FÁCEIS (alta % acerto) = peso menor (esperado)
-                questoes = questoes_acertadas_por_area.get(area_code, [])
-                if questoes:
-                    # Calcular dificuldade média das questões acertadas
-                    # pct baixo = difícil, pct alto = fácil
-                    dificuldade_media = 0.0
-                    for q in questoes:
-                        if q in questoes_stats:
-                            pct_acerto = questoes_stats[q]['pct']
-                            # Inverter: questão com % baixo = valor alto (difícil)
-                            dificuldade_media += (1.0 - pct_acerto)
-                    dificuldade_media /= len(questoes)
-                    
-                    # Peso: quem acerta mais difíceis = coerência MAIOR
-                    respostas_por_dificuldade[area_code]['_peso_dificuldade'] = dificuldade_media
-                else:
-                    respostas_por_dificuldade[area_code]['_peso_dificuldade'] = 0.5
-            
-            # Processar aluno COM coerência
-            resultado_aluno = self.processar_aluno(
-                lc_acertos=acertos_por_area.get('LC', 0),
-                ch_acertos=acertos_por_area.get('CH', 0),
-                cn_acertos=acertos_por_area.get('CN', 0),
-                mt_acertos=acertos_por_area.get('MT', 0),
-                respostas_por_dificuldade=respostas_por_dificuldade
-            )
+            detalhes = {}
+            for j, area_code in enumerate(areas):
+                (baseline, ajuste_coerencia, ajuste_relacao, penalidade, tri_ajustado,
+                 coerencia, bonus_coerencia, bonus_dificil, limitado) = linhas_area[j][aluno_idx]
+                detalhes[area_code] = {
+                    'acertos': acertos_aluno[j],
+                    'baseline': baseline,
+                    'ajustes': {
+                        'coerencia': ajuste_coerencia,
+                        'relacao': ajuste_relacao,
+                        'penalidade': penalidade
+                    },
+                    'tri_ajustado': tri_ajustado,
+                    'motivo': TRICalculator.motivo_lote(area_code, acertos_aluno[j], baseline, coerencia,
+                                                        bonus_coerencia, penalidade, bonus_dificil, limitado)
+                }
             
-            # Adicionar metadados
-            resultado_aluno['nome'] = nome
-            resultado_aluno['lc_acertos'] = acertos_por_area.get('LC', 0)
-            resultado_aluno['ch_acertos'] = acertos_por_area.get('CH', 0)
-            resultado_aluno['cn_acertos'] = acertos_por_area.get('CN', 0)
-            resultado_aluno['mt_acertos'] = acertos_por_area.get('MT', 0)
+            resultado_aluno = {
+                'tct': round((sum(acertos_aluno) / 90.0) * 4.0, 2),
+                'tri_geral': tri_geral[aluno_idx],
+                'tri_lc': round(tris_aluno[0], 1),
+                'tri_ch': round(tris_aluno[1], 1),
+                'tri_cn': round(tris_aluno[2], 1),
+                'tri_mt': round(tris_aluno[3], 1),
+                'detalhes': detalhes,
+                'nome': nome,
+                'lc_acertos': acertos_aluno[0],
+                'ch_acertos': acertos_aluno[1],
+                'cn_acertos': acertos_aluno[2],
+                'mt_acertos': acertos_aluno[3]
+            }
             
             # Log detalhado para primeiros alunos
             if aluno_idx < 3:
                 print(f"\n👤 [TRI V2] Aluno {aluno_idx + 1}: {nome}")
                 for area_code in normalized_areas.keys():
-                    acertos = acertos_por_area.get(area_code, 0)
+                    acertos_area = acertos_aluno[areas.index(area_code)]
                     tri_key = f'tri_{area_code.lower()}'
                     tri_val = resultado_aluno.get(tri_key, 'N/A')
                     
                     # Mostrar distribuição de acertos por dificuldade
                     dist = []
-                    for dif in ['muito_facil', 'facil', 'media', 'dificil', 'muito_dificil']:
-                        ac = coerencia_por_area[area_code][dif]['acertos']
-                        tot = coerencia_por_area[area_code][dif]['total']
+                    for k, dif in enumerate(DIFICULDADES):
+                        ac = por_area[area_code]['por_dificuldade'][aluno_idx][k]
+                        tot = por_area[area_code]['total_por_dificuldade'][aluno_idx][k]
                         if tot > 0:
                             dist.append(f"{dif[:2]}:{ac}/{tot}")
                     
@@ -682,7 +1132,7 @@ class TRIProcessadorV2:
                     coer = ajustes.get('coerencia', 0)
                     pen = ajustes.get('penalidade', 0)
                     
-                    print(f"   {area_code}: {acertos} acertos -> TRI {tri_val} (coer:{coer:+.1f}, pen:{pen:.1f})")
+                    print(f"   {area_code}: {acertos_area} acertos -> TRI {tri_val} (coer:{coer:+.1f}, pen:{pen:.1f})")
                     print(f"      Distribuição: {', '.join(dist)}")
             
             resultados.append(resultado_aluno)
@@ -730,7 +1180,7 @@ def teste_completo():
     print("="*120)
     
     # Carregar tabela
-    tabela = TabelaReferenciaTRI('/mnt/user-data/outputs/tri_tabela_referencia_oficial.csv')
+    tabela = TabelaReferenciaTRI(str(Path(__file__).parent / 'tri_tabela_referencia_oficial.json'))
     assert tabela.validar(), "Tabela inválida!"
     print("✓ Tabela de referência carregada e validada")
     